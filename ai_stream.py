@@ -0,0 +1,27 @@
+"""Streaming helpers for AI responses"""
+import time
+
+
+def stream_response(backend, prompt, on_chunk, on_first_token=None, timeout=None, history=None):
+    """Stream a completion, calling on_chunk(text) for every piece
+
+    timeout (seconds) is the request timeout, retries included. With a
+    history of (role, text) turns, prompt is the next message of that chat.
+    Returns (text, first_token_seconds, total_seconds).
+    """
+    started = time.perf_counter()
+    first_token = None
+    parts = []
+    if history is None:
+        pieces = backend.stream(prompt, timeout=timeout)
+    else:
+        pieces = backend.chat_stream(history, prompt, timeout=timeout)
+    for text in pieces:
+        if first_token is None:
+            first_token = time.perf_counter() - started
+            if on_first_token:
+                on_first_token(first_token)
+        parts.append(text)
+        on_chunk(text)
+    return ''.join(parts), first_token, time.perf_counter() - started
+
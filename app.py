@@ -1,28 +1,133 @@
+import time
+
+# Taken before the other imports so --startup-time includes them
+STARTED = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox, filedialog
-import google.generativeai as genai
-import threading
+from tkinter import ttk, scrolledtext, messagebox, filedialog, simpledialog
+import argparse
+import builtins
+import importlib
+import importlib.util
+import linecache
 import re
 import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
+from ai_stream import stream_response
+from backends import FakeBackend, GeminiBackend
+from chat import ChatSession, ChatStore
+from completion import CompletionPopup, PREFIX, WordIndex
+from codeblocks import CodeStream, FenceParser, apply_edits, diff_edits, parse_blocks, pick_code
+from context import CodeIndex, build_context, estimate_tokens, project_context
+from diagnostics import DiagnosticsWorker, summarize
+from documents import Document, DocumentEditor, DocumentManager
+from gutter import LineNumberGutter, MARKER_COLORS
+from highlighter import IncrementalHighlighter
+from jobs import AIJobManager, JobCancelled
+from loader import FileLoader, LARGE_FILE_BYTES
+from outputlog import OutputLog, TranscriptStore
+from profiling import InstrumentedBackend, LoopLagMonitor, ProfileCapture, StartupTimer, Timings
+from prompts import CODE_ACTIONS, PROBLEMS_NOTE
+from response_cache import ResponseCache
+from saver import RecoveryJournal, SaveWorker
+from scheduler import ChangeScheduler, FRAME_MS
+from search import BufferMatches, MAX_PROJECT_HITS, ProjectSearch, compile_pattern, plan_replace_all
+from symbols import ProjectIndex
+from textwatch import TextWatcher
+from uidispatch import UIDispatcher
+
+# How often unsaved changes are written to the recovery journal
+AUTOSAVE_MS = 30 * 1000
+
+# How often the project index checks for changed files
+INDEX_POLL_MS = 10 * 1000
+
+# Most problems underlined at once, the gutter and F8 still see all of them
+MAX_PAINTED_DIAGNOSTICS = 500
+
+# Heavy modules imported on a background thread once the window is up, so
+# the first AI request does not have to wait for them
+BACKGROUND_IMPORTS = ('google.generativeai',)
+
 class AICodeEditor:
-    def __init__(self):
+    def __init__(self, startup=None):
+        # Cold start milestones, only collected for --startup-time
+        self.startup = startup
+        self._preload_thread = None
         self.root = tk.Tk()
         self.root.title("AI Code Editor - Gemini Flash 2.0")
         self.root.geometry("1200x800")
         self.root.configure(bg='#2b2b2b')
         
-        # Initialize Gemini
-        self.model = None
+        # Hot paths report their latency to the performance overlay; wrapped
+        # before anything (bindings, scheduler jobs) takes a reference to them
+        self.timings = Timings()
+        for name in ('on_text_change', 'highlight_syntax', 'update_line_numbers',
+                     'open_path', 'write_file', '_pump_file_load', 'update_completions'):
+            setattr(self, name, self.timings.wrap(name, getattr(self, name)))
+        self.profile = ProfileCapture()
+        self._perf_refresh = None
+        
+        # AI backend, one client reused for every request
+        self.backend = None
         self.api_key = ""
         
-        # Current file path
-        self.current_file = None
+        # Responses to explain/fix/optimize, reused while the code is unchanged
+        self.response_cache = ResponseCache()
+        self.bypass_cache = tk.BooleanVar(value=False)
+        
+        # (document, code, marks) of the last Fix/Optimize answer, until it is applied
+        self.pending_apply = None
+        # Numbers the marks of each request (apply_start_1, ai_insert_2...)
+        self._mark_serial = 0
+        
+        # Token budget for the code sent along with a prompt
+        self.context_budget = 2000
+        
+        # Ask AI conversations, saved per file to carry on after a restart
+        try:
+            self.chat_store = ChatStore()
+        except OSError:
+            self.chat_store = None
+        
+        # Symbols of the project folder, once one is opened
+        self.project_index = None
+        
+        # Find/replace: matching runs on the search thread over a snapshot
+        self.search_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search')
+        self.search_matches = None
+        self._search_generation = 0
+        self.find_visible = False
+        self.project_search = None
+        self.project_hits = []
+        
+        # Large file being read in the background, and the tab it fills
+        self.file_loader = None
+        self.loading_document = None
+        
+        # Worker threads hand all widget updates to the main loop through this
+        self.ui = UIDispatcher(self.root)
+        self.ui.start()
+        LoopLagMonitor(self.root, self.timings).start()
+        
+        # AI requests run on a small worker pool instead of a thread each
+        self.jobs = AIJobManager(max_workers=2, timeout=120, on_change=self._jobs_changed)
+        self._job_refresh_pending = False
+        # Jobs behind the rows of the job list, in order
+        self.shown_jobs = []
         
         # Setup UI
         self.setup_ui()
         
+        # Offline backend for trying the AI features without a key
+        if os.environ.get('AI_EDITOR_FAKE_MODEL'):
+            self.use_backend(FakeBackend())
+            self.status_label.config(text="Ready | Offline fake model")
+        
         # Syntax highlighting colors
         self.syntax_colors = {
             'keyword': '#569cd6',
@@ -41,6 +146,39 @@ class AICodeEditor:
             'break', 'continue', 'global', 'nonlocal', 'async', 'await'
         ]
         
+        # Completion candidates that need not appear in the buffer
+        self.completion_seed = self.keywords + [name for name in dir(builtins) if not name.startswith('_')]
+        
+        self._repaint_pending = False
+        
+        # Gutter updates once per frame, highlighting waits for typing to pause
+        self.change_scheduler = ChangeScheduler(self.root)
+        self.change_scheduler.add_job('gutter', self.update_line_numbers, delay=FRAME_MS)
+        self.change_scheduler.add_job('highlight', self.highlight_syntax, delay=60, max_wait=250)
+        self.change_scheduler.add_job('search', self.refresh_search, delay=150, max_wait=500)
+        
+        # Syntax and lint checks run in a worker process once typing pauses
+        self.diagnostics = DiagnosticsWorker()
+        self._diagnostics_requested = None
+        self.change_scheduler.add_job('diagnostics', self.run_diagnostics, delay=500, max_wait=5000)
+        
+        # Saves run in the background; each document counts its edits so a
+        # buffer is only written (or journaled) when it actually changed
+        self.saver = SaveWorker()
+        self.journal = RecoveryJournal()
+        
+        # Open documents, only the recently used ones keep a Text widget
+        self.document = None
+        self.documents = DocumentManager(self._create_editor, self._release_editor)
+        self.new_file()
+        
+        self.root.after(AUTOSAVE_MS, self.autosave)
+        self.root.after_idle(self._window_ready)
+        if self.startup is None:
+            self.root.after_idle(self.offer_recovery)
+        else:
+            self.startup.mark('window built')
+        
     def setup_ui(self):
         # Main menu
         menubar = tk.Menu(self.root)
@@ -51,11 +189,40 @@ class AICodeEditor:
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="New", command=self.new_file, accelerator="Ctrl+N")
         file_menu.add_command(label="Open", command=self.open_file, accelerator="Ctrl+O")
+        file_menu.add_command(label="Open Folder...", command=self.open_project)
         file_menu.add_command(label="Save", command=self.save_file, accelerator="Ctrl+S")
         file_menu.add_command(label="Save As", command=self.save_as_file)
+        file_menu.add_command(label="Close", command=self.close_file, accelerator="Ctrl+W")
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
         
+        # Edit menu
+        edit_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Edit", menu=edit_menu)
+        edit_menu.add_command(label="Find", command=self.show_find_bar, accelerator="Ctrl+F")
+        edit_menu.add_command(label="Replace", command=lambda: self.show_find_bar(replace=True), accelerator="Ctrl+H")
+        edit_menu.add_command(label="Find Next", command=self.find_next, accelerator="F3")
+        edit_menu.add_command(label="Find Previous", command=lambda: self.find_next(backward=True), accelerator="Shift+F3")
+        edit_menu.add_command(label="Find in Project", command=self.find_in_project)
+        
+        # View menu
+        self.show_perf_overlay = tk.BooleanVar(value=False)
+        self.profiling = tk.BooleanVar(value=False)
+        view_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="View", menu=view_menu)
+        view_menu.add_checkbutton(label="Performance Overlay", variable=self.show_perf_overlay,
+                                  command=self.toggle_perf_overlay, accelerator="Ctrl+Shift+P")
+        view_menu.add_checkbutton(label="Profile Main Thread", variable=self.profiling,
+                                  command=self.toggle_profiling)
+        
+        # Navigate menu
+        navigate_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Navigate", menu=navigate_menu)
+        navigate_menu.add_command(label="Go to Definition", command=self.go_to_definition, accelerator="F12")
+        navigate_menu.add_command(label="Find References", command=self.find_references, accelerator="Shift+F12")
+        navigate_menu.add_command(label="Next Problem", command=self.next_problem, accelerator="F8")
+        navigate_menu.add_command(label="Find Symbol...", command=self.show_symbol_search, accelerator="Ctrl+T")
+        
         # AI menu
         ai_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="AI", menu=ai_menu)
@@ -64,6 +231,12 @@ class AICodeEditor:
         ai_menu.add_command(label="Explain Code", command=self.explain_code)
         ai_menu.add_command(label="Fix Code", command=self.fix_code)
         ai_menu.add_command(label="Optimize Code", command=self.optimize_code)
+        ai_menu.add_command(label="Apply Suggested Code", command=self.apply_ai_code)
+        ai_menu.add_command(label="New Chat", command=self.new_chat)
+        ai_menu.add_separator()
+        ai_menu.add_checkbutton(label="Bypass Response Cache", variable=self.bypass_cache)
+        ai_menu.add_command(label="Clear Response Cache", command=self.clear_response_cache)
+        ai_menu.add_command(label="Context Budget...", command=self.set_context_budget)
         
         # Main container
         main_frame = ttk.Frame(self.root)
@@ -87,6 +260,9 @@ class AICodeEditor:
         self.status_label = ttk.Label(toolbar, text="Ready | No API key configured")
         self.status_label.pack(side=tk.RIGHT, padx=10)
         
+        # Shown only while a large file is loading
+        self.load_progress = ttk.Progressbar(toolbar, length=120, maximum=1.0)
+        
         # Create paned window for split view
         paned = ttk.PanedWindow(main_frame, orient=tk.HORIZONTAL)
         paned.pack(fill=tk.BOTH, expand=True)
@@ -95,37 +271,79 @@ class AICodeEditor:
         left_frame = ttk.Frame(paned)
         paned.add(left_frame, weight=2)
         
+        # One tab per open document; the notebook is only the tab strip,
+        # the active document's Text widget is packed below it
+        self.tab_bar = ttk.Notebook(left_frame)
+        self.tab_bar.pack(fill=tk.X)
+        self.tab_bar.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        
         # Code editor with line numbers
-        editor_frame = ttk.Frame(left_frame)
-        editor_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # Line numbers
-        self.line_numbers = tk.Text(
-            editor_frame,
-            width=4,
-            bg='#3c3c3c',
-            fg='#858585',
+        self.editor_frame = ttk.Frame(left_frame)
+        self.editor_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Line numbers, drawn only for the visible lines
+        self.line_numbers = LineNumberGutter(
+            self.editor_frame,
+            None,
             font=('Consolas', 10),
-            state=tk.DISABLED,
-            wrap=tk.NONE,
-            relief=tk.FLAT,
-            borderwidth=0
+            fg='#858585',
+            bg='#3c3c3c'
         )
         self.line_numbers.pack(side=tk.LEFT, fill=tk.Y)
         
-        # Code text area
-        self.code_text = scrolledtext.ScrolledText(
-            editor_frame,
-            wrap=tk.NONE,
-            bg='#1e1e1e',
-            fg='#d4d4d4',
-            font=('Consolas', 11),
-            insertbackground='white',
-            selectbackground='#264f78',
-            relief=tk.FLAT,
-            borderwidth=0
+        # Identifier completions under the cursor
+        self.completion = CompletionPopup(self.root, self.accept_completion)
+        
+        # Rolling latencies, drawn over the top right corner of the editor
+        self.perf_overlay = tk.Label(
+            self.editor_frame,
+            font=('Consolas', 9),
+            bg='#252526',
+            fg='#cccccc',
+            justify=tk.LEFT,
+            anchor=tk.NW,
+            padx=6,
+            pady=4
         )
-        self.code_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        # Find/replace bar, shown on demand below the editor
+        self.search_regex = tk.BooleanVar(value=False)
+        self.search_case = tk.BooleanVar(value=False)
+        self.find_bar = ttk.Frame(left_frame)
+        ttk.Label(self.find_bar, text="Find:").grid(row=0, column=0, sticky=tk.W, padx=2)
+        self.find_entry = ttk.Entry(self.find_bar)
+        self.find_entry.grid(row=0, column=1, sticky=tk.EW, padx=2, pady=1)
+        ttk.Label(self.find_bar, text="Replace:").grid(row=1, column=0, sticky=tk.W, padx=2)
+        self.replace_entry = ttk.Entry(self.find_bar)
+        self.replace_entry.grid(row=1, column=1, sticky=tk.EW, padx=2, pady=1)
+        ttk.Checkbutton(self.find_bar, text="Regex", variable=self.search_regex,
+                        command=self.run_buffer_search).grid(row=0, column=2, padx=2)
+        ttk.Checkbutton(self.find_bar, text="Match Case", variable=self.search_case,
+                        command=self.run_buffer_search).grid(row=0, column=3, padx=2)
+        ttk.Button(self.find_bar, text="Next", command=self.find_next).grid(row=0, column=4, padx=2)
+        ttk.Button(self.find_bar, text="Previous",
+                   command=lambda: self.find_next(backward=True)).grid(row=0, column=5, padx=2)
+        ttk.Button(self.find_bar, text="In Project", command=self.find_in_project).grid(row=0, column=6, padx=2)
+        ttk.Button(self.find_bar, text="Replace", command=self.replace_one).grid(row=1, column=4, padx=2)
+        ttk.Button(self.find_bar, text="Replace All", command=self.replace_all).grid(row=1, column=5, padx=2)
+        ttk.Button(self.find_bar, text="Close", command=self.hide_find_bar).grid(row=1, column=6, padx=2)
+        self.find_bar.columnconfigure(1, weight=1)
+        self.find_entry.bind('<KeyRelease>', self.on_find_key)
+        self.find_entry.bind('<Return>', lambda e: self.find_next())
+        self.find_entry.bind('<Shift-Return>', lambda e: self.find_next(backward=True))
+        self.replace_entry.bind('<Return>', lambda e: self.replace_one())
+        self.find_entry.bind('<Escape>', lambda e: self.hide_find_bar())
+        self.replace_entry.bind('<Escape>', lambda e: self.hide_find_bar())
+        
+        # Project search results, filled in as batches finish
+        self.results_frame = ttk.Frame(left_frame)
+        self.search_results = tk.Listbox(self.results_frame, height=8, font=('Consolas', 9), activestyle=tk.NONE)
+        results_scroll = ttk.Scrollbar(self.results_frame, command=self.search_results.yview)
+        self.search_results.configure(yscrollcommand=results_scroll.set)
+        results_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.search_results.pack(fill=tk.BOTH, expand=True)
+        self.search_results.bind('<Double-Button-1>', self.open_search_result)
+        self.search_results.bind('<Return>', self.open_search_result)
         
         # Right frame for AI chat/output
         right_frame = ttk.Frame(paned)
@@ -133,6 +351,10 @@ class AICodeEditor:
         
         ttk.Label(right_frame, text="AI Assistant", font=('Arial', 12, 'bold')).pack(pady=5)
         
+        # Queued and running AI requests
+        self.job_list = tk.Listbox(right_frame, height=3, font=('Arial', 9), activestyle=tk.NONE, exportselection=False)
+        self.job_list.pack(fill=tk.X, padx=5)
+        
         # AI output area
         self.ai_output = scrolledtext.ScrolledText(
             right_frame,
@@ -145,6 +367,13 @@ class AICodeEditor:
         )
         self.ai_output.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
+        # Keeps only the tail in the widget, the whole session goes to disk
+        try:
+            transcript = TranscriptStore()
+        except OSError:
+            transcript = TranscriptStore(os.devnull)
+        self.output_log = OutputLog(self.ai_output, transcript)
+        
         # AI input frame
         input_frame = ttk.Frame(right_frame)
         input_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -164,19 +393,28 @@ class AICodeEditor:
         
         ttk.Button(button_frame, text="Send", command=self.send_ai_query).pack(side=tk.RIGHT, padx=(5, 0))
         ttk.Button(button_frame, text="Clear", command=self.clear_ai_output).pack(side=tk.RIGHT)
+        ttk.Button(button_frame, text="Earlier", command=self.load_earlier_output).pack(side=tk.RIGHT, padx=(0, 5))
+        ttk.Button(button_frame, text="Cancel Job", command=self.cancel_ai_job).pack(side=tk.LEFT)
+        self.apply_button = ttk.Button(button_frame, text="Apply", command=self.apply_ai_code, state=tk.DISABLED)
+        self.apply_button.pack(side=tk.LEFT, padx=(5, 0))
         
         # Bind events
-        self.code_text.bind('<KeyRelease>', self.on_text_change)
-        self.code_text.bind('<Button-1>', self.on_text_change)
         self.ai_input.bind('<Control-Return>', lambda e: self.send_ai_query())
         
         # Keyboard shortcuts
+        self.root.bind('<Control-P>', lambda e: self.toggle_perf_overlay(flip=True))
         self.root.bind('<Control-n>', lambda e: self.new_file())
         self.root.bind('<Control-o>', lambda e: self.open_file())
         self.root.bind('<Control-s>', lambda e: self.save_file())
-        
-        # Initialize line numbers
-        self.update_line_numbers()
+        self.root.bind('<Control-w>', lambda e: self.close_file())
+        self.root.bind('<F12>', lambda e: self.go_to_definition())
+        self.root.bind('<Shift-F12>', lambda e: self.find_references())
+        self.root.bind('<F8>', lambda e: self.next_problem())
+        self.root.bind('<Control-t>', lambda e: self.show_symbol_search())
+        self.root.bind('<Control-f>', lambda e: self.show_find_bar())
+        self.root.bind('<Control-h>', lambda e: self.show_find_bar(replace=True))
+        self.root.bind('<F3>', lambda e: self.find_next())
+        self.root.bind('<Shift-F3>', lambda e: self.find_next(backward=True))
         
     def setup_api_key(self):
         """Setup Gemini API key"""
@@ -198,12 +436,16 @@ class AICodeEditor:
             key = api_entry.get().strip()
             if key:
                 try:
-                    genai.configure(api_key=key)
-                    self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+                    self.use_backend(GeminiBackend(key))
                     self.api_key = key
                     self.status_label.config(text="Ready | API key configured")
                     messagebox.showinfo("Success", "API key configured successfully!")
                     dialog.destroy()
+                except ImportError:
+                    messagebox.showerror(
+                        "Error",
+                        "The Gemini SDK is not installed, run:\npip install google-generativeai"
+                    )
                 except Exception as e:
                     messagebox.showerror("Error", f"Failed to configure API key: {str(e)}")
             else:
@@ -213,71 +455,362 @@ class AICodeEditor:
         
         api_entry.focus()
         
-    def update_line_numbers(self):
-        """Update line numbers"""
-        self.line_numbers.config(state=tk.NORMAL)
-        self.line_numbers.delete(1.0, tk.END)
+    def use_backend(self, backend):
+        """Send AI requests to backend from now on"""
+        backend.on_retry = self._ai_retrying
+        self.backend = InstrumentedBackend(backend, self.timings)
         
-        content = self.code_text.get(1.0, tk.END)
-        lines = content.count('\n')
+    def _ai_retrying(self, attempt, delay, error):
+        """Backend callback (worker thread) before each backoff"""
+        self.set_status(f"AI | {type(error).__name__}, retry {attempt} in {delay:.1f} s")
         
-        line_numbers_string = '\n'.join(str(i) for i in range(1, lines + 1))
-        self.line_numbers.insert(1.0, line_numbers_string)
-        self.line_numbers.config(state=tk.DISABLED)
+    def update_line_numbers(self):
+        """Update line numbers"""
+        self.line_numbers.sync()
         
     def on_text_change(self, event=None):
         """Handle text changes"""
-        self.update_line_numbers()
+        # <<Modified>> only fires when the flag flips, so clear it to hear about the next edit
+        text = event.widget if event is not None else self.code_text
+        if not text.edit_modified():
+            return
+        text.edit_modified(False)
+        self.change_scheduler.notify()
+        
+    def on_code_scroll(self, text, first, last):
+        """Keep the scrollbar in sync and repaint the newly visible lines"""
+        text.vbar.set(first, last)
+        if text is not self.code_text:
+            return
+        self.completion.hide()
+        self.line_numbers.redraw()
+        if not self._repaint_pending:
+            self._repaint_pending = True
+            self.root.after_idle(self._repaint_viewport)
+            
+    def _repaint_viewport(self):
+        """Repaint highlighting once the scroll has settled"""
+        self._repaint_pending = False
         self.highlight_syntax()
+        self.paint_search_hits()
         
     def highlight_syntax(self):
-        """Simple syntax highlighting for Python"""
-        content = self.code_text.get(1.0, tk.END)
-        
-        # Clear existing tags
-        for tag in self.syntax_colors:
-            self.code_text.tag_delete(tag)
-        
-        # Configure tags
-        for tag, color in self.syntax_colors.items():
-            self.code_text.tag_configure(tag, foreground=color)
-        
-        # Highlight keywords
-        for keyword in self.keywords:
-            pattern = r'\b' + re.escape(keyword) + r'\b'
-            for match in re.finditer(pattern, content):
-                start = f"1.0+{match.start()}c"
-                end = f"1.0+{match.end()}c"
-                self.code_text.tag_add('keyword', start, end)
-        
-        # Highlight strings
-        string_pattern = r'(["\'])(?:(?=(\\?))\2.)*?\1'
-        for match in re.finditer(string_pattern, content):
-            start = f"1.0+{match.start()}c"
-            end = f"1.0+{match.end()}c"
-            self.code_text.tag_add('string', start, end)
-        
-        # Highlight comments
-        comment_pattern = r'#.*$'
-        for match in re.finditer(comment_pattern, content, re.MULTILINE):
-            start = f"1.0+{match.start()}c"
-            end = f"1.0+{match.end()}c"
-            self.code_text.tag_add('comment', start, end)
-        
-        # Highlight numbers
-        number_pattern = r'\b\d+\.?\d*\b'
-        for match in re.finditer(number_pattern, content):
-            start = f"1.0+{match.start()}c"
-            end = f"1.0+{match.end()}c"
-            self.code_text.tag_add('number', start, end)
+        """Syntax highlighting for Python, limited to the visible lines"""
+        self.highlighter.paint()
+        
+    def on_completion_key(self, event):
+        """Typing an identifier updates the completion list, other keys close it"""
+        if event.char and ('a' + event.char).isidentifier():
+            self.root.after_idle(self.update_completions)
+        elif event.keysym == 'BackSpace' and self.completion.visible:
+            self.root.after_idle(self.update_completions)
+        elif event.char or event.keysym in ('Left', 'Right', 'Home', 'End', 'Prior', 'Next', 'Delete'):
+            self.completion.hide()
+            
+    def _completion_command(self, command):
+        """Key handler for the list while it is shown, the Text's own binding otherwise"""
+        if not self.completion.visible:
+            return None
+        command()
+        return 'break'
+        
+    def update_completions(self, explicit=False):
+        """Show the words that complete the identifier before the cursor
+        
+        Typing shows the list from the second character on, Ctrl+Space from
+        the first (or with no prefix at all, nothing to offer then).
+        """
+        text = self.code_text
+        match = PREFIX.search(text.get('insert linestart', tk.INSERT))
+        prefix = match.group() if match else ''
+        if not prefix or (len(prefix) < 2 and not explicit):
+            self.completion.hide()
+            return
+        extra = self.project_index.names_starting(prefix) if self.project_index is not None else ()
+        words = self.document.editor.words.complete(prefix, extra=extra)
+        if words:
+            self.completion.show(text, prefix, words)
+        else:
+            self.completion.hide()
             
+    def accept_completion(self, prefix, word):
+        """Complete the identifier before the cursor to word"""
+        text = self.code_text
+        text.insert(tk.INSERT, word[len(prefix):])
+        self.document.editor.words.accept(word)
+        text.focus_set()
+        
+    def run_diagnostics(self):
+        """Check the active buffer in the worker process, unless it was checked as it is"""
+        document = self.document
+        if document is None or document.busy or document.editor is None:
+            return
+        if document.path and not document.path.endswith(('.py', '.pyw')):
+            return
+        revision = document.edit_revision
+        if document.analysis_revision == revision or self._diagnostics_requested == (document, revision):
+            return
+        self._diagnostics_requested = (document, revision)
+        source = self.code_text.get(1.0, 'end-1c')
+        started = time.perf_counter()
+        
+        def done(analysis):
+            self.timings.record('diagnostics', (time.perf_counter() - started) * 1000)
+            self.ui.post(self._diagnostics_done, document, revision, analysis)
+            
+        self.diagnostics.submit(source, done)
+        
+    def _diagnostics_done(self, document, revision, analysis):
+        """Main-thread end of run_diagnostics"""
+        if self._diagnostics_requested == (document, revision):
+            self._diagnostics_requested = None
+        # Results for an older revision would point at the wrong places, and
+        # the scheduler has a check of the newer one coming
+        if analysis is None or document.edit_revision != revision or document not in self.documents.documents:
+            return
+        document.analysis = analysis
+        document.analysis_revision = revision
+        if document.editor is not None:
+            self.paint_diagnostics(document)
+        if document is self.document:
+            self.line_numbers.set_markers(self.diagnostic_markers(document))
+            
+    def paint_diagnostics(self, document):
+        """Underline the problems of a document's last check"""
+        text = document.editor.text
+        for severity in MARKER_COLORS:
+            text.tag_remove(f'diag_{severity}', 1.0, tk.END)
+        if document.analysis is None:
+            return
+        for d in document.analysis.diagnostics[:MAX_PAINTED_DIAGNOSTICS]:
+            start = f'{d.line}.{d.col}'
+            end = f'{d.end_line}.{d.end_col}'
+            if (d.end_line, d.end_col) <= (d.line, d.col):
+                # No extent: the whole line, or one character from the column
+                start, end = (f'{d.line}.0', f'{d.line}.0 lineend') if d.col == 0 else (start, f'{start}+1c')
+            text.tag_add(f'diag_{d.severity}', start, end)
+            
+    def diagnostic_markers(self, document):
+        """line -> severity for the gutter, errors winning over warnings"""
+        markers = {}
+        if document.analysis is not None:
+            for d in document.analysis.diagnostics:
+                if markers.get(d.line) != 'error':
+                    markers[d.line] = d.severity
+        return markers
+        
+    def show_diagnostic_at(self, text, index):
+        """Show the problem under the mouse in the status bar"""
+        analysis = self.document.analysis if self.document else None
+        if analysis is None:
+            return
+        line = int(text.index(index).split('.')[0])
+        for d in analysis.diagnostics:
+            if d.line <= line <= d.end_line:
+                self.status_label.config(text=f"Line {d.line}: {d.message}")
+                break
+                
+    def next_problem(self):
+        """Move the cursor to the next problem after it, wrapping around"""
+        analysis = self.document.analysis
+        if analysis is None or not analysis.diagnostics:
+            self.status_label.config(text="Ready | No problems found")
+            return
+        position = tuple(map(int, self.code_text.index(tk.INSERT).split('.')))
+        target = next((d for d in analysis.diagnostics if (d.line, d.col) > position), analysis.diagnostics[0])
+        self.code_text.mark_set(tk.INSERT, f'{target.line}.{target.col}')
+        self.code_text.see(tk.INSERT)
+        self.code_text.focus_set()
+        self.status_label.config(text=f"Line {target.line}: {target.message}")
+        
+    def problem_region(self):
+        """(first, last, summary) of the statements with problems that fit the
+        context budget, from a check of the buffer as it is; None otherwise"""
+        document = self.document
+        analysis = document.analysis
+        if analysis is None or document.analysis_revision != document.edit_revision or not analysis.diagnostics:
+            return None
+        # The innermost statement (a method rather than its class) around each problem
+        spans = set()
+        for d in analysis.diagnostics:
+            around = [block for block in analysis.blocks if block[0] <= d.line <= block[1]]
+            if around:
+                spans.add(min(around, key=lambda block: block[1] - block[0]))
+        first = last = None
+        for span_first, span_last in sorted(spans):
+            candidate = (span_first if first is None else first, max(span_last, last or 0))
+            code = self.code_text.get(f'{candidate[0]}.0', f'{candidate[1]}.0 lineend')
+            if estimate_tokens(code) > self.context_budget:
+                break
+            first, last = candidate
+        if first is None:
+            return None
+        return first, last, summarize(analysis.diagnostics, first, last)
+        
+    @property
+    def current_file(self):
+        """Path of the active document, None while it is untitled"""
+        return self.document.path if self.document else None
+        
+    def _create_editor(self, document):
+        """Give a document a Text widget, with its highlighter and edit tracking"""
+        text = scrolledtext.ScrolledText(
+            self.editor_frame,
+            wrap=tk.NONE,
+            bg='#1e1e1e',
+            fg='#d4d4d4',
+            font=('Consolas', 11),
+            insertbackground='white',
+            selectbackground='#264f78',
+            relief=tk.FLAT,
+            borderwidth=0,
+            undo=True
+        )
+        text.insert(1.0, document.text)
+        text.edit_reset()
+        text.edit_modified(False)
+        document.undo_revision = document.edit_revision
+        text.mark_set(tk.INSERT, document.cursor)
+        document.text = ''
+        
+        # Incremental highlighting and completion words driven by line-level edit notifications
+        highlighter = IncrementalHighlighter(text, self.syntax_colors, self.keywords)
+        words = WordIndex(text, self.completion_seed, post=self.ui.post, tokenizer=highlighter.tokenizer)
+        watcher = TextWatcher(text)
+        watcher.add_listener(highlighter.on_edit)
+        watcher.add_listener(words.on_edit)
+        watcher.add_listener(lambda *edit: self._count_edit(document))
+        text.configure(yscrollcommand=lambda first, last: self.on_code_scroll(text, first, last))
+        text.bind('<<Modified>>', self.on_text_change)
+        text.tag_configure('search_hit', background='#613214')
+        # Problems found by the local checks, diag_error and diag_warning
+        for severity, color in MARKER_COLORS.items():
+            tag = f'diag_{severity}'
+            text.tag_configure(tag, underline=True)
+            try:
+                text.tag_configure(tag, underlinefg=color)
+            except tk.TclError:
+                # Tk before 8.6.6 underlines in the text color
+                pass
+            text.tag_bind(tag, '<Enter>', lambda e: self.show_diagnostic_at(e.widget, f'@{e.x},{e.y}'))
+        text.tag_raise(tk.SEL)
+        
+        # Text's own bindings for these keys edit or move the cursor, so
+        # handle them on the widget and stop there
+        for sequence, command in (('<Control-f>', self.show_find_bar),
+                                  ('<Control-h>', lambda: self.show_find_bar(replace=True)),
+                                  ('<Control-t>', self.show_symbol_search)):
+            text.bind(sequence, lambda e, command=command: (command(), 'break')[1])
+        
+        # Completion: typing updates the list, these keys drive it while it is shown
+        text.bind('<Key>', self.on_completion_key)
+        text.bind('<Control-space>', lambda e: (self.update_completions(explicit=True), 'break')[1])
+        for sequence, command in (('<Down>', lambda: self.completion.move(1)),
+                                  ('<Up>', lambda: self.completion.move(-1)),
+                                  ('<Tab>', self.completion.accept),
+                                  ('<Return>', self.completion.accept),
+                                  ('<Escape>', self.completion.hide)):
+            text.bind(sequence, lambda e, command=command: self._completion_command(command))
+        for sequence in ('<FocusOut>', '<Button-1>'):
+            text.bind(sequence, lambda e: self.completion.hide())
+        document.editor = DocumentEditor(text, watcher, highlighter, words)
+        
+    def _release_editor(self, document):
+        """Drop a document's Text widget, keeping its text and position"""
+        text = document.editor.text
+        document.text = text.get(1.0, 'end-1c')
+        document.cursor = text.index(tk.INSERT)
+        document.yview = text.yview()[0]
+        document.editor.watcher.close()
+        text.frame.destroy()
+        document.editor = None
+        
+    def open_document(self, path=None, content=''):
+        """Add a tab for a document and switch to it"""
+        document = self.documents.add(Document(path, content))
+        document.tab = ttk.Frame(self.tab_bar, height=0)
+        self.tab_bar.add(document.tab, text=document.name)
+        self.activate_document(document)
+        return document
+        
+    def activate_document(self, document):
+        """Show a document in the editor"""
+        previous = self.document
+        if previous is document:
+            return
+        self.completion.hide()
+        if previous is not None and previous.editor is not None:
+            previous.editor.text.frame.pack_forget()
+        restored = document.editor is None
+        self.documents.activate(document)
+        self.document = document
+        self.code_text = document.editor.text
+        self.highlighter = document.editor.highlighter
+        self.text_watcher = document.editor.watcher
+        
+        self.code_text.frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        if restored:
+            self.code_text.yview_moveto(document.yview)
+        self.line_numbers.attach(self.code_text)
+        if restored:
+            self.paint_diagnostics(document)
+        self.line_numbers.set_markers(self.diagnostic_markers(document))
+        if str(self.tab_bar.select()) != str(document.tab):
+            self.tab_bar.select(document.tab)
+        self.update_title()
+        self.highlight_syntax()
+        self.search_matches = None
+        self.refresh_search()
+        self.run_diagnostics()
+        self.code_text.focus_set()
+        
+    def on_tab_changed(self, event=None):
+        """Activate the document whose tab was clicked"""
+        selected = self.tab_bar.select()
+        for document in self.documents.documents:
+            if str(document.tab) == str(selected):
+                self.activate_document(document)
+                break
+                
     def new_file(self):
         """Create new file"""
-        if messagebox.askokcancel("New File", "Clear current content?"):
-            self.code_text.delete(1.0, tk.END)
-            self.current_file = None
-            self.root.title("AI Code Editor - Untitled")
+        self.open_document()
+        
+    def close_file(self):
+        """Close the active tab"""
+        document = self.document
+        if document is self.loading_document:
+            # Stopping the load closes its tab
+            self.cancel_file_load()
+            return
+        if document.busy:
+            messagebox.showinfo("Close", f"Code is still being generated into {document.name}, "
+                                         "cancel the job before closing it.")
+            return
+        if document.is_dirty() and not messagebox.askokcancel(
+            "Close", f"Discard unsaved changes to {document.name}?"
+        ):
+            return
+        self.journal.discard(document.path, document.journal_key)
+        following = self._drop_document(document)
+        if following is None:
+            self.new_file()
+        else:
+            self.activate_document(following)
             
+    def _drop_document(self, document):
+        """Remove a document and its tab, returning the one to show instead"""
+        if document is self.document:
+            self.document = None
+        self.tab_bar.forget(document.tab)
+        document.tab.destroy()
+        return self.documents.remove(document)
+        
+    def _is_pristine(self, document):
+        """Untitled, unchanged and empty, i.e. safe to replace"""
+        return (not document.path and not document.busy
+                and not document.is_dirty() and not document.content())
+        
     def open_file(self):
         """Open file"""
         file_path = filedialog.askopenfilename(
@@ -285,27 +818,114 @@ class AICodeEditor:
             filetypes=[("Python files", "*.py"), ("All files", "*.*")]
         )
         if file_path:
-            try:
+            self.open_path(file_path)
+            
+    def open_path(self, file_path):
+        """Open a file in a tab, returning its document or None on failure"""
+        # Already open: just switch to its tab
+        existing = self.documents.find(file_path)
+        if existing is not None:
+            self.activate_document(existing)
+            return existing
+        replaced = self.document if self._is_pristine(self.document) else None
+        try:
+            if os.path.getsize(file_path) >= LARGE_FILE_BYTES:
+                self.load_large_file(file_path)
+                document = self.loading_document
+            else:
                 with open(file_path, 'r', encoding='utf-8') as file:
                     content = file.read()
-                    self.code_text.delete(1.0, tk.END)
-                    self.code_text.insert(1.0, content)
-                    self.current_file = file_path
-                    self.root.title(f"AI Code Editor - {os.path.basename(file_path)}")
-                    self.highlight_syntax()
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to open file: {str(e)}")
-                
+                document = self.open_document(file_path, content)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to open file: {str(e)}")
+            return None
+        if replaced is not None:
+            self._drop_document(replaced)
+        return document
+        
+    def load_large_file(self, file_path):
+        """Read a big file on a worker thread and insert it a few chunks per tick"""
+        self.cancel_file_load()
+        self.file_loader = FileLoader(file_path)
+        
+        # The tab keeps its widget until everything is in
+        self.loading_document = self.open_document(file_path)
+        self.loading_document.busy = True
+        
+        # Highlighting and checks wait until everything is in
+        self.change_scheduler.pause('highlight')
+        self.change_scheduler.pause('diagnostics')
+        self.load_progress.pack(side=tk.RIGHT, padx=5)
+        self.file_loader.start()
+        self._pump_file_load()
+        
+    def _pump_file_load(self):
+        """Move chunks from the loader into the editor, then reschedule"""
+        loader = self.file_loader
+        if loader is None:
+            return
+        document = self.loading_document
+        text = document.editor.text
+        for chunk in loader.poll():
+            text.insert(tk.END, chunk)
+        self.load_progress['value'] = loader.progress
+        name = os.path.basename(loader.path)
+        self.status_label.config(text=f"Loading {name} | {loader.progress:.0%}")
+        
+        if not loader.finished:
+            self.root.after(1, self._pump_file_load)
+            return
+        self._end_file_load()
+        if loader.error:
+            self._discard_partial_load(document)
+            messagebox.showerror("Error", f"Failed to open file: {str(loader.error)}")
+        else:
+            text.edit_reset()
+            document.undo_revision = document.edit_revision
+            self.mark_saved(document)
+            lines = text.index('end-1c').split('.')[0]
+            self.status_label.config(text=f"Ready | Loaded {name}, {lines} lines")
+            
+    def cancel_file_load(self):
+        """Stop a large file load that is still running, closing its tab"""
+        if self.file_loader is not None:
+            document = self.loading_document
+            self.file_loader.cancel()
+            self._end_file_load()
+            self._discard_partial_load(document)
+            
+    def _discard_partial_load(self, document):
+        """Close the tab of a load that did not finish, as a failed small-file open never has one
+
+        Left open, its partial text is dirty and bound to the file, and a
+        save or the journal would treat the fragment as the user's edit.
+        """
+        was_active = document is self.document
+        following = self._drop_document(document)
+        if not was_active:
+            return
+        if following is None:
+            self.new_file()
+        else:
+            self.activate_document(following)
+            
+    def _end_file_load(self):
+        """Hide the progress bar and let highlighting catch up"""
+        self.file_loader = None
+        if self.loading_document is not None:
+            self.loading_document.busy = False
+            self.loading_document = None
+        self.load_progress.pack_forget()
+        self.change_scheduler.resume('highlight')
+        self.change_scheduler.resume('diagnostics')
+        
     def save_file(self):
         """Save current file"""
         if self.current_file:
-            try:
-                content = self.code_text.get(1.0, tk.END)
-                with open(self.current_file, 'w', encoding='utf-8') as file:
-                    file.write(content)
-                messagebox.showinfo("Success", "File saved successfully!")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save file: {str(e)}")
+            if not self.document.is_dirty():
+                self.status_label.config(text="Ready | No changes to save")
+                return
+            self.write_file(self.current_file)
         else:
             self.save_as_file()
             
@@ -317,19 +937,137 @@ class AICodeEditor:
             filetypes=[("Python files", "*.py"), ("All files", "*.*")]
         )
         if file_path:
-            try:
-                content = self.code_text.get(1.0, tk.END)
-                with open(file_path, 'w', encoding='utf-8') as file:
-                    file.write(content)
-                self.current_file = file_path
-                self.root.title(f"AI Code Editor - {os.path.basename(file_path)}")
-                messagebox.showinfo("Success", "File saved successfully!")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save file: {str(e)}")
+            self.write_file(file_path)
                 
+    def write_file(self, file_path):
+        """Snapshot the active buffer and write it atomically on the save thread"""
+        document = self.document
+        if document.busy or document is self.loading_document:
+            # Half loaded (or half generated) text would replace the whole file
+            what = "loading" if document is self.loading_document else "receiving generated code"
+            self.status_label.config(text=f"Ready | Not saved, {document.name} is still {what}")
+            return
+        content = document.content()
+        revision = document.edit_revision
+        document.save_serial += 1
+        serial = document.save_serial
+        self.status_label.config(text=f"Saving {os.path.basename(file_path)}...")
+        
+        def done(error, seconds):
+            self.ui.post(self._file_written, document, file_path, revision, serial, error, seconds)
+            
+        self.saver.save(file_path, content, done)
+        
+    def _file_written(self, document, file_path, revision, serial, error, seconds):
+        """Main-thread end of write_file, for the document and path it started with"""
+        if error:
+            messagebox.showerror("Error", f"Failed to save file: {str(error)}")
+            self.status_label.config(text="Ready | Save failed")
+            return
+        if document not in self.documents.documents:
+            # The tab was closed meanwhile, the file on disk is all that is left
+            self.journal.discard(file_path)
+            return
+        if serial != document.save_serial:
+            # A later save (maybe Save As elsewhere) is still to report back
+            return
+        if file_path != document.path:
+            self.journal.discard(document.path, document.journal_key)
+            document.path = file_path
+        self.journal.discard(file_path)
+        self.timings.record('save to disk', seconds * 1000)
+        self.refresh_project_index()
+        document.saved_revision = revision
+        document.journal_revision = revision
+        self.update_title(document)
+        self.status_label.config(text=f"Ready | Saved {os.path.basename(file_path)} in {seconds * 1000:.0f} ms")
+        
+    def _count_edit(self, document):
+        """TextWatcher listener, every edit makes a new revision"""
+        document.edit_revision += 1
+        if not document.shown_dirty:
+            self.update_title(document)
+            
+    def is_dirty(self):
+        """True if the active buffer changed since it was last opened or saved"""
+        return self.document.is_dirty()
+        
+    def mark_saved(self, document=None):
+        """Treat a buffer (the active one by default) as matching the file on disk"""
+        document = document or self.document
+        document.saved_revision = document.edit_revision
+        document.journal_revision = document.edit_revision
+        self.update_title(document)
+        
+    def update_title(self, document=None):
+        """Tab label and window title with the file name and an unsaved-changes marker"""
+        document = document or self.document
+        document.shown_dirty = document.is_dirty()
+        label = f"{document.name}{' *' if document.shown_dirty else ''}"
+        self.tab_bar.tab(document.tab, text=label)
+        if document is self.document:
+            self.root.title(f"AI Code Editor - {label}")
+        
+    def autosave(self):
+        """Periodically journal unsaved changes for crash recovery"""
+        for document in self.documents.documents:
+            if (document.is_dirty() and document.edit_revision != document.journal_revision
+                    and not document.busy):
+                document.journal_revision = document.edit_revision
+                self.saver.submit(self.journal.write, document.path, document.content(), document.journal_key)
+        self.root.after(AUTOSAVE_MS, self.autosave)
+        
+    def offer_recovery(self):
+        """On startup, offer to restore the journaled buffers, all of them selected"""
+        entries = self.journal.entries()
+        if not entries:
+            return
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Recover Unsaved Changes")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        ttk.Label(dialog, text="Unsaved changes from an earlier session were found.\n"
+                               "Select the buffers to restore:").pack(anchor=tk.W, padx=10, pady=(10, 5))
+        listbox = tk.Listbox(dialog, selectmode=tk.EXTENDED, width=70, height=min(len(entries), 10),
+                             activestyle=tk.NONE, exportselection=False)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=10)
+        for entry in entries:
+            when = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.get('saved_at', 0)))
+            listbox.insert(tk.END, f"{entry.get('path') or 'Untitled'} - {when}")
+        listbox.selection_set(0, tk.END)
+        
+        def finish(chosen):
+            dialog.destroy()
+            self.restore_entries([entries[index] for index in chosen], entries)
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="Restore Selected",
+                   command=lambda: finish(listbox.curselection())).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Restore All",
+                   command=lambda: finish(range(len(entries)))).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Discard All", command=lambda: finish(())).pack(side=tk.LEFT, padx=5)
+        
+    def restore_entries(self, chosen, entries):
+        """Open the chosen journal entries in tabs and discard the rest"""
+        replaced = self.document if self._is_pristine(self.document) else None
+        for entry in chosen:
+            document = self.open_document(entry.get('path'), entry.get('text', ''))
+            if entry.get('key'):
+                # Keep journaling to the same entry until it is saved or closed
+                document.journal_key = entry['key']
+            document.saved_revision = -1
+            self.update_title(document)
+        if chosen and replaced is not None:
+            self._drop_document(replaced)
+        for entry in entries:
+            if entry not in chosen:
+                self.journal.discard(entry.get('path'), entry.get('key'))
+            
     def show_ai_dialog(self):
         """Show AI code generation dialog"""
-        if not self.model:
+        if self.backend is None:
             messagebox.showwarning("Warning", "Please setup your Gemini API key first!")
             self.setup_api_key()
             return
@@ -363,7 +1101,41 @@ class AICodeEditor:
         
     def generate_code_with_ai(self, prompt):
         """Generate code using AI"""
-        def ai_task():
+        # Code streams in at the cursor position as it was when generation
+        # started, in that document even if another tab is active meanwhile
+        document = self.document
+        text = self.code_text
+        start, insert = self.new_marks('ai_start', 'ai_insert')
+        text.mark_set(start, tk.INSERT)
+        text.mark_gravity(start, tk.LEFT)
+        text.mark_set(insert, tk.INSERT)
+        text.mark_gravity(insert, tk.RIGHT)
+        document.busy = True
+        
+        def insert_code(code):
+            if document in self.documents.documents:
+                text.insert(insert, code)
+            
+        def finish_code(code, streamed):
+            """Swap in the block chosen at the end if it is not the one streamed, None keeps it"""
+            document.busy = False
+            if document not in self.documents.documents:
+                return
+            if code is not None and code != streamed:
+                if code.startswith(streamed):
+                    text.insert(insert, code[len(streamed):])
+                else:
+                    text.replace(start, insert, code)
+            text.mark_unset(start, insert)
+            if document is self.document:
+                self.highlight_syntax()
+            
+        # Insert the first Python block as it streams in, without the ``` fence
+        stream = CodeStream()
+        
+        def ai_task(job):
+            # Left as streamed if the answer does not finish
+            code = None
             try:
                 self.update_ai_output("🤖 Generating code...\n")
                 
@@ -381,228 +1153,884 @@ Requirements:
 Code:
 """
                 
-                response = self.model.generate_content(full_prompt)
-                generated_code = response.text
-                
-                # Clean up the response to extract just the code
-                if "```python" in generated_code:
-                    code_start = generated_code.find("```python") + 9
-                    code_end = generated_code.find("```", code_start)
-                    if code_end != -1:
-                        generated_code = generated_code[code_start:code_end].strip()
-                elif "```" in generated_code:
-                    code_start = generated_code.find("```") + 3
-                    code_end = generated_code.find("```", code_start)
-                    if code_end != -1:
-                        generated_code = generated_code[code_start:code_end].strip()
-                
-                # Insert generated code at cursor position
-                cursor_pos = self.code_text.index(tk.INSERT)
-                self.code_text.insert(cursor_pos, generated_code)
-                self.highlight_syntax()
+                self.stream_ai_response(
+                    full_prompt,
+                    lambda chunk: self.ui.post_text(insert_code, stream.feed(chunk)),
+                    job
+                )
+                code = stream.finish()
                 
                 self.update_ai_output(f"✅ Code generated successfully!\n\nPrompt: {prompt}\n\n")
                 
+            except JobCancelled as e:
+                # Cancelled or timed out as asked, not a failure
+                self.update_ai_output(f"\n⏹ {e}\n\n")
             except Exception as e:
                 self.update_ai_output(f"❌ Error generating code: {str(e)}\n")
+            finally:
+                self.ui.post(finish_code, code, stream.streamed)
         
-        threading.Thread(target=ai_task, daemon=True).start()
+        if not self.submit_ai_job("Generate", ('generate', prompt), ai_task):
+            finish_code(None, '')
         
     def explain_code(self):
         """Explain selected code or all code"""
-        if not self.model:
+        self.run_code_action('explain')
+        
+    def fix_code(self):
+        """Fix code issues"""
+        self.run_code_action('fix')
+        
+    def optimize_code(self):
+        """Optimize code performance"""
+        self.run_code_action('optimize')
+        
+    def run_code_action(self, name):
+        """Run an AI action from CODE_ACTIONS on the selected code or all code"""
+        action = CODE_ACTIONS[name]
+        if self.backend is None:
             messagebox.showwarning("Warning", "Please setup your Gemini API key first!")
             return
             
-        # Get selected text or all text
+        # Get selected text; for Fix, the statements the local checks found
+        # problems in; otherwise the code around the cursor. region is where
+        # the code came from, when that is one contiguous stretch
+        problems = ""
         try:
-            selected_code = self.code_text.get(tk.SEL_FIRST, tk.SEL_LAST)
+            region = (tk.SEL_FIRST, tk.SEL_LAST)
+            selected_code = self.code_text.get(*region)
+            description = "selection"
         except tk.TclError:
-            selected_code = self.code_text.get(1.0, tk.END).strip()
+            found = self.problem_region() if name == 'fix' else None
+            if found is not None:
+                first, last, summary = found
+                region = (f'{first}.0', f'{last}.0 lineend')
+                selected_code = self.code_text.get(*region)
+                problems = PROBLEMS_NOTE.format(summary=summary)
+                description = f"lines {first}-{last} with problems"
+            else:
+                context = self.code_context()
+                selected_code = context.text.strip()
+                description = context.description
+                region = self.whole_buffer_region() if description == "whole buffer" else None
             
         if not selected_code:
-            messagebox.showinfo("Info", "No code to explain")
+            messagebox.showinfo("Info", f"No code to {action.verb}")
             return
             
-        def ai_task():
-            try:
-                self.update_ai_output("🤖 Analyzing code...\n")
-                
-                prompt = f"""
-Explain this Python code in detail:
-
-{selected_code}
-
-Please provide:
-1. Overall purpose and functionality
-2. Step-by-step breakdown
-3. Key concepts used
-4. Potential improvements or issues
-"""
-                
-                response = self.model.generate_content(prompt)
-                explanation = response.text
+        # Fixed or optimized code can be applied over the code it came from
+        document = self.document
+        applicable = name in ('fix', 'optimize') and region is not None
+        marks = self.mark_apply_region(*region) if applicable else None
+            
+        prompt = action.template.format(code=selected_code, problems=problems)
+        self.set_status(f"AI | ~{estimate_tokens(prompt)} tokens ({description})")
+        
+        # Same model, template and code as an earlier run: answer from the cache
+        cache_key = self.response_cache.key(self.backend.name, action.template, selected_code + problems)
+        if not self.bypass_cache.get():
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self.update_ai_output(f"{action.heading}{cached}\n\n")
+                self.set_status(f"Ready | Cache hit ({self.cache_stats()})")
+                if applicable:
+                    self.offer_apply(document, pick_code(parse_blocks(cached)), marks)
+                return
                 
-                self.update_ai_output(f"📝 Code Explanation:\n\n{explanation}\n\n")
+        # Code blocks are picked out of the response as it streams
+        parser = FenceParser()
+        
+        def on_chunk(text):
+            self.update_ai_output(text)
+            parser.feed(text)
+            
+        def ai_task(job):
+            try:
+                self.update_ai_output(action.progress)
+                self.update_ai_output(action.heading)
+                response = self.stream_ai_response(prompt, on_chunk, job, note=self.cache_stats())
+                self.update_ai_output("\n\n")
+                self.response_cache.put(cache_key, response)
+                parser.finish()
+                if applicable:
+                    self.ui.post(self.offer_apply, document, pick_code(parser.blocks), marks)
+                    return
                 
+            except JobCancelled as e:
+                self.update_ai_output(f"\n⏹ {e}\n\n")
             except Exception as e:
-                self.update_ai_output(f"❌ Error explaining code: {str(e)}\n")
+                self.update_ai_output(f"❌ Error {action.gerund} code: {str(e)}\n")
+            if applicable:
+                self.ui.post(self.unset_marks, document, marks)
+        
+        if not self.submit_ai_job(action.label, (name, selected_code), ai_task) and applicable:
+            self.unset_marks(document, marks)
+        
+    def whole_buffer_region(self):
+        """Indices around the whole buffer, less the blank space that is not sent"""
+        source = self.code_text.get(1.0, 'end-1c')
+        return (f'1.0+{len(source) - len(source.lstrip())}c',
+                f'end-1c-{len(source) - len(source.rstrip())}c')
+        
+    def new_marks(self, *prefixes):
+        """Mark names of their own for one request, e.g. apply_start_3"""
+        self._mark_serial += 1
+        return tuple(f'{prefix}_{self._mark_serial}' for prefix in prefixes)
+        
+    def unset_marks(self, document, marks):
+        """Drop a request's marks, if the document still has its widget"""
+        if document.editor is not None:
+            document.editor.text.mark_unset(*marks)
+        
+    def mark_apply_region(self, start, end):
+        """Remember the code a Fix/Optimize request is about with marks, so edits made meanwhile keep it in place"""
+        text = self.code_text
+        marks = self.new_marks('apply_start', 'apply_end')
+        text.mark_set(marks[0], start)
+        text.mark_gravity(marks[0], tk.LEFT)
+        text.mark_set(marks[1], end)
+        return marks
+        
+    def offer_apply(self, document, code, marks):
+        """Enable Apply for the code block of a finished Fix/Optimize answer, main thread only"""
+        if not code:
+            self.unset_marks(document, marks)
+            return
+        if self.pending_apply is not None:
+            # Only the newest suggestion can be applied
+            self.unset_marks(self.pending_apply[0], self.pending_apply[2])
+        self.pending_apply = (document, code, marks)
+        self.apply_button.state(['!disabled'])
+        self._write_ai_output("↳ Apply replaces the original code with the block above, changing only the lines that differ.\n\n")
+        
+    def apply_ai_code(self):
+        """Apply the suggested code as a line diff against the region it was made for, in one undo step"""
+        if self.pending_apply is None:
+            return
+        document, code, (start, end) = self.pending_apply
+        self.pending_apply = None
+        self.apply_button.state(['disabled'])
+        if document not in self.documents.documents:
+            self.status_label.config(text="Ready | The file the suggestion was for is closed")
+            return
+        self.activate_document(document)
+        text = self.code_text
+        if start not in text.mark_names():
+            # The tab's widget was released since, and the marks with it
+            self.status_label.config(text="Ready | The code the suggestion was for is no longer tracked")
+            return
+        edits = diff_edits(text.get(start, end), code)
+        if edits:
+            apply_edits(text, start, end, edits)
+        text.mark_unset(start, end)
+        self.status_label.config(text=f"Ready | Applied {len(edits)} change{'s' if len(edits) != 1 else ''}")
         
-        threading.Thread(target=ai_task, daemon=True).start()
+    def clear_response_cache(self):
+        """Forget every cached answer, e.g. after changing the prompts"""
+        self.response_cache.clear()
+        self.set_status("Ready | Response cache cleared")
         
-    def fix_code(self):
-        """Fix code issues"""
-        if not self.model:
+    def cache_stats(self):
+        """Hit/miss counts of the response cache for the status bar"""
+        return f"cache {self.response_cache.hits} hits, {self.response_cache.misses} misses"
+        
+    def send_ai_query(self):
+        """Send custom query to AI"""
+        if self.backend is None:
             messagebox.showwarning("Warning", "Please setup your Gemini API key first!")
             return
             
-        try:
-            selected_code = self.code_text.get(tk.SEL_FIRST, tk.SEL_LAST)
-        except tk.TclError:
-            selected_code = self.code_text.get(1.0, tk.END).strip()
-            
-        if not selected_code:
-            messagebox.showinfo("Info", "No code to fix")
+        query = self.ai_input.get(1.0, tk.END).strip()
+        if not query:
             return
             
-        def ai_task():
+        document = self.document
+        session = self.chat_session(document)
+        
+        # The whole buffer when it fits the budget, so later turns can send a
+        # diff of it; otherwise the code around the cursor, every turn
+        source = self.code_text.get(1.0, 'end-1c')
+        if estimate_tokens(source) <= self.context_budget:
+            current_code = source.strip()
+            excerpt = None
+        else:
+            context = self.code_context()
+            current_code = excerpt = context.text.strip()
+        
+        # Definitions from other project files the code refers to
+        related = ""
+        if self.project_index is not None and current_code:
+            budget = self.context_budget - estimate_tokens(current_code)
+            extra = project_context(self.project_index, current_code, source, budget, self.current_file)
+            if extra.text:
+                related = f"\nRelated definitions from the project:\n{extra.text}\n"
+        
+        message = session.message(query, source, excerpt, related)
+        history = session.history()
+        history_tokens = session.history_tokens()
+        self.set_status(f"AI | ~{estimate_tokens(message.text)} tokens ({message.description}), "
+                        f"~{history_tokens} of history ({len(session)} turns)")
+        path = document.path if document else None
+        
+        def ai_task(job):
             try:
-                self.update_ai_output("🤖 Analyzing and fixing code...\n")
-                
-                prompt = f"""
-Analyze this Python code and fix any issues:
-
-{selected_code}
-
-Please:
-1. Identify any syntax errors, logical errors, or potential bugs
-2. Fix the issues
-3. Improve code quality and efficiency
-4. Return the corrected code with comments explaining the fixes
-
-Original code with issues fixed:
-"""
+                self.update_ai_output(f"👤 You: {query}\n")
+                self.update_ai_output("🤖 AI: ")
+                reply = self.stream_ai_response(message.text, self.update_ai_output, job, history)
+                self.update_ai_output("\n\n")
                 
-                response = self.model.generate_content(prompt)
-                fixed_code = response.text
+                # Clear input
+                self.ui.post(self.ai_input.delete, 1.0, tk.END)
                 
-                self.update_ai_output(f"🔧 Code Analysis and Fixes:\n\n{fixed_code}\n\n")
+                if not session.record(message, reply):
+                    if not reply.strip():
+                        self.set_status("AI | Empty reply, not added to the conversation")
+                    return
+                if session.needs_compacting():
+                    self.set_status("AI | Summarizing earlier turns...")
+                    folded = session.compact(lambda prompt: self.backend.generate(prompt, timeout=30))
+                    self.set_status(f"Ready | Folded {folded} earlier turns into the chat summary")
+                if self.chat_store is not None:
+                    self.chat_store.save(path, session)
                 
+            except JobCancelled as e:
+                self.update_ai_output(f"\n⏹ {e}\n\n")
             except Exception as e:
-                self.update_ai_output(f"❌ Error fixing code: {str(e)}\n")
+                self.update_ai_output(f"❌ Error: {str(e)}\n")
         
-        threading.Thread(target=ai_task, daemon=True).start()
+        # One turn at a time per conversation, each builds on the last
+        self.submit_ai_job("Ask", ('ask', id(session)), ai_task)
+        
+    def chat_session(self, document):
+        """Conversation for document, resuming the saved one the first time"""
+        if document is None:
+            return ChatSession()
+        if document.chat is None:
+            saved = self.chat_store.load(document.path) if self.chat_store is not None else None
+            if saved is not None and len(saved):
+                self._write_ai_output(f"💬 Continuing the earlier chat about {document.name} "
+                                      f"({len(saved) // 2} questions). AI > New Chat starts over.\n\n")
+            document.chat = saved or ChatSession()
+        return document.chat
+        
+    def new_chat(self):
+        """Forget the conversation about the current file"""
+        document = self.document
+        if document is None:
+            return
+        if document.chat is not None:
+            document.chat.reset()
+        else:
+            document.chat = ChatSession()
+        if self.chat_store is not None:
+            self.chat_store.delete(document.path)
+        self._write_ai_output(f"💬 New chat about {document.name}\n\n")
+        self.set_status("Ready | New chat")
+        
+    def code_context(self):
+        """Code around the cursor that fits the context budget"""
+        source = self.code_text.get(1.0, 'end-1c')
+        line = int(self.code_text.index(tk.INSERT).split('.')[0])
+        return build_context(source, line, self.context_budget)
+        
+    def open_project(self):
+        """Pick a project folder and index its Python files in the background"""
+        folder = filedialog.askdirectory(title="Open Folder")
+        if not folder:
+            return
+        if self.project_index is not None:
+            self.project_index.close()
+        else:
+            self.root.after(INDEX_POLL_MS, self.poll_project_index)
+        self.project_index = ProjectIndex(folder)
+        self.status_label.config(text=f"Indexing {os.path.basename(folder)}...")
+        self.refresh_project_index()
+        
+    def refresh_project_index(self):
+        """Re-index changed files on a background thread"""
+        index = self.project_index
+        if index is None:
+            return
         
-    def optimize_code(self):
-        """Optimize code performance"""
-        if not self.model:
-            messagebox.showwarning("Warning", "Please setup your Gemini API key first!")
+        def done(changed, seconds):
+            if changed:
+                self.set_status(f"Ready | Indexed {changed} files, {len(index)} total, in {seconds:.1f} s")
+                
+        index.refresh_async(done)
+        
+    def poll_project_index(self):
+        """Pick up files changed outside the editor"""
+        self.refresh_project_index()
+        self.root.after(INDEX_POLL_MS, self.poll_project_index)
+        
+    def go_to_definition(self):
+        """Jump to the definition of the name under the cursor"""
+        name = self.code_text.get('insert wordstart', 'insert wordend').strip()
+        if not name.isidentifier():
             return
+        source = self.code_text.get(1.0, 'end-1c')
+        for definition in CodeIndex(source).definitions:
+            if definition.name == name:
+                self.jump_to_line(definition.start)
+                return
+        location = None
+        if self.project_index is not None:
+            location = self.project_index.resolve(name, source, self.current_file)
+        if location is None:
+            self.status_label.config(text=f"Ready | No definition of {name} found")
+            return
+        self.open_location(location.path, location.line)
+        
+    def find_references(self):
+        """List the uses of the name under the cursor across the project, in the results panel"""
+        name = self.code_text.get('insert wordstart', 'insert wordend').strip()
+        if not name.isidentifier():
+            return
+        if self.project_index is None:
+            self.status_label.config(text="Ready | Open a folder to find references across files")
+            return
+        found = self.project_index.references(name)
+        
+        # Same panel as Find in Project, under the find bar seeded with the name
+        self.code_text.tag_remove(tk.SEL, 1.0, tk.END)
+        self.find_entry.delete(0, tk.END)
+        self.find_entry.insert(0, name)
+        self.show_find_bar()
+        if self.project_search is not None:
+            self.project_search.cancel()
+            self.project_search = None
+        self.project_hits = []
+        self.search_results.delete(0, tk.END)
+        self.results_frame.pack(side=tk.BOTTOM, fill=tk.X, before=self.find_bar)
+        rows = []
+        root = self.project_index.root
+        for path, line in found[:MAX_PROJECT_HITS]:
+            self.project_hits.append((path, line, 0))
+            rows.append(f"{os.path.relpath(path, root)}:{line}: {linecache.getline(path, line).strip()}")
+        if rows:
+            self.search_results.insert(tk.END, *rows)
+        linecache.clearcache()
+        self.status_label.config(text=f"Ready | {len(found)} references to {name} as of the last index refresh")
+        
+    def open_location(self, path, line):
+        """Open path in a tab and put the cursor on line"""
+        document = self.open_path(path)
+        if document is not None and not document.busy:
+            self.jump_to_line(line)
             
+    def jump_to_line(self, line):
+        """Move the cursor of the active editor to the start of line"""
+        self.code_text.mark_set(tk.INSERT, f'{line}.0')
+        self.code_text.see(tk.INSERT)
+        self.code_text.focus_set()
+        
+    def show_symbol_search(self):
+        """Dialog that searches definitions in the buffer and the project"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Find Symbol")
+        dialog.geometry("500x350")
+        dialog.transient(self.root)
+        
+        query_entry = ttk.Entry(dialog)
+        query_entry.pack(fill=tk.X, padx=10, pady=(10, 5))
+        results_list = tk.Listbox(dialog, font=('Consolas', 10), activestyle=tk.NONE)
+        results_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        results = []
+        
+        def update(event=None):
+            query = query_entry.get().strip()
+            results.clear()
+            results_list.delete(0, tk.END)
+            if not query:
+                return
+            source = self.code_text.get(1.0, 'end-1c')
+            for definition in CodeIndex(source).definitions:
+                if query.lower() in definition.name.lower():
+                    results.append((None, definition.start))
+                    results_list.insert(tk.END, f"{definition.name}  ({definition.kind})  line {definition.start}")
+            if self.project_index is not None:
+                for location in self.project_index.search(query):
+                    if self.current_file and os.path.abspath(location.path) == os.path.abspath(self.current_file):
+                        # Already listed from the buffer, which may be newer
+                        continue
+                    relative = os.path.relpath(location.path, self.project_index.root)
+                    results.append((location.path, location.line))
+                    results_list.insert(tk.END, f"{location.qualname}  ({location.kind})  {relative}:{location.line}")
+            if results:
+                results_list.selection_set(0)
+                
+        def choose(event=None):
+            selection = results_list.curselection()
+            if not selection:
+                return
+            path, line = results[selection[0]]
+            dialog.destroy()
+            if path is None:
+                self.jump_to_line(line)
+            else:
+                self.open_location(path, line)
+                
+        query_entry.bind('<KeyRelease>', update)
+        query_entry.bind('<Return>', choose)
+        results_list.bind('<Double-Button-1>', choose)
+        results_list.bind('<Return>', choose)
+        dialog.bind('<Escape>', lambda e: dialog.destroy())
+        query_entry.focus()
+        
+    def show_find_bar(self, replace=False):
+        """Open the find bar, seeded with the selected text"""
         try:
-            selected_code = self.code_text.get(tk.SEL_FIRST, tk.SEL_LAST)
+            selected = self.code_text.get(tk.SEL_FIRST, tk.SEL_LAST)
         except tk.TclError:
-            selected_code = self.code_text.get(1.0, tk.END).strip()
+            selected = ''
+        if selected and '\n' not in selected:
+            self.find_entry.delete(0, tk.END)
+            self.find_entry.insert(0, selected)
+        if not self.find_visible:
+            self.find_visible = True
+            self.find_bar.pack(side=tk.BOTTOM, fill=tk.X, before=self.editor_frame)
+        if replace and self.find_entry.get():
+            self.replace_entry.focus_set()
+        else:
+            self.find_entry.focus_set()
+            self.find_entry.select_range(0, tk.END)
+        self.run_buffer_search()
+        
+    def hide_find_bar(self):
+        """Close the find bar and the project results"""
+        self.find_visible = False
+        self._search_generation += 1
+        self.search_matches = None
+        if self.project_search is not None:
+            self.project_search.cancel()
+            self.project_search = None
+        self.find_bar.pack_forget()
+        self.results_frame.pack_forget()
+        self.paint_search_hits()
+        self.code_text.focus_set()
+        
+    def on_find_key(self, event):
+        """Search again as the query is typed"""
+        if event.keysym not in ('Return', 'Escape', 'Up', 'Down', 'Left', 'Right'):
+            self.run_buffer_search()
             
-        if not selected_code:
-            messagebox.showinfo("Info", "No code to optimize")
-            return
+    def refresh_search(self):
+        """Re-run the buffer search after edits while the find bar is open"""
+        if self.find_visible:
+            self.run_buffer_search()
             
-        def ai_task():
-            try:
-                self.update_ai_output("🤖 Optimizing code...\n")
-                
-                prompt = f"""
-Optimize this Python code for better performance and readability:
-
-{selected_code}
-
-Please provide:
-1. Optimized version of the code
-2. Explanation of optimizations made
-3. Performance improvements achieved
-4. Best practices applied
-
-Optimized code:
-"""
-                
-                response = self.model.generate_content(prompt)
-                optimized_code = response.text
-                
-                self.update_ai_output(f"⚡ Code Optimization:\n\n{optimized_code}\n\n")
-                
-            except Exception as e:
-                self.update_ai_output(f"❌ Error optimizing code: {str(e)}\n")
+    def search_pattern(self):
+        """Compiled find query, None if empty or not a valid regex"""
+        query = self.find_entry.get()
+        if not query:
+            return None
+        try:
+            return compile_pattern(query, self.search_regex.get(), self.search_case.get())
+        except re.error as e:
+            self.status_label.config(text=f"Ready | Invalid pattern: {e}")
+            return None
+            
+    def run_buffer_search(self, then=None):
+        """Find every match in a snapshot of the buffer on the search thread"""
+        self._search_generation += 1
+        generation = self._search_generation
+        pattern = self.search_pattern()
+        if pattern is None:
+            self.search_matches = None
+            self.paint_search_hits()
+            return
+        document = self.document
+        snapshot = self.code_text.get(1.0, 'end-1c')
+        revision = document.edit_revision
         
-        threading.Thread(target=ai_task, daemon=True).start()
+        def task():
+            matches = BufferMatches(snapshot, pattern, revision)
+            self.ui.post(self._buffer_search_done, generation, document, matches, then)
+            
+        self.search_worker.submit(task)
         
-    def send_ai_query(self):
-        """Send custom query to AI"""
-        if not self.model:
-            messagebox.showwarning("Warning", "Please setup your Gemini API key first!")
+    def _buffer_search_done(self, generation, document, matches, then):
+        """Main-thread end of run_buffer_search, dropped if a newer search started"""
+        if generation != self._search_generation or document is not self.document:
             return
+        self.search_matches = matches
+        self.paint_search_hits()
+        self.status_label.config(text=f"Ready | {len(matches)} matches")
+        if then is not None:
+            then()
             
-        query = self.ai_input.get(1.0, tk.END).strip()
-        if not query:
+    def paint_search_hits(self):
+        """Tag the matches on screen, plus the highlighter's margin"""
+        self.code_text.tag_remove('search_hit', 1.0, tk.END)
+        if self.search_matches is None:
             return
+        first, last = self.highlighter.visible_range()
+        margin = self.highlighter.MARGIN
+        spans = self.search_matches.between(first + 1 - margin, last + margin)
+        if spans:
+            self.code_text.tag_add('search_hit', *[index for span in spans for index in span])
             
-        # Get current code context
-        current_code = self.code_text.get(1.0, tk.END).strip()
+    def find_next(self, backward=False):
+        """Select the next (or previous) match after the cursor"""
+        matches = self.search_matches
+        if not self.find_visible:
+            self.show_find_bar()
+            return
+        if not matches:
+            self.status_label.config(text="Ready | No matches")
+            return
+        position = tk.INSERT
+        if backward and self.code_text.tag_ranges(tk.SEL):
+            position = tk.SEL_FIRST
+        line, col = map(int, self.code_text.index(position).split('.'))
+        i = matches.before(line, col) if backward else matches.after(line, col)
+        start, end = matches.span(i)
+        self.code_text.tag_remove(tk.SEL, 1.0, tk.END)
+        self.code_text.tag_add(tk.SEL, start, end)
+        self.code_text.mark_set(tk.INSERT, end)
+        self.code_text.see(start)
+        self.status_label.config(text=f"Ready | Match {i + 1} of {len(matches)}")
+        
+    def replace_one(self):
+        """Replace the selected match, then move to the next one"""
+        pattern = self.search_pattern()
+        if pattern is None:
+            return
+        try:
+            first = self.code_text.index(tk.SEL_FIRST)
+            last = self.code_text.index(tk.SEL_LAST)
+        except tk.TclError:
+            self.find_next()
+            return
+        match = pattern.fullmatch(self.code_text.get(first, last))
+        if match is None:
+            self.find_next()
+            return
+        replacement = self.replace_entry.get()
+        try:
+            if self.search_regex.get():
+                replacement = match.expand(replacement)
+        except (re.error, IndexError) as e:
+            self.status_label.config(text=f"Ready | Invalid replacement: {e}")
+            return
+        self.code_text.replace(first, last, replacement)
+        self.code_text.mark_set(tk.INSERT, f'{first}+{len(replacement)}c')
+        self.run_buffer_search(then=self.find_next)
+        
+    def replace_all(self):
+        """Replace every match as a single edit and undo step"""
+        pattern = self.search_pattern()
+        if pattern is None:
+            return
+        replacement = self.replace_entry.get()
+        regex = self.search_regex.get()
+        document = self.document
+        snapshot = self.code_text.get(1.0, 'end-1c')
+        revision = document.edit_revision
         
-        def ai_task():
+        def task():
             try:
-                self.update_ai_output(f"👤 You: {query}\n")
-                self.update_ai_output("🤖 AI: Thinking...\n")
-                
-                # Include code context in the prompt
-                context_prompt = f"""
-Current code in editor:
-{current_code if current_code else "No code in editor"}
-
-User question: {query}
+                plan = plan_replace_all(snapshot, pattern, replacement, regex)
+            except (re.error, IndexError) as e:
+                plan = e
+            self.ui.post(self._apply_replace_all, document, revision, plan)
+            
+        self.search_worker.submit(task)
+        
+    def _apply_replace_all(self, document, revision, plan):
+        """Main-thread end of replace_all, if the buffer did not change meanwhile"""
+        if isinstance(plan, Exception):
+            self.status_label.config(text=f"Ready | Invalid replacement: {plan}")
+            return
+        if document.edit_revision != revision or document.editor is None:
+            self.status_label.config(text="Ready | Buffer changed, run Replace All again")
+            return
+        start, end, region, count = plan
+        if not count:
+            self.status_label.config(text="Ready | No matches")
+            return
+        text = document.editor.text
+        text.configure(autoseparators=False)
+        text.edit_separator()
+        text.replace(start, end, region)
+        text.edit_separator()
+        text.configure(autoseparators=True)
+        self.status_label.config(text=f"Ready | Replaced {count} matches")
+        if document is self.document:
+            self.run_buffer_search()
+            
+    def find_in_project(self):
+        """Search every file of the project folder, listing hits as they come in"""
+        if not self.find_visible:
+            self.show_find_bar()
+        pattern = self.search_pattern()
+        if pattern is None:
+            return
+        if self.project_search is not None:
+            self.project_search.cancel()
+        if self.project_index is not None:
+            root = self.project_index.root
+        elif self.current_file:
+            root = os.path.dirname(os.path.abspath(self.current_file))
+        else:
+            root = os.getcwd()
+        self.project_hits = []
+        self.search_results.delete(0, tk.END)
+        self.results_frame.pack(side=tk.BOTTOM, fill=tk.X, before=self.find_bar)
+        
+        def hits_found(hits):
+            self.ui.post(self._add_project_hits, search, hits)
+            
+        def finished(count, files, seconds, error):
+            self.ui.post(self._project_search_done, search, count, files, seconds, error)
+            
+        search = ProjectSearch(root, pattern, hits_found, finished)
+        self.project_search = search
+        self.status_label.config(text=f"Searching {root}...")
+        search.start()
+        
+    def _add_project_hits(self, search, hits):
+        """Append a batch of project search hits to the results panel"""
+        if search is not self.project_search:
+            return
+        rows = []
+        for path, line, col, line_text in hits:
+            self.project_hits.append((path, line, col))
+            rows.append(f"{os.path.relpath(path, search.root)}:{line}: {line_text}")
+        self.search_results.insert(tk.END, *rows)
+        
+    def _project_search_done(self, search, count, files, seconds, error):
+        """Report how a project search went"""
+        if search is not self.project_search:
+            return
+        self.project_search = None
+        if error:
+            self.status_label.config(text=f"Ready | Project search failed: {error}")
+            return
+        limit = " (limit reached)" if count >= MAX_PROJECT_HITS else ""
+        self.status_label.config(text=f"Ready | {count} hits in {files} files{limit}, {seconds:.1f} s")
+        
+    def open_search_result(self, event=None):
+        """Open the file of the selected project search hit"""
+        selection = self.search_results.curselection()
+        if not selection:
+            return
+        path, line, col = self.project_hits[selection[0]]
+        document = self.open_path(path)
+        if document is not None and not document.busy:
+            self.jump_to_line(line)
+            self.code_text.mark_set(tk.INSERT, f'{line}.{col}')
+            
+    def set_context_budget(self):
+        """Ask for the token budget used for code context"""
+        budget = simpledialog.askinteger(
+            "Context Budget",
+            "Maximum tokens of code to send with a prompt:",
+            initialvalue=self.context_budget,
+            minvalue=100,
+            parent=self.root
+        )
+        if budget:
+            self.context_budget = budget
+            
+    def submit_ai_job(self, label, key, task):
+        """Queue task(job) on the AI worker pool unless the same request is in flight"""
+        if self.jobs.submit(label, key, task) is None:
+            self.set_status(f"Ready | {label} is already running")
+            return False
+        return True
+            
+    def cancel_ai_job(self):
+        """Cancel the selected AI job, or the oldest running one"""
+        selection = self.job_list.curselection()
+        if selection and selection[0] < len(self.shown_jobs):
+            self.jobs.cancel(self.shown_jobs[selection[0]])
+        elif not self.jobs.cancel():
+            self.set_status("Ready | No AI job running")
+            
+    def _jobs_changed(self):
+        """Called by the job manager from any thread"""
+        self.ui.post(self.refresh_job_list)
+        
+    def refresh_job_list(self):
+        """Show queued and running jobs with their elapsed times, keeping the selected job selected"""
+        selection = self.job_list.curselection()
+        selected = self.shown_jobs[selection[0]] if selection and selection[0] < len(self.shown_jobs) else None
+        jobs = self.jobs.jobs()
+        self.job_list.delete(0, tk.END)
+        for job in jobs:
+            state = "running" if job.running else "queued"
+            self.job_list.insert(tk.END, f"{job.label} - {state} {job.elapsed():.1f} s")
+        self.shown_jobs = jobs
+        if selected in jobs:
+            self.job_list.selection_set(jobs.index(selected))
+            
+        # Keep the elapsed times ticking while anything is pending
+        if jobs and not self._job_refresh_pending:
+            self._job_refresh_pending = True
+            self.root.after(500, self._tick_job_list)
+            
+    def _tick_job_list(self):
+        """Periodic refresh of the elapsed times"""
+        self._job_refresh_pending = False
+        self.refresh_job_list()
+        
+    def stream_ai_response(self, prompt, on_chunk, job, history=None, note=None):
+        """Stream a response into on_chunk, showing latency in the status bar
 
-Please provide a helpful response considering the current code context.
-"""
-                
-                response = self.model.generate_content(context_prompt)
-                ai_response = response.text
-                
-                self.update_ai_output(f"🤖 AI: {ai_response}\n\n")
-                
-                # Clear input
-                self.ai_input.delete(1.0, tk.END)
-                
-            except Exception as e:
-                self.update_ai_output(f"❌ Error: {str(e)}\n")
+        With history (role, text turns), prompt is the next message of a chat.
+        note is added to the final status message.
+        """
+        self.set_status("AI | Waiting for first token...")
         
-        threading.Thread(target=ai_task, daemon=True).start()
+        def first_token(seconds):
+            self.set_status(f"AI | First token in {seconds * 1000:.0f} ms")
+        
+        def chunk(text):
+            # Stop between chunks once the job is cancelled or timed out
+            job.check()
+            on_chunk(text)
+        
+        text, first, total = stream_response(
+            self.backend, prompt, chunk, first_token, timeout=job.remaining(), history=history
+        )
+        first_text = f"{first * 1000:.0f} ms" if first is not None else "n/a"
+        note = f" ({note})" if note else ""
+        self.set_status(f"Ready | First token {first_text}, total {total:.1f} s{note}")
+        return text
+        
+    def toggle_perf_overlay(self, flip=False):
+        """Show or hide the latency overlay"""
+        if flip:
+            self.show_perf_overlay.set(not self.show_perf_overlay.get())
+        if self._perf_refresh is not None:
+            self.root.after_cancel(self._perf_refresh)
+            self._perf_refresh = None
+        if self.show_perf_overlay.get():
+            self.perf_overlay.place(relx=1.0, rely=0.0, anchor=tk.NE, x=-20, y=4)
+            self.perf_overlay.lift()
+            self._refresh_perf_overlay()
+        else:
+            self.perf_overlay.place_forget()
+            
+    def _refresh_perf_overlay(self):
+        """Redraw the overlay twice a second while it is shown"""
+        self.perf_overlay.config(text=self.timings.report() + "\n(ms)")
+        self._perf_refresh = self.root.after(500, self._refresh_perf_overlay)
+        
+    def toggle_profiling(self):
+        """Start a cProfile capture, or stop it and write it to disk"""
+        if self.profiling.get():
+            self.profile.start()
+            self.status_label.config(text="Profiling | Use View > Profile Main Thread again to stop")
+            return
+        if not self.profile.active:
+            return
+        try:
+            path = self.profile.stop()
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to write profile: {str(e)}")
+            return
+        self.status_label.config(text=f"Ready | Profile written to {path}")
+        
+    def set_status(self, text):
+        """Update the status bar, safe to call from worker threads"""
+        self.ui.post(self.status_label.config, text=text)
         
     def update_ai_output(self, text):
-        """Update AI output area"""
-        self.ai_output.config(state=tk.NORMAL)
-        self.ai_output.insert(tk.END, text)
-        self.ai_output.see(tk.END)
-        self.ai_output.config(state=tk.DISABLED)
-        self.root.update_idletasks()
+        """Update AI output area, safe to call from worker threads"""
+        self.ui.post_text(self._write_ai_output, text)
+        
+    def _write_ai_output(self, text):
+        """Append to the AI output area, main thread only"""
+        self.output_log.append(text)
         
     def clear_ai_output(self):
-        """Clear AI output area"""
-        self.ai_output.config(state=tk.NORMAL)
-        self.ai_output.delete(1.0, tk.END)
-        self.ai_output.config(state=tk.DISABLED)
+        """Clear AI output area, the transcript on disk keeps it"""
+        self.output_log.clear()
+        
+    def load_earlier_output(self):
+        """Page the previous part of the transcript back into the output area"""
+        if not self.output_log.page_back():
+            self.status_label.config(text="Ready | Start of the transcript")
+        
+    def _window_ready(self):
+        """First idle callback: start background imports, note startup milestones"""
+        if self.startup is not None:
+            self.root.wait_visibility()
+            self.root.update_idletasks()
+            self.startup.mark('first paint')
+        self.preload_modules()
+        if self.startup is not None:
+            self.root.after(1, self._startup_interactive)
+            
+    def preload_modules(self):
+        """Import BACKGROUND_IMPORTS on a daemon thread"""
+        def load():
+            for name in BACKGROUND_IMPORTS:
+                try:
+                    importlib.import_module(name)
+                except ImportError:
+                    # Reported when the feature is used
+                    pass
+                    
+        self._preload_thread = threading.Thread(target=load, name='preload', daemon=True)
+        self._preload_thread.start()
+        
+    def _startup_interactive(self):
+        """The event loop is running timers again: the editor can take input"""
+        self.startup.mark('interactive')
+        self._startup_finish()
+        
+    def _startup_finish(self):
+        """Wait for the background imports, then report and quit"""
+        if self._preload_thread.is_alive():
+            self.root.after(20, self._startup_finish)
+            return
+        self.startup.mark('background imports')
+        self.root.quit()
         
     def run(self):
         """Start the application"""
         self.root.mainloop()
+        self.jobs.shutdown()
+        self.saver.shutdown()
+        self.search_worker.shutdown(wait=False, cancel_futures=True)
+        self.diagnostics.shutdown()
+        self.output_log.store.close()
 
 if __name__ == "__main__":
-    # Check if google-generativeai is installed
+    parser = argparse.ArgumentParser(description="AI code editor")
+    parser.add_argument('--startup-time', action='store_true',
+                        help="print time to first paint and to interactive, then exit")
+    parser.add_argument('--startup-budget', type=float, metavar='MS',
+                        help="with --startup-time, exit with status 1 if time to interactive exceeds MS")
+    parser.add_argument('--batch', nargs=argparse.REMAINDER, metavar='ACTION PATH',
+                        help="run a code action over files without the GUI (--batch -h for its options)")
+    args = parser.parse_args()
+    
+    if args.batch is not None:
+        from batch import main
+        sys.exit(main(args.batch))
+    
+    # The AI SDK is only needed for AI features and is loaded in the background
     try:
-        import google.generativeai
-    except ImportError:
-        print("Please install the required package:")
+        sdk_installed = importlib.util.find_spec('google.generativeai') is not None
+    except ModuleNotFoundError:
+        sdk_installed = False
+    if not sdk_installed:
+        print("google-generativeai is not installed, AI features need:")
         print("pip install google-generativeai")
-        exit(1)
     
-    app = AICodeEditor()
+    startup = None
+    if args.startup_time:
+        startup = StartupTimer(STARTED)
+        startup.mark('imports')
+    app = AICodeEditor(startup)
     app.run()
+    
+    if startup is not None:
+        print(startup.report())
+        if args.startup_budget is not None and startup.marks['interactive'] > args.startup_budget:
+            print(f"Over the startup budget of {args.startup_budget:.0f} ms")
+            sys.exit(1)
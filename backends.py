@@ -0,0 +1,264 @@
+"""AI backends behind one small interface
+
+The editor only talks to an AIBackend: generate() for a whole response,
+stream() for text pieces as they arrive, chat_stream() for a reply that
+follows earlier turns, and async variants of the first two. A backend
+holds one client for its whole life, so connections are reused across
+requests, and retries rate-limited or temporarily unavailable calls with
+exponential backoff.
+
+GeminiBackend wraps google-generativeai, imported only when the backend is
+created since the SDK takes a while to load (asyncio is likewise only imported
+by the async methods). FakeBackend is deterministic and
+offline, with configurable latency and chunking, for trying the streaming
+path without a key and for measuring the AI pipeline without a network.
+"""
+import random
+import time
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+
+DEFAULT_GEMINI_MODEL = 'gemini-2.0-flash-exp'
+
+# Exception class names (google.api_core and HTTP clients) worth retrying
+RETRYABLE_ERRORS = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable',
+    'InternalServerError', 'DeadlineExceeded', 'RateLimited',
+}
+
+
+class RateLimited(Exception):
+    """Raised by FakeBackend to simulate a 429"""
+
+
+def is_retryable(error):
+    """True for rate limits and transient server errors"""
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    return getattr(error, 'code', None) in (429, 500, 503)
+
+
+class RetryPolicy(NamedTuple):
+    """Exponential backoff with jitter: base, 2*base, 4*base... capped at max_delay"""
+    retries: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number attempt (0-based)"""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+
+class AIBackend(ABC):
+    """Base class: subclasses implement _generate and _stream"""
+
+    name = 'backend'
+
+    def __init__(self, retry=None, on_retry=None):
+        self.retry = retry or RetryPolicy()
+        # on_retry(attempt, delay, error) is told about every backoff
+        self.on_retry = on_retry
+
+    @abstractmethod
+    def _generate(self, prompt, timeout):
+        """Whole response text, one attempt"""
+
+    @abstractmethod
+    def _stream(self, prompt, timeout):
+        """Iterator of response pieces, one attempt"""
+
+    def _chat_stream(self, history, message, timeout):
+        """Reply to message after history, for backends without a chat API"""
+        turns = [f"{role}: {text}" for role, text in history]
+        turns.append(f"user: {message}")
+        return self._stream('\n\n'.join(turns) + '\n\nmodel:', timeout)
+
+    def _backoff(self, attempt, error, deadline):
+        """Delay before the next attempt, or None to give up and re-raise"""
+        if attempt >= self.retry.retries or not is_retryable(error):
+            return None
+        delay = self.retry.delay(attempt)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        if self.on_retry:
+            self.on_retry(attempt + 1, delay, error)
+        return delay
+
+    def generate(self, prompt, timeout=None):
+        """Whole response text, retrying transient failures"""
+        deadline = time.monotonic() + timeout if timeout else None
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic() if deadline else None
+            try:
+                return self._generate(prompt, remaining)
+            except Exception as e:
+                delay = self._backoff(attempt, e, deadline)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    def stream(self, prompt, timeout=None):
+        """Yield the response in pieces as they arrive
+
+        Failures before the first piece are retried; once text has been
+        handed out a retry would duplicate it, so later errors propagate.
+        """
+        return self._retry_stream(lambda remaining: self._stream(prompt, remaining), timeout)
+
+    def chat_stream(self, history, message, timeout=None):
+        """stream() the reply to message in a conversation
+
+        history is the earlier turns as (role, text) pairs, role being 'user'
+        or 'model' and starting with 'user'.
+        """
+        return self._retry_stream(lambda remaining: self._chat_stream(history, message, remaining), timeout)
+
+    def _retry_stream(self, pieces, timeout):
+        deadline = time.monotonic() + timeout if timeout else None
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic() if deadline else None
+            started = False
+            try:
+                for text in pieces(remaining):
+                    started = True
+                    yield text
+                return
+            except Exception as e:
+                delay = None if started else self._backoff(attempt, e, deadline)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def agenerate(self, prompt, timeout=None):
+        """generate() without blocking the event loop"""
+        import asyncio
+
+        return await asyncio.to_thread(self.generate, prompt, timeout)
+
+    async def astream(self, prompt, timeout=None):
+        """stream() as an async iterator, pulling pieces on a worker thread"""
+        import asyncio
+
+        pieces = self.stream(prompt, timeout)
+        done = object()
+        while True:
+            text = await asyncio.to_thread(next, pieces, done)
+            if text is done:
+                return
+            yield text
+
+
+class GeminiBackend(AIBackend):
+    """Google Gemini through one GenerativeModel shared by all requests"""
+
+    def __init__(self, api_key, model_name=DEFAULT_GEMINI_MODEL, **kwargs):
+        super().__init__(**kwargs)
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    @staticmethod
+    def _options(timeout):
+        return {'request_options': {'timeout': timeout}} if timeout else {}
+
+    def _generate(self, prompt, timeout):
+        return self.model.generate_content(prompt, **self._options(timeout)).text
+
+    def _stream(self, prompt, timeout):
+        return self._texts(self.model.generate_content(prompt, stream=True, **self._options(timeout)))
+
+    def _chat_stream(self, history, message, timeout):
+        # The SDK's chat object only holds the history, so a fresh one per
+        # turn lets the caller trim and summarize it freely
+        chat = self.model.start_chat(history=[{'role': role, 'parts': [text]} for role, text in history])
+        return self._texts(chat.send_message(message, stream=True, **self._options(timeout)))
+
+    @staticmethod
+    def _texts(response):
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts, e.g. the final one carrying only the finish reason
+                continue
+            if text:
+                yield text
+
+    async def agenerate(self, prompt, timeout=None):
+        """Native async call, with the same backoff as generate()"""
+        import asyncio
+
+        deadline = time.monotonic() + timeout if timeout else None
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic() if deadline else None
+            try:
+                response = await self.model.generate_content_async(prompt, **self._options(remaining))
+                return response.text
+            except Exception as e:
+                delay = self._backoff(attempt, e, deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+DEFAULT_FAKE_RESPONSE = '''Here is a response generated offline.
+
+```python
+def example(values):
+    """Return the sum of the squares of values"""
+    return sum(value * value for value in values)
+```
+
+The prompt was {length} characters long.
+'''
+
+
+class FakeBackend(AIBackend):
+    """Deterministic offline backend that replays a canned response in chunks
+
+    Set AI_EDITOR_FAKE_MODEL=1 to run the editor against it. fail_first makes
+    the first calls raise RateLimited, to exercise the retry path.
+    """
+
+    name = 'fake'
+
+    def __init__(self, response=None, chunk_size=16, first_token_delay=0.4, chunk_delay=0.03,
+                 fail_first=0, **kwargs):
+        kwargs.setdefault('retry', RetryPolicy(base_delay=0.05, max_delay=0.5))
+        super().__init__(**kwargs)
+        self.response = response
+        self.chunk_size = chunk_size
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.fail_first = fail_first
+        self.calls = 0
+
+    def _text(self, prompt):
+        self.calls += 1
+        if self.calls <= self.fail_first:
+            raise RateLimited(f"Simulated rate limit ({self.calls} of {self.fail_first})")
+        if self.response is not None:
+            return self.response
+        return DEFAULT_FAKE_RESPONSE.format(length=len(prompt))
+
+    def _generate(self, prompt, timeout):
+        text = self._text(prompt)
+        time.sleep(self.first_token_delay)
+        return text
+
+    def _stream(self, prompt, timeout):
+        text = self._text(prompt)
+        time.sleep(self.first_token_delay)
+        for start in range(0, len(text), self.chunk_size):
+            if start:
+                time.sleep(self.chunk_delay)
+            yield text[start:start + self.chunk_size]
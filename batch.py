@@ -0,0 +1,361 @@
+"""Headless runs of the code actions over many files
+
+Usage:
+    python app.py --batch ACTION PATH... [--output results.jsonl] [--patches DIR]
+        [--concurrency 4] [--rpm 60] [--resume] [--fake]
+
+ACTION is explain, fix or optimize, with the same prompts as the editor's AI
+menu; PATH is a file or a directory searched for .py files. Requests run on
+a few asyncio workers sharing one throttle: an optional requests-per-minute
+cap, and a slowdown whenever the backend reports a rate limit, so a long
+run settles at what the quota allows instead of hammering it.
+
+Every file gets one JSON line in --output as soon as it is done, with its
+latency. That file is also the checkpoint: --resume skips the files that
+already have a successful line for the same content, action and model, so
+an interrupted run picks up where it stopped. --patches writes a unified
+diff per file for fix and optimize, at the file's path mirrored under DIR.
+Responses go through the editor's response cache, so files that did not
+change since an earlier run cost nothing. A summary of throughput and
+latency is printed at the end.
+"""
+import argparse
+import asyncio
+import difflib
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+from backends import FakeBackend, GeminiBackend, is_retryable
+from codeblocks import parse_blocks, pick_code
+from context import estimate_tokens
+from diagnostics import analyze, summarize
+from prompts import CODE_ACTIONS, PROBLEMS_NOTE
+from response_cache import ResponseCache
+from symbols import iter_python_files
+
+# Longest wait between requests the throttle slows down to after rate limits
+MAX_INTERVAL = 60.0
+
+
+def collect_files(paths):
+    """(path, name) of every file to process, once each
+
+    name is the path as given (or found under a directory given), normalized;
+    it identifies the file in the results and the checkpoint.
+    """
+    files = []
+    seen = set()
+    for path in paths:
+        found = iter_python_files(path) if os.path.isdir(path) else [path]
+        for file_path in found:
+            key = os.path.normcase(os.path.abspath(file_path))
+            if key not in seen:
+                seen.add(key)
+                files.append((file_path, os.path.normpath(file_path)))
+    return files
+
+
+def patch_name(name):
+    """Relative path mirroring name, for its patch and diff headers
+
+    Names that are absolute or climb out of the working directory are
+    mirrored by their absolute path, minus the drive and root.
+    """
+    if os.path.isabs(name) or name.split(os.sep)[0] == os.pardir:
+        name = os.path.splitdrive(os.path.abspath(name))[1].lstrip(os.sep)
+    return name
+
+
+def build_prompt(name, source):
+    """Prompt for a code action on a whole file, and the text its cache key covers
+
+    As in the editor, Fix is told what the local checks found.
+    """
+    problems = ""
+    if name == 'fix':
+        summary = summarize(analyze(source).diagnostics)
+        if summary:
+            problems = PROBLEMS_NOTE.format(summary=summary)
+    return CODE_ACTIONS[name].template.format(code=source, problems=problems), source + problems
+
+
+def checkpoint_key(record):
+    return (record.get('path'), record.get('action'), record.get('model'), record.get('digest'))
+
+
+def load_checkpoint(path):
+    """Keys of the files an earlier run of path finished successfully"""
+    done = set()
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line of an interrupted run may be cut short
+                    continue
+                if record.get('status') == 'ok':
+                    done.add(checkpoint_key(record))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def make_patch(source, code, name):
+    """Unified diff turning source into code, '' if they are the same"""
+    def lines(text):
+        return (text if text.endswith('\n') else text + '\n').splitlines(keepends=True)
+    return ''.join(difflib.unified_diff(lines(source), lines(code), f'a/{name}', f'b/{name}'))
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Throttle:
+    """Spacing between requests shared by all workers
+
+    interval starts at 60/rpm (or 0), doubles whenever the backend reports a
+    rate limit, and creeps back down with every success. A rate limit also
+    holds every worker back for the backoff the backend chose.
+    """
+
+    def __init__(self, rpm=None):
+        self.base = 60.0 / rpm if rpm else 0.0
+        self.interval = self.base
+        self.rate_limits = 0
+        self._next = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    async def wait(self):
+        """Return once this worker may send its request"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                start = max(self._next, self._paused_until)
+                if start <= now:
+                    self._next = now + self.interval
+                    return
+            await asyncio.sleep(start - now)
+
+    def rate_limited(self, delay):
+        """Backend retry hook, called from whichever thread hit the limit"""
+        with self._lock:
+            self.rate_limits += 1
+            self.interval = min(MAX_INTERVAL, max(self.interval * 2, 1.0))
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    def succeeded(self):
+        with self._lock:
+            self.interval = max(self.base, self.interval * 0.9)
+            if self.interval < self.base + 0.01:
+                self.interval = self.base
+
+
+class BatchRunner:
+    """Runs one code action over a list of files and records the results"""
+
+    def __init__(self, backend, action, output, patches=None, concurrency=4, throttle=None,
+                 cache=None, timeout=120.0, max_tokens=30000, done=frozenset(), log=sys.stderr):
+        self.backend = backend
+        self.action = action
+        self.output = output
+        self.patches = patches
+        self.concurrency = concurrency
+        self.throttle = throttle or Throttle()
+        self.cache = cache
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.done = done
+        self.log = log
+        self.counts = {'ok': 0, 'cached': 0, 'resumed': 0, 'skipped': 0, 'error': 0}
+        self.latencies = []
+        self.prompt_tokens = 0
+        self.started = None
+        self.finished = 0
+        self.total = 0
+
+    async def run(self, files):
+        self.started = time.monotonic()
+        self.total = len(files)
+        queue = asyncio.Queue()
+        for item in files:
+            queue.put_nowait(item)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(max(1, self.concurrency))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def _worker(self, queue):
+        while not queue.empty():
+            path, name = queue.get_nowait()
+            record = await self._process(path, name)
+            if record is not None:
+                self._write(record)
+
+    async def _process(self, path, name):
+        """Result record for one file, None if an earlier run already did it"""
+        record = {'path': name, 'action': self.action, 'model': self.backend.name}
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                source = file.read()
+        except (OSError, UnicodeDecodeError) as e:
+            return self._failed(record, e)
+        record['digest'] = hashlib.sha256(source.encode('utf-8')).hexdigest()
+        if checkpoint_key(record) in self.done:
+            self.counts['resumed'] += 1
+            self.total -= 1
+            return None
+
+        # Analysis and the cache's SQLite calls block, keep them off the event loop
+        prompt, cache_code = await asyncio.to_thread(build_prompt, self.action, source)
+        record['prompt_tokens'] = estimate_tokens(prompt)
+        if not source.strip() or record['prompt_tokens'] > self.max_tokens:
+            record['status'] = 'skipped'
+            record['reason'] = 'empty' if not source.strip() else f"over {self.max_tokens} tokens"
+            self.counts['skipped'] += 1
+            return record
+
+        template = CODE_ACTIONS[self.action].template
+        cache_key = ResponseCache.key(self.backend.name, template, cache_code)
+        response = await asyncio.to_thread(self.cache.get, cache_key) if self.cache is not None else None
+        record['cached'] = response is not None
+        started = time.monotonic()
+        if response is None:
+            await self.throttle.wait()
+            started = time.monotonic()
+            try:
+                response = await self.backend.agenerate(prompt, timeout=self.timeout)
+            except Exception as e:
+                if is_retryable(e):
+                    self.throttle.rate_limited(0)
+                return self._failed(record, e, time.monotonic() - started)
+            if not response.strip():
+                # Typically a blocked response; not done, so --resume retries it
+                return self._failed(record, ValueError("empty response"), time.monotonic() - started)
+            self.throttle.succeeded()
+            self.latencies.append(time.monotonic() - started)
+            self.prompt_tokens += record['prompt_tokens']
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put, cache_key, response)
+        record['latency'] = round(time.monotonic() - started, 3)
+        record['status'] = 'ok'
+        record['response'] = response
+        self.counts['cached' if record['cached'] else 'ok'] += 1
+
+        if self.patches and self.action in ('fix', 'optimize'):
+            code = pick_code(parse_blocks(response))
+            mirrored = patch_name(name)
+            patch = make_patch(source, code, mirrored.replace(os.sep, '/')) if code else ''
+            if patch:
+                patch_path = os.path.join(self.patches, mirrored + '.patch')
+                os.makedirs(os.path.dirname(patch_path), exist_ok=True)
+                with open(patch_path, 'w', encoding='utf-8') as file:
+                    file.write(patch)
+                record['patch'] = patch_path
+        return record
+
+    def _failed(self, record, error, latency=None):
+        record['status'] = 'error'
+        record['error'] = f"{type(error).__name__}: {error}"
+        if latency is not None:
+            record['latency'] = round(latency, 3)
+        self.counts['error'] += 1
+        return record
+
+    def _write(self, record):
+        """Append a record and flush, so an interruption loses nothing finished"""
+        record['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.output.write(json.dumps(record) + '\n')
+        self.output.flush()
+        self.finished += 1
+        latency = f" {record['latency']:.1f} s" if 'latency' in record else ''
+        print(f"[{self.finished}/{self.total}] {record['status']:<7} {record['path']}{latency}", file=self.log)
+
+    def summary(self):
+        """Throughput and latency of the run so far"""
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        counts = ', '.join(f"{name} {count}" for name, count in self.counts.items() if count)
+        lines = [f"Files: {sum(self.counts.values())} ({counts or 'none'})"]
+        processed = self.counts['ok'] + self.counts['cached']
+        if processed and elapsed > 0:
+            lines.append(f"Wall time {elapsed:.1f} s, {processed / elapsed * 60:.1f} files/min, "
+                         f"~{self.prompt_tokens / elapsed:.0f} prompt tokens/s")
+        if self.latencies:
+            lines.append(f"Latency per request: p50 {percentile(self.latencies, 0.5):.2f} s, "
+                         f"p95 {percentile(self.latencies, 0.95):.2f} s, max {max(self.latencies):.2f} s")
+        if self.throttle.rate_limits:
+            lines.append(f"Rate limited {self.throttle.rate_limits} times, "
+                         f"ended at one request per {self.throttle.interval:.1f} s")
+        return '\n'.join(lines)
+
+
+def make_backend(args, throttle):
+    """The backend asked for, with retries reported to the throttle; None on error"""
+    if args.fake or os.environ.get('AI_EDITOR_FAKE_MODEL'):
+        backend = FakeBackend(first_token_delay=0.2, chunk_delay=0)
+    else:
+        api_key = args.api_key or os.environ.get('GEMINI_API_KEY') or os.environ.get('GOOGLE_API_KEY')
+        if not api_key:
+            print("No API key: pass --api-key or set GEMINI_API_KEY (or use --fake)", file=sys.stderr)
+            return None
+        try:
+            backend = GeminiBackend(api_key)
+        except ImportError:
+            print("The Gemini SDK is not installed, run:\npip install google-generativeai", file=sys.stderr)
+            return None
+    backend.on_retry = lambda attempt, delay, error: throttle.rate_limited(delay)
+    return backend
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='app.py --batch', description=__doc__.splitlines()[0])
+    parser.add_argument('action', choices=sorted(CODE_ACTIONS))
+    parser.add_argument('paths', nargs='+', help='files, or directories to search for .py files')
+    parser.add_argument('--output', default='batch-results.jsonl', help='JSONL results, also the checkpoint')
+    parser.add_argument('--patches', metavar='DIR', help='write a .patch per file (fix and optimize)')
+    parser.add_argument('--resume', action='store_true', help='skip files --output already has results for')
+    parser.add_argument('--concurrency', type=int, default=4, help='requests in flight at once')
+    parser.add_argument('--rpm', type=float, help='at most this many requests per minute')
+    parser.add_argument('--timeout', type=float, default=120.0, help='seconds per request, retries included')
+    parser.add_argument('--max-tokens', type=int, default=30000, help='skip files whose prompt is bigger')
+    parser.add_argument('--no-cache', action='store_true', help='ignore the response cache')
+    parser.add_argument('--api-key', help='Gemini API key, defaults to $GEMINI_API_KEY')
+    parser.add_argument('--fake', action='store_true', help='use the offline fake model')
+    args = parser.parse_args(argv)
+
+    throttle = Throttle(args.rpm)
+    backend = make_backend(args, throttle)
+    if backend is None:
+        return 2
+    files = collect_files(args.paths)
+    done = load_checkpoint(args.output) if args.resume else frozenset()
+    cache = None if args.no_cache else ResponseCache()
+
+    with open(args.output, 'a' if args.resume else 'w', encoding='utf-8') as output:
+        runner = BatchRunner(backend, args.action, output, args.patches, args.concurrency, throttle,
+                             cache, args.timeout, args.max_tokens, done)
+        interrupted = False
+        try:
+            asyncio.run(runner.run(files))
+        except KeyboardInterrupt:
+            interrupted = True
+        print(runner.summary(), file=sys.stderr)
+    if interrupted:
+        print(f"Interrupted; run again with --resume to continue from {args.output}", file=sys.stderr)
+        return 130
+    return 1 if runner.counts['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
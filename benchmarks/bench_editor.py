@@ -0,0 +1,263 @@
+"""Latency of the editor's hot paths, measured on the real AICodeEditor
+
+Usage:
+    xvfb-run python benchmarks/bench_editor.py [--sizes 1000 10000 100000]
+        [--keystrokes 200] [--output results.json] [--compare baseline.json]
+
+Needs a display (Xvfb is fine). For each size a generated module is opened
+through open_file, then typing, pasting and scrolling sessions are replayed
+against the editor's Text widget. Every call of highlight_syntax,
+update_line_numbers and open_file is timed, along with the end-to-end cost of
+each keystroke, paste and scroll step (edit plus the update jobs it causes).
+Results are printed as p50/p95/p99 and can be written to JSON; --compare
+prints the p95 change against an earlier JSON file.
+
+The editor's cache directory is pointed at a temporary directory so the run
+neither reads nor pollutes the real response cache, journal or index.
+"""
+import argparse
+import functools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_highlight import generate_source  # noqa: E402
+
+# Methods of AICodeEditor whose every call is timed
+TIMED_METHODS = ('highlight_syntax', 'update_line_numbers', 'open_file')
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    rank = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def summarize(samples):
+    """n, p50/p95/p99, mean and max of a list of milliseconds"""
+    if not samples:
+        return {'n': 0}
+    return {
+        'n': len(samples),
+        'p50': percentile(samples, 0.50),
+        'p95': percentile(samples, 0.95),
+        'p99': percentile(samples, 0.99),
+        'mean': sum(samples) / len(samples),
+        'max': max(samples),
+    }
+
+
+class Recorder:
+    """Collects wall-clock samples in milliseconds under a metric name"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, name, milliseconds):
+        self.samples.setdefault(name, []).append(milliseconds)
+
+    def wrap(self, cls, name):
+        """Time every call of cls.name, installed on the class so bound
+        references taken in __init__ (e.g. by the change scheduler) are timed too"""
+        original = getattr(cls, name)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(name, (time.perf_counter() - started) * 1000)
+
+        setattr(cls, name, timed)
+
+    def take(self):
+        """Summaries of everything recorded so far, then start over"""
+        summary = {name: summarize(values) for name, values in sorted(self.samples.items())}
+        self.samples = {}
+        return summary
+
+
+def settle(editor):
+    """Let the editor finish the work an edit queued: timers, jobs, redraws"""
+    editor.change_scheduler.flush()
+    editor.root.update()
+
+
+def open_session(editor, recorder, path):
+    """Open a file through the File > Open path and wait until it is all in"""
+    import app
+
+    original = app.filedialog.askopenfilename
+    app.filedialog.askopenfilename = lambda **kwargs: path
+    try:
+        started = time.perf_counter()
+        editor.open_file()
+        while editor.file_loader is not None:
+            editor.root.update()
+        settle(editor)
+        recorder.add('open_complete', (time.perf_counter() - started) * 1000)
+    finally:
+        app.filedialog.askopenfilename = original
+
+
+def typing_session(editor, recorder, keystrokes, rng):
+    """Type characters and newlines in the middle of the buffer"""
+    text = editor.code_text
+    lines = int(text.index('end-1c').split('.')[0])
+    text.mark_set('insert', f'{lines // 2}.0')
+    text.see('insert')
+    settle(editor)
+    for i in range(keystrokes):
+        char = '\n' if i % 40 == 39 else rng.choice('abcdefghijklmnopqrstuvwxyz _().:"#')
+        started = time.perf_counter()
+        text.insert('insert', char)
+        settle(editor)
+        recorder.add('keystroke', (time.perf_counter() - started) * 1000)
+
+
+def paste_session(editor, recorder, block, pastes, rng):
+    """Paste a block of code at random lines"""
+    text = editor.code_text
+    for _ in range(pastes):
+        lines = int(text.index('end-1c').split('.')[0])
+        line = rng.randint(1, lines)
+        text.mark_set('insert', f'{line}.0')
+        text.see('insert')
+        started = time.perf_counter()
+        text.insert('insert', block)
+        settle(editor)
+        recorder.add('paste', (time.perf_counter() - started) * 1000)
+
+
+def scroll_session(editor, recorder, steps):
+    """Page down from the top, then jump around"""
+    text = editor.code_text
+    text.yview_moveto(0)
+    settle(editor)
+    for i in range(steps):
+        started = time.perf_counter()
+        if i % 10 == 9:
+            text.yview_moveto((i * 37 % 100) / 100)
+        else:
+            text.yview_scroll(1, 'pages')
+        settle(editor)
+        recorder.add('scroll', (time.perf_counter() - started) * 1000)
+
+
+def git_commit():
+    """Commit the tree is at, if it is a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(f"{'lines':>8} {'metric':<20} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for size, metrics in results['sizes'].items():
+        for name, stats in metrics.items():
+            if not stats['n']:
+                continue
+            print(f"{size:>8} {name:<20} {stats['n']:>6} {stats['p50']:>9.2f} "
+                  f"{stats['p95']:>9.2f} {stats['p99']:>9.2f}")
+
+
+def print_comparison(results, baseline):
+    """p95 of this run against a baseline JSON file"""
+    print(f"\nAgainst {baseline.get('commit') or 'baseline'} (p95):")
+    for size, metrics in results['sizes'].items():
+        for name, stats in metrics.items():
+            old = baseline.get('sizes', {}).get(size, {}).get(name)
+            if not old or not old.get('n') or not stats['n']:
+                continue
+            change = (stats['p95'] - old['p95']) / old['p95'] * 100 if old['p95'] else 0.0
+            print(f"{size:>8} {name:<20} {old['p95']:>9.2f} -> {stats['p95']:>9.2f} ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--keystrokes', type=int, default=200)
+    parser.add_argument('--pastes', type=int, default=20)
+    parser.add_argument('--scrolls', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--withdraw', action='store_true',
+                        help='keep the window unmapped (no viewport, so cheaper paints)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-editor-')
+    os.environ['XDG_CACHE_HOME'] = os.path.join(workdir, 'cache')
+    os.environ.pop('AI_EDITOR_FAKE_MODEL', None)
+
+    from app import AICodeEditor
+
+    recorder = Recorder()
+    for name in TIMED_METHODS:
+        recorder.wrap(AICodeEditor, name)
+    editor = AICodeEditor()
+    if args.withdraw:
+        editor.root.withdraw()
+    editor.root.update()
+    rng = random.Random(args.seed)
+    block = generate_source(200)
+
+    results = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'tk': editor.root.tk.call('info', 'patchlevel'),
+        'withdrawn': args.withdraw,
+        'sizes': {},
+    }
+    for size in args.sizes:
+        path = os.path.join(workdir, f'bench_{size}.py')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(generate_source(size))
+        recorder.take()
+
+        open_session(editor, recorder, path)
+        typing_session(editor, recorder, args.keystrokes, rng)
+        paste_session(editor, recorder, block, args.pastes, rng)
+        scroll_session(editor, recorder, args.scrolls)
+        results['sizes'][str(size)] = recorder.take()
+
+        # Discard the edits and start the next size from a fresh tab
+        editor.document.saved_revision = editor.document.edit_revision
+        editor.close_file()
+        editor.root.update()
+
+    editor.root.destroy()
+    editor.jobs.shutdown()
+    editor.saver.shutdown()
+    editor.search_worker.shutdown()
+    editor.diagnostics.shutdown()
+
+    print_results(results)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            print_comparison(results, json.load(file))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Compare the old full-buffer highlighter with the single-pass tokenizer
+
+Usage:
+    python benchmarks/bench_highlight.py [--sizes 1000 10000 100000] [--tk]
+
+The default run is headless and times only the regex work of both
+implementations. With --tk (needs a display) the tags are applied to a real
+Text widget as well: the old code with one tag_add per match, the new one as a
+viewport paint followed by a single keystroke.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from highlighter import IncrementalHighlighter, get_tokenizer  # noqa: E402
+
+# Same list as AICodeEditor.keywords
+KEYWORDS = [
+    'def', 'class', 'if', 'elif', 'else', 'for', 'while', 'try', 'except',
+    'finally', 'with', 'import', 'from', 'as', 'return', 'yield', 'lambda',
+    'and', 'or', 'not', 'in', 'is', 'True', 'False', 'None', 'pass',
+    'break', 'continue', 'global', 'nonlocal', 'async', 'await'
+]
+
+COLORS = {
+    'keyword': '#569cd6',
+    'string': '#ce9178',
+    'comment': '#6a9955',
+    'function': '#dcdcaa',
+    'number': '#b5cea8',
+    'operator': '#ffffff'
+}
+
+SNIPPET = '''\
+class Widget{n}(object):
+    """Docstring for widget {n}
+    spanning two lines"""
+
+    def method_{n}(self, value=None):
+        # Scale the value unless it is missing
+        if value is None:
+            return 'default {n}'
+        for i in range({n}):
+            value = value * 2.5 + i
+        return "result: %s" % value
+
+'''
+
+
+def generate_source(lines):
+    """Synthetic Python module with roughly the given number of lines"""
+    per_block = SNIPPET.count('\n')
+    return ''.join(SNIPPET.format(n=n) for n in range(lines // per_block + 1))
+
+
+def legacy_spans(content):
+    """The regex passes of the old highlight_syntax, without the Tk calls"""
+    spans = []
+    for keyword in KEYWORDS:
+        pattern = r'\b' + re.escape(keyword) + r'\b'
+        for match in re.finditer(pattern, content):
+            spans.append(('keyword', match.start(), match.end()))
+    for match in re.finditer(r'(["\'])(?:(?=(\\?))\2.)*?\1', content):
+        spans.append(('string', match.start(), match.end()))
+    for match in re.finditer(r'#.*$', content, re.MULTILINE):
+        spans.append(('comment', match.start(), match.end()))
+    for match in re.finditer(r'\b\d+\.?\d*\b', content):
+        spans.append(('number', match.start(), match.end()))
+    return spans
+
+
+def tokenizer_spans(content):
+    """All spans of the single-pass tokenizer"""
+    tokenizer = get_tokenizer(tuple(KEYWORDS))
+    return [span for _, line_spans in tokenizer.tokenize(content) for span in line_spans]
+
+
+def legacy_tk(text, content):
+    """Old highlight_syntax against a real widget"""
+    for tag in COLORS:
+        text.tag_delete(tag)
+    for tag, color in COLORS.items():
+        text.tag_configure(tag, foreground=color)
+    for tag, start, end in legacy_spans(content):
+        text.tag_add(tag, f"1.0+{start}c", f"1.0+{end}c")
+
+
+def timed(func, *args):
+    """Best of three wall-clock runs in milliseconds"""
+    best = None
+    for _ in range(3):
+        started = time.perf_counter()
+        func(*args)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_headless(sizes):
+    print(f"{'lines':>8} {'legacy ms':>12} {'tokenizer ms':>14} {'speedup':>9}")
+    for size in sizes:
+        content = generate_source(size)
+        legacy = timed(legacy_spans, content)
+        new = timed(tokenizer_spans, content)
+        print(f"{size:>8} {legacy:>12.1f} {new:>14.1f} {legacy / new:>8.1f}x")
+
+
+def run_tk(sizes):
+    import tkinter as tk
+
+    root = tk.Tk()
+    root.withdraw()
+    print(f"{'lines':>8} {'legacy ms':>12} {'paint ms':>10} {'keystroke ms':>14}")
+    for size in sizes:
+        content = generate_source(size)
+        text = tk.Text(root, width=100, height=50)
+        text.insert('1.0', content)
+        text.update_idletasks()
+
+        legacy = timed(legacy_tk, text, content)
+
+        for tag in COLORS:
+            text.tag_delete(tag)
+        highlighter = IncrementalHighlighter(text, COLORS, KEYWORDS)
+        paint = timed(highlighter.paint)
+
+        def keystroke():
+            text.insert('10.0', 'x')
+            highlighter.on_edit(9, 0, 0)
+            highlighter.paint()
+
+        stroke = timed(keystroke)
+        print(f"{size:>8} {legacy:>12.1f} {paint:>10.1f} {stroke:>14.2f}")
+        text.destroy()
+    root.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--tk', action='store_true', help='also time tagging a real Text widget')
+    args = parser.parse_args()
+
+    run_headless(args.sizes)
+    if args.tk:
+        print()
+        run_tk(args.sizes)
+
+
+if __name__ == '__main__':
+    main()
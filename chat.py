@@ -0,0 +1,260 @@
+"""Conversations with the AI about one file
+
+A ChatSession sends the buffer in full on its first turn only. Later
+messages carry a unified diff of what changed since the model last saw the
+code, or no code at all if nothing did. Earlier turns go along as chat
+history up to a token budget; past it the oldest exchanges are folded into
+a running summary (written by the model, with a local digest as fallback),
+so a long conversation costs about as much per turn as a short one.
+ChatStore keeps a session per file on disk, to carry on after a restart.
+"""
+import difflib
+import glob
+import hashlib
+import json
+import os
+import time
+from typing import NamedTuple, Optional
+
+from context import estimate_tokens
+from prompts import (CHAT_DIFF_PROMPT, CHAT_FULL_PROMPT, CHAT_QUESTION_PROMPT, CHAT_SUMMARY_REPLY,
+                     CHAT_SUMMARY_TURN, SUMMARIZE_CHAT_PROMPT)
+from response_cache import default_cache_dir
+
+# Tokens of earlier turns sent verbatim; older ones are folded into the summary
+HISTORY_TOKENS = 8000
+
+# Send the code in full again when a diff would be more than this share of it
+MAX_DIFF_SHARE = 0.5
+
+# Length the summary is asked to stay under
+SUMMARY_WORDS = 300
+
+
+class ChatMessage(NamedTuple):
+    """Next user turn, built by ChatSession.message()"""
+    text: str
+    query: str
+    # Code the model will have seen once this is sent, None if only an excerpt
+    code: Optional[str]
+    # True if this message carries the code in full
+    full: bool
+    description: str
+    generation: int
+
+
+def code_diff(old, new):
+    """Unified diff from old to new with line numbers of both"""
+    def lines(text):
+        return (text if text.endswith('\n') else text + '\n').splitlines(keepends=True)
+    return ''.join(difflib.unified_diff(lines(old), lines(new), 'before', 'after', n=2))
+
+
+class ChatSession:
+    """Turns of one conversation and the code the model has seen so far"""
+
+    def __init__(self, budget=HISTORY_TOKENS):
+        self.budget = budget
+        # {'role', 'text', 'query', 'tokens'} dicts, oldest first
+        self.turns = []
+        self.summary = ''
+        self.code = None
+        # Index in turns of the message that sent self.code in full
+        self.base_turn = None
+        # Bumped by reset(), so a reply to an abandoned chat is dropped
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.turns)
+
+    def reset(self):
+        """Forget the conversation"""
+        self.turns = []
+        self.summary = ''
+        self.code = None
+        self.base_turn = None
+        self.generation += 1
+
+    def history(self):
+        """(role, text) turns to send ahead of the next message"""
+        history = []
+        if self.summary:
+            history.append(('user', CHAT_SUMMARY_TURN.format(summary=self.summary)))
+            history.append(('model', CHAT_SUMMARY_REPLY))
+        history.extend((turn['role'], turn['text']) for turn in self.turns)
+        return history
+
+    def history_tokens(self):
+        return sum(turn['tokens'] for turn in self.turns) + estimate_tokens(self.summary)
+
+    def message(self, query, code, excerpt=None, related=''):
+        """Message for query, with whatever the model needs to know about code
+
+        code is the whole buffer; pass excerpt instead when the buffer is over
+        the context budget, it is then sent every turn as before.
+        """
+        if excerpt is not None:
+            text = CHAT_FULL_PROMPT.format(code=excerpt or "No code in editor", related=related, query=query)
+            return ChatMessage(text, query, None, True, "code excerpt", self.generation)
+        if self.code is not None:
+            if code == self.code:
+                text = CHAT_QUESTION_PROMPT.format(query=query)
+                return ChatMessage(text, query, code, False, "code unchanged", self.generation)
+            diff = code_diff(self.code, code)
+            if estimate_tokens(diff) <= MAX_DIFF_SHARE * estimate_tokens(code):
+                text = CHAT_DIFF_PROMPT.format(diff=diff, query=query)
+                changed = sum(1 for line in diff.splitlines()[2:] if line[:1] in '+-')
+                return ChatMessage(text, query, code, False, f"diff of {changed} lines", self.generation)
+        text = CHAT_FULL_PROMPT.format(code=code.strip() or "No code in editor", related=related, query=query)
+        return ChatMessage(text, query, code, True, "full code", self.generation)
+
+    def record(self, message, reply):
+        """Add a finished exchange; False if the chat was reset meanwhile or the reply is blank
+
+        A blank reply drops the user turn too, so the history keeps
+        alternating and the code is sent again on the next message.
+        """
+        if message.generation != self.generation or not reply.strip():
+            return False
+        if message.full:
+            self.base_turn = len(self.turns) if message.code is not None else None
+        self.code = message.code
+        self.turns.append({'role': 'user', 'text': message.text, 'query': message.query,
+                           'tokens': estimate_tokens(message.text)})
+        self.turns.append({'role': 'model', 'text': reply, 'query': '', 'tokens': estimate_tokens(reply)})
+        return True
+
+    def needs_compacting(self):
+        return self.history_tokens() > self.budget
+
+    def compact(self, summarize=None):
+        """Fold the oldest exchanges into the summary until half the budget is left
+
+        summarize(prompt) returns the new summary, normally a model call made
+        on a worker thread; if it is missing or fails, a short digest of the
+        questions asked is used instead. Returns the number of turns folded.
+        """
+        generation = self.generation
+        kept = 0
+        count = len(self.turns)
+        while count > 0 and kept + self.turns[count - 1]['tokens'] <= self.budget // 2:
+            count -= 1
+            kept += self.turns[count]['tokens']
+        # Whole exchanges only, so the history still starts with a user turn
+        count += count % 2
+        old = self.turns[:count]
+        if not old:
+            return 0
+
+        summary = None
+        if summarize is not None:
+            conversation = '\n\n'.join(f"{turn['role']}: {turn['text']}" for turn in old)
+            prompt = SUMMARIZE_CHAT_PROMPT.format(
+                words=SUMMARY_WORDS, summary=self.summary or "(none)", conversation=conversation
+            )
+            try:
+                summary = summarize(prompt).strip()
+            except Exception:
+                summary = None
+        if not summary:
+            summary = self._digest(old)
+        if generation != self.generation:
+            return 0
+
+        self.summary = summary
+        del self.turns[:count]
+        if self.base_turn is not None:
+            self.base_turn -= count
+            if self.base_turn < 0:
+                # The full code was folded away, the next message sends it again
+                self.base_turn = None
+                self.code = None
+        return count
+
+    def _digest(self, turns):
+        """Local stand-in for a summary: the questions and how the answers began"""
+        lines = self.summary.splitlines()
+        for turn in turns:
+            if turn['role'] == 'user':
+                lines.append(f"- Asked: {turn['query'][:200]}")
+            else:
+                first = next((line for line in turn['text'].splitlines() if line.strip()), '')
+                lines.append(f"  Answer began: {first[:200]}")
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.budget // 4:
+            del lines[0]
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {'summary': self.summary, 'turns': self.turns, 'code': self.code, 'base_turn': self.base_turn}
+
+    @classmethod
+    def from_dict(cls, data, budget=HISTORY_TOKENS):
+        session = cls(budget)
+        session.summary = data.get('summary', '')
+        session.turns = data.get('turns', [])
+        session.code = data.get('code')
+        session.base_turn = data.get('base_turn')
+        return session
+
+
+class ChatStore:
+    """One JSON file per source file under the cache directory"""
+
+    def __init__(self, directory=None, keep=200):
+        self.directory = directory or os.path.join(default_cache_dir(), 'chats')
+        os.makedirs(self.directory, exist_ok=True)
+        self._prune(keep)
+
+    def _prune(self, keep):
+        """Delete all but the keep most recently used sessions"""
+        paths = glob.glob(os.path.join(self.directory, '*.json'))
+        paths.sort(key=lambda path: os.path.getmtime(path), reverse=True)
+        for path in paths[keep:]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _file(self, path):
+        name = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, name + '.json')
+
+    def load(self, path):
+        """Saved session for the file at path, None if there is none"""
+        if not path:
+            return None
+        try:
+            with open(self._file(path), 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if data.get('path') != os.path.abspath(path):
+            return None
+        return ChatSession.from_dict(data)
+
+    def save(self, path, session):
+        """Write session for the file at path, replacing the old one in one step"""
+        if not path:
+            return
+        data = session.to_dict()
+        data['path'] = os.path.abspath(path)
+        data['updated'] = time.time()
+        target = self._file(path)
+        temporary = f'{target}.{os.getpid()}.tmp'
+        try:
+            with open(temporary, 'w', encoding='utf-8') as file:
+                json.dump(data, file)
+            os.replace(temporary, target)
+        except OSError:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+
+    def delete(self, path):
+        if not path:
+            return
+        try:
+            os.unlink(self._file(path))
+        except OSError:
+            pass
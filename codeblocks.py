@@ -0,0 +1,204 @@
+"""Fenced code blocks in AI responses, and applying one as a minimal diff
+
+FenceParser picks every ``` (or ~~~) block out of a response in one pass,
+whether it gets the whole text or the streamed pieces, and CodeStream uses
+it to hand out generated code line by line as it arrives. diff_edits and
+apply_edits turn the chosen code into line-level replacements of only the
+lines that changed, so applying a fix to a large file touches (and
+re-highlights) just those lines and undoes as a single step.
+"""
+import difflib
+import re
+from typing import NamedTuple
+
+_FENCE = re.compile(r' {0,3}(`{3,}|~{3,})\s*([\w+.#-]*)')
+
+# Info strings that mean Python, or no language at all
+PYTHON_LANGUAGES = ('python', 'py', 'python3', '')
+
+
+class CodeBlock(NamedTuple):
+    """Body of one fenced block, with its language (lower-cased, may be empty)"""
+    language: str
+    code: str
+
+
+class FenceParser:
+    """Collect fenced blocks from text fed in arbitrary pieces"""
+
+    def __init__(self):
+        self.blocks = []
+        self._partial = ''
+        self._fence = None
+        self._language = ''
+        self._lines = []
+
+    def feed(self, text):
+        """Consume a piece of the response, returning blocks it completed"""
+        self._partial += text
+        if '\n' not in self._partial:
+            return []
+        *lines, self._partial = self._partial.split('\n')
+        done = []
+        for line in lines:
+            block = self._line(line)
+            if block is not None:
+                done.append(block)
+        return done
+
+    def finish(self):
+        """End of the response: take the last line and close an unterminated block"""
+        done = []
+        if self._partial:
+            block = self._line(self._partial)
+            self._partial = ''
+            if block is not None:
+                done.append(block)
+        if self._fence is not None:
+            done.append(self._close())
+        return done
+
+    @property
+    def open_language(self):
+        """Language of the block being read, None between blocks"""
+        return self._language if self._fence is not None else None
+
+    @property
+    def open_lines(self):
+        """Lines read so far of the block that is still open"""
+        return self._lines if self._fence is not None else []
+
+    def _line(self, line):
+        if self._fence is None:
+            match = _FENCE.match(line)
+            if match:
+                self._fence = match.group(1)
+                self._language = match.group(2).lower()
+                self._lines = []
+            return None
+        closing = line.strip()
+        if (len(closing) >= len(self._fence) and closing[0] == self._fence[0]
+                and closing == closing[0] * len(closing)):
+            return self._close()
+        self._lines.append(line)
+        return None
+
+    def _close(self):
+        code = '\n'.join(self._lines) + '\n' if self._lines else ''
+        block = CodeBlock(self._language, code)
+        self.blocks.append(block)
+        self._fence = None
+        self._lines = []
+        return block
+
+
+def parse_blocks(text):
+    """Every fenced block in a complete response"""
+    parser = FenceParser()
+    parser.feed(text)
+    parser.finish()
+    return parser.blocks
+
+
+def pick_code(blocks):
+    """The block most likely to be the code to apply: the longest Python one"""
+    candidates = [block for block in blocks if block.language in PYTHON_LANGUAGES and block.code.strip()]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda block: len(block.code)).code
+
+
+class CodeStream:
+    """Code of a streamed response, for inserting while it arrives
+
+    feed() returns the lines of the first Python (or untagged) block as they
+    complete. finish() returns the code to keep: pick_code()'s choice, the
+    first block of another language, or the whole response if it has no
+    fenced block at all. That is usually what was streamed already.
+    """
+
+    def __init__(self):
+        self.parser = FenceParser()
+        # Everything feed() returned
+        self.streamed = ''
+        self._parts = []
+        self._sent = 0
+        self._done = False
+
+    def feed(self, text):
+        """Consume a piece of the response, returning the new lines of code"""
+        self._parts.append(text)
+        self.parser.feed(text)
+        return self._progress()
+
+    def _progress(self):
+        if self._done:
+            return ''
+        parser = self.parser
+        first = next((block for block in parser.blocks
+                      if block.language in PYTHON_LANGUAGES and block.code.strip()), None)
+        if first is not None:
+            lines = first.code.splitlines(keepends=True)
+            self._done = True
+        elif parser.open_language in PYTHON_LANGUAGES:
+            lines = parser.open_lines
+        else:
+            return ''
+        new = ''.join(line if line.endswith('\n') else line + '\n' for line in lines[self._sent:])
+        self._sent = len(lines)
+        self.streamed += new
+        return new
+
+    def finish(self):
+        """End of the response: the code to keep"""
+        self.parser.finish()
+        code = pick_code(self.parser.blocks)
+        if code is not None:
+            return code
+        blocks = [block for block in self.parser.blocks if block.code.strip()]
+        if blocks:
+            return blocks[0].code
+        text = ''.join(self._parts).strip()
+        return text + '\n' if text else ''
+
+
+def diff_edits(old, new):
+    """Line edits turning old into new, last first so they can be applied in order
+
+    Each edit is (first, last, text): old lines first..last-1 (0-based) become
+    text. Runs of unchanged lines are left alone.
+    """
+    if not old.endswith('\n') and new.endswith('\n'):
+        # The region stops mid-line or at the end of the buffer, keep it that way
+        new = new[:-1]
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    edits = [(i1, i2, ''.join(b[j1:j2]))
+             for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+    return edits[::-1]
+
+
+def apply_edits(text, start, end, edits):
+    """Apply diff_edits to the region start..end of a Text widget as one undo step"""
+    line0, col0 = map(int, text.index(start).split('.'))
+    end = text.index(end)
+    last_line = int(end.split('.')[0]) - line0
+
+    def index(i):
+        # Lines of the region in widget coordinates; the last boundary is the
+        # region end itself, which need not be at a line end
+        if i == 0:
+            return f'{line0}.{col0}'
+        if i > last_line:
+            return end
+        return f'{line0 + i}.0'
+
+    text.configure(autoseparators=False)
+    text.edit_separator()
+    try:
+        for first, last, chars in edits:
+            text.replace(index(first), index(last), chars)
+    finally:
+        text.edit_separator()
+        text.configure(autoseparators=True)
@@ -0,0 +1,279 @@
+"""Identifier completion without the AI
+
+WordIndex keeps the identifiers of one buffer in a sorted list, so a prefix
+is answered with a bisect plus a short scan. It counts identifiers per line
+and follows TextWatcher edits, re-reading only the lines an edit touched, so
+it stays current as you type without rescanning the buffer. Given the
+highlighter's tokenizer, names inside strings and comments are left out; an
+edit that opens or closes a string re-reads lines until the lexer state
+matches what it was, as the highlighter does. Candidates are
+ranked by how often they occur and how recently they were typed or picked.
+The first scan of a big buffer runs on a thread; edits made meanwhile are
+replayed onto its result. CompletionPopup is the list shown under the cursor.
+"""
+import math
+import re
+import threading
+import tkinter as tk
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import nlargest
+from itertools import chain
+
+from highlighter import NORMAL
+
+IDENTIFIER = re.compile(r'[^\W\d]\w*')
+
+# Identifier being typed just before the cursor
+PREFIX = re.compile(r'[^\W\d]\w*$')
+
+# Most words of one prefix looked at before ranking, keeps short prefixes cheap
+MAX_SCAN = 2000
+
+# Buffers up to this many lines are scanned right away rather than on a thread
+INLINE_SCAN_LINES = 5000
+
+# Weight of a word typed or picked just now, halved every RECENCY_HALF_LIFE edits
+RECENCY_WEIGHT = 2.0
+RECENCY_HALF_LIFE = 200
+
+
+class WordIndex:
+    """Identifiers of a Text widget's buffer, plus a fixed seed such as the keywords"""
+
+    def __init__(self, text, seed=(), post=None, tokenizer=None):
+        self.text = text
+        self.seed = frozenset(seed)
+        # post(callback, *args) runs callback on the Tk thread; without it
+        # every scan runs inline
+        self.post = post
+        # names(line, state) -> (identifiers, end_state)
+        self._names = tokenizer.names_line if tokenizer is not None else self._plain_names
+        self.counts = Counter()
+        self.words = sorted(self.seed)
+        self.last_used = {}
+        self.clock = 0
+        # Identifiers of every line and the lexer state each line ends in,
+        # None until the first query
+        self._lines = None
+        self._ends = None
+        self._scanning = False
+        self._missed = []
+
+    @staticmethod
+    def _plain_names(line, state=NORMAL):
+        return tuple(IDENTIFIER.findall(line)), state
+
+    def _scan(self, source):
+        names = self._names
+        lines = []
+        ends = []
+        state = NORMAL
+        for line in source.split('\n'):
+            words, state = names(line, state)
+            lines.append(words)
+            ends.append(state)
+        return lines, ends, Counter(chain.from_iterable(lines))
+
+    def _build(self):
+        """Scan the whole buffer, on a thread if it is big"""
+        source = self.text.get('1.0', 'end-1c')
+        if self.post is None or source.count('\n') < INLINE_SCAN_LINES:
+            self._built(*self._scan(source))
+            return
+        self._scanning = True
+
+        def scan():
+            self.post(self._built, *self._scan(source))
+
+        threading.Thread(target=scan, name='word-scan', daemon=True).start()
+
+    def _built(self, lines, ends, counts):
+        """Take a scan's result, then replay the edits made while it ran"""
+        self._scanning = False
+        self._lines = lines
+        self._ends = ends
+        self.counts = counts
+        self.words = sorted(self.seed.union(counts))
+        missed, self._missed = self._missed, []
+        for first, removed, added in missed:
+            stop = first + removed + 1
+            if stop > len(lines):
+                self._lines = None
+                return
+            for words in lines[first:stop]:
+                for word in words or ():
+                    self._remove(word)
+            lines[first:stop] = [None] * (added + 1)
+            ends[first:stop] = [None] * (added + 1)
+        if not missed:
+            return
+        # Re-read the edited lines, and those after them whose start state changed
+        state = stored = NORMAL
+        try:
+            for number, words in enumerate(lines):
+                if words is not None and state == stored:
+                    state = stored = ends[number]
+                    continue
+                line = self.text.get(f'{number + 1}.0', f'{number + 1}.end')
+                stored = ends[number]
+                for word in words or ():
+                    self._remove(word)
+                lines[number], state = self._names(line, state)
+                ends[number] = state
+                for word in lines[number]:
+                    self._add(word)
+        except tk.TclError:
+            # The widget went away meanwhile
+            self._lines = None
+
+    def on_edit(self, first, removed, added):
+        """TextWatcher listener: recount only the lines the edit touched"""
+        if self._scanning:
+            self._missed.append((first, removed, added))
+            return
+        if self._lines is None:
+            return
+        stop = first + removed + 1
+        if stop > len(self._lines):
+            self._lines = None
+            return
+        lines = self.text.get(f'{first + 1}.0', f'{first + added + 1}.end').split('\n')
+        state = self._ends[first - 1] if first else NORMAL
+        stored = self._ends[stop - 1]
+        new = []
+        ends = []
+        for line in lines:
+            words, state = self._names(line, state)
+            new.append(words)
+            ends.append(state)
+        old = self._lines[first:stop]
+        self._lines[first:stop] = new
+        self._ends[first:stop] = ends
+        self.clock += 1
+        for words in old:
+            for word in words:
+                self._remove(word)
+        for words in new:
+            for word in words:
+                self._add(word)
+                self.last_used[word] = self.clock
+
+        # A string opened or closed: carry on until a line starts as it did before
+        number = first + added + 1
+        while state != stored and number < len(self._lines):
+            line = self.text.get(f'{number + 1}.0', f'{number + 1}.end')
+            stored = self._ends[number]
+            for word in self._lines[number]:
+                self._remove(word)
+            words, state = self._names(line, state)
+            self._lines[number] = words
+            self._ends[number] = state
+            for word in words:
+                self._add(word)
+            number += 1
+
+    def _add(self, word):
+        self.counts[word] += 1
+        if self.counts[word] == 1 and word not in self.seed:
+            insort(self.words, word)
+
+    def _remove(self, word):
+        count = self.counts[word] - 1
+        if count > 0:
+            self.counts[word] = count
+            return
+        del self.counts[word]
+        self.last_used.pop(word, None)
+        if word not in self.seed:
+            position = bisect_left(self.words, word)
+            if position < len(self.words) and self.words[position] == word:
+                del self.words[position]
+
+    def accept(self, word):
+        """Note that word was picked from the list"""
+        self.clock += 1
+        self.last_used[word] = self.clock
+
+    def score(self, word):
+        score = math.log1p(self.counts.get(word, 0))
+        used = self.last_used.get(word)
+        if used is not None:
+            score += RECENCY_WEIGHT * 0.5 ** ((self.clock - used) / RECENCY_HALF_LIFE)
+        return score
+
+    def complete(self, prefix, limit=12, extra=()):
+        """Best words starting with prefix, extra ones (e.g. from the project) included"""
+        if self._lines is None and not self._scanning:
+            self._build()
+        words = self.words
+        candidates = set()
+        end = min(len(words), bisect_left(words, prefix) + MAX_SCAN)
+        for position in range(bisect_left(words, prefix), end):
+            word = words[position]
+            if not word.startswith(prefix):
+                break
+            candidates.add(word)
+        candidates.update(extra)
+        # The word being typed is in the buffer too, completing to it is no use
+        candidates.discard(prefix)
+        return nlargest(limit, candidates, key=lambda word: (self.score(word), -len(word)))
+
+
+class CompletionPopup:
+    """Borderless list of completions under the cursor of a Text widget"""
+
+    def __init__(self, master, on_accept, font=('Consolas', 10)):
+        self.on_accept = on_accept
+        self.window = tk.Toplevel(master)
+        self.window.withdraw()
+        self.window.overrideredirect(True)
+        self.listbox = tk.Listbox(
+            self.window, font=font, bg='#252526', fg='#d4d4d4',
+            selectbackground='#094771', selectforeground='#ffffff',
+            activestyle=tk.NONE, borderwidth=1, relief=tk.SOLID, highlightthickness=0
+        )
+        self.listbox.pack(fill=tk.BOTH, expand=True)
+        self.visible = False
+        self.prefix = ''
+
+    def show(self, text, prefix, words):
+        """List words below the start of prefix, which is just before the cursor"""
+        box = text.bbox(f'insert-{len(prefix)}c')
+        if box is None:
+            self.hide()
+            return
+        self.prefix = prefix
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *words)
+        self.listbox.config(height=min(len(words), 10), width=max(20, max(map(len, words)) + 2))
+        self.listbox.selection_set(0)
+        x = text.winfo_rootx() + box[0]
+        y = text.winfo_rooty() + box[1] + box[3]
+        self.window.geometry(f'+{x}+{y}')
+        if not self.visible:
+            self.visible = True
+            self.window.deiconify()
+            self.window.lift()
+
+    def hide(self):
+        if self.visible:
+            self.visible = False
+            self.window.withdraw()
+
+    def move(self, step):
+        """Move the selection, wrapping around"""
+        size = self.listbox.size()
+        current = self.listbox.curselection()
+        position = ((current[0] if current else 0) + step) % size
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(position)
+        self.listbox.see(position)
+
+    def accept(self):
+        """Hand the selected word to on_accept(prefix, word)"""
+        current = self.listbox.curselection()
+        word = self.listbox.get(current[0]) if current else None
+        self.hide()
+        if word:
+            self.on_accept(self.prefix, word)
@@ -0,0 +1,190 @@
+"""Pick the code around the cursor that is worth sending with a prompt
+
+The buffer is parsed with ast into an index of functions, classes, imports and
+module-level assignments. Context is the definition enclosing the cursor, then
+the imports and definitions it refers to, trimmed to a token budget. Buffers
+that fit the budget as a whole are sent unchanged.
+"""
+import ast
+import keyword
+import os
+import re
+from typing import NamedTuple
+
+# Rough size of a token for code, good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Approximate number of tokens in text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class Definition(NamedTuple):
+    """A function or class in the buffer, lines are 1-based and inclusive"""
+    name: str
+    kind: str
+    start: int
+    end: int
+    node: ast.AST
+
+
+class PromptContext(NamedTuple):
+    """Code chosen for a prompt and what went into it"""
+    text: str
+    tokens: int
+    description: str
+
+
+class CodeIndex:
+    """Definitions, imports and module-level names of one buffer"""
+
+    def __init__(self, source):
+        self.lines = source.split('\n')
+        self.definitions = []
+        # Module-level name -> (start, end) of the statement binding it
+        self.imports = {}
+        self.globals = {}
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            return
+
+        for node in tree.body:
+            span = (node.lineno, node.end_lineno)
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                for alias in node.names:
+                    name = alias.asname or alias.name.split('.')[0]
+                    self.imports[name] = span
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        self.globals[target.id] = span
+        self._collect(tree)
+
+    def _collect(self, parent):
+        """Record every function and class below parent, outer ones first"""
+        for node in ast.iter_child_nodes(parent):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+                kind = 'class' if isinstance(node, ast.ClassDef) else 'function'
+                self.definitions.append(Definition(node.name, kind, start, node.end_lineno, node))
+            self._collect(node)
+
+    def enclosing(self, line):
+        """Definitions containing line, innermost first"""
+        found = [d for d in self.definitions if d.start <= line <= d.end]
+        return sorted(found, key=lambda d: d.end - d.start)
+
+    def referenced_names(self, node):
+        """Names and attribute names used inside node, in order of first use"""
+        seen = {}
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name):
+                seen.setdefault(child.id, child.lineno)
+            elif isinstance(child, ast.Attribute):
+                seen.setdefault(child.attr, child.lineno)
+        return sorted(seen, key=seen.get)
+
+    def text(self, start, end):
+        """Source of lines start..end"""
+        return '\n'.join(self.lines[start - 1:end])
+
+
+def build_context(source, cursor_line, budget):
+    """Choose the code to send for a cursor position within a token budget"""
+    if estimate_tokens(source) <= budget:
+        return PromptContext(source, estimate_tokens(source), "whole buffer")
+
+    index = CodeIndex(source)
+    cursor_line = min(max(1, cursor_line), len(index.lines))
+
+    # The widest enclosing definition that leaves half the budget for the
+    # code it refers to, falling back to the innermost one
+    enclosing = index.enclosing(cursor_line)
+    primary = enclosing[0] if enclosing else None
+    for definition in enclosing[1:]:
+        if estimate_tokens(index.text(definition.start, definition.end)) > budget // 2:
+            break
+        primary = definition
+    parts = []
+    used = 0
+
+    def add(start, end):
+        nonlocal used
+        if any(start <= e and end >= s for s, e in parts):
+            # Overlaps what is already in, e.g. the class around a method
+            return False
+        cost = estimate_tokens(index.text(start, end)) + 8
+        if used + cost > budget:
+            return False
+        parts.append((start, end))
+        used += cost
+        return True
+
+    if primary is None or not add(primary.start, primary.end):
+        # Module-level code or a definition too big for the budget: take
+        # the lines around the cursor instead
+        half = max(1, budget * CHARS_PER_TOKEN // 80)
+        start = max(1, cursor_line - half)
+        end = min(len(index.lines), cursor_line + half)
+        while end > start and estimate_tokens(index.text(start, end)) + 8 > budget:
+            start, end = min(cursor_line, start + 1), max(cursor_line, end - 1)
+        add(start, end)
+        names = list(dict.fromkeys(re.findall(r'[A-Za-z_]\w*', index.text(start, end))))
+        description = f"lines {start}-{end}"
+    else:
+        names = index.referenced_names(primary.node)
+        description = f"{primary.kind} {primary.name}"
+
+    # Imports first, they are short and tell the model where names come from
+    by_name = {}
+    for definition in index.definitions:
+        by_name.setdefault(definition.name, definition)
+    extra = 0
+    for name in names:
+        if name in index.imports and add(*index.imports[name]):
+            extra += 1
+    for name in names:
+        if primary is not None and name == primary.name:
+            continue
+        span = by_name.get(name)
+        span = (span.start, span.end) if span else index.globals.get(name)
+        if span and add(*span):
+            extra += 1
+    if extra:
+        description += f" + {extra} related"
+
+    chunks = []
+    for start, end in sorted(set(parts)):
+        chunks.append(f"# lines {start}-{end}\n{index.text(start, end)}")
+    text = '\n\n'.join(chunks)
+    return PromptContext(text, estimate_tokens(text), description)
+
+
+def project_context(index, text, source, budget, exclude=None):
+    """Definitions from other project files that text refers to, within budget
+
+    index is a symbols.ProjectIndex; names defined in source (the whole
+    buffer) are skipped since the buffer context already covers them.
+    """
+    local = CodeIndex(source)
+    defined = {d.name for d in local.definitions} | set(local.globals)
+    chunks = []
+    used = 0
+    for name in dict.fromkeys(re.findall(r'[A-Za-z_]\w*', text)):
+        if name in defined or keyword.iskeyword(name):
+            continue
+        location = index.resolve(name, source, exclude)
+        if location is None:
+            continue
+        relative = os.path.relpath(location.path, index.root)
+        chunk = f"# {relative} lines {location.line}-{location.end}\n{index.snippet(location)}"
+        cost = estimate_tokens(chunk) + 2
+        if used + cost > budget:
+            continue
+        chunks.append(chunk)
+        used += cost
+    text = '\n\n'.join(chunks)
+    return PromptContext(text, estimate_tokens(text), f"{len(chunks)} from project")
@@ -0,0 +1,638 @@
+"""Local syntax and lint checks, run on buffer snapshots in a worker process
+
+analyze() parses the snapshot once, splits it into top-level statements and
+checks each of them on its own: compile() for the errors the parser lets
+through (return outside a function, bad nonlocal...), plus a pyflakes-style
+scope pass for unused imports and locals. Results per statement are cached
+by its text in the worker, so after an edit only the statements that changed
+are looked at again. Undefined names and unused module-level imports depend
+on the whole module and are settled in a cheap pass over the cached results.
+"""
+import ast
+import builtins
+import copy
+import multiprocessing
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
+
+# Statements kept in the worker's cache
+CACHE_SIZE = 4096
+
+# Names that exist without being bound in the module
+IMPLICIT_NAMES = frozenset(dir(builtins)) | {
+    '__file__', '__name__', '__doc__', '__builtins__', '__spec__', '__loader__',
+    '__package__', '__path__', '__annotations__', '__module__', '__qualname__', '__class__',
+}
+
+
+class Diagnostic(NamedTuple):
+    """A problem at line.col (1-based line, 0-based character column) up to end_line.end_col"""
+    line: int
+    col: int
+    end_line: int
+    end_col: int
+    severity: str
+    message: str
+
+
+class Analysis(NamedTuple):
+    """Diagnostics of a snapshot, sorted by position"""
+    diagnostics: list
+    # (first, last) lines of each top-level statement and of the methods of
+    # top-level classes
+    blocks: list
+    # Statements answered from the cache
+    reused: int
+
+
+class _BlockResult(NamedTuple):
+    """What one top-level statement contributes, lines relative to its first line"""
+    defines: dict
+    uses: dict
+    diagnostics: tuple
+    star_import: bool
+    all_names: tuple
+
+
+class _MethodResult(NamedTuple):
+    """Names a method body takes from the module, and its problems, lines relative to its def"""
+    uses: dict
+    diagnostics: tuple
+
+
+class _Binding:
+    __slots__ = ('position', 'kind', 'used')
+
+    def __init__(self, position, kind):
+        self.position = position
+        self.kind = kind
+        self.used = False
+
+
+class _Scope:
+    def __init__(self, kind, parent=None):
+        # 'module', 'class', 'function' or 'comprehension'
+        self.kind = kind
+        self.parent = parent
+        self.bindings = {}
+        self.globals = set()
+        self.nonlocals = set()
+        self.uses = []
+        self.uses_locals = False
+
+
+class _Collector(ast.NodeVisitor):
+    """Bindings and name uses per scope of one top-level statement"""
+
+    def __init__(self, offset, lines=None):
+        self.offset = offset
+        # Source lines, to cache the methods of top-level classes on their own
+        self.lines = lines
+        self.module = _Scope('module')
+        self.scope = self.module
+        self.scopes = [self.module]
+        self.star_import = False
+        self.all_names = None
+        self.method_uses = []
+        self.method_problems = []
+
+    def position(self, node):
+        if isinstance(node, ast.ExceptHandler):
+            # Just the except keyword, not the whole handler
+            line = node.lineno - self.offset
+            return (line, node.col_offset, line, node.col_offset + len('except'))
+        return (node.lineno - self.offset, node.col_offset,
+                node.end_lineno - self.offset, node.end_col_offset)
+
+    def push(self, kind):
+        self.scope = _Scope(kind, self.scope)
+        self.scopes.append(self.scope)
+
+    def pop(self):
+        self.scope = self.scope.parent
+
+    def bind(self, name, node, kind='other', scope=None):
+        scope = scope or self.scope
+        if name in scope.nonlocals:
+            return
+        if name in scope.globals:
+            scope = self.module
+        if name not in scope.bindings:
+            scope.bindings[name] = _Binding(self.position(node), kind)
+
+    def use(self, name, node):
+        self.scope.uses.append((name, self.position(node)))
+        if name == 'locals':
+            self.scope.uses_locals = True
+
+    def annotation(self, node):
+        """Visit an annotation, including names inside string annotations"""
+        if node is None:
+            return
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            try:
+                parsed = ast.parse(node.value, mode='eval')
+            except SyntaxError:
+                return
+            for child in ast.walk(parsed):
+                if isinstance(child, ast.Name):
+                    self.use(child.id, node)
+            return
+        self.visit(node)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Store):
+            self.bind(node.id, node)
+        else:
+            self.use(node.id, node)
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                self.bind(target.id, target, 'assign')
+                if target.id == '__all__' and self.scope is self.module:
+                    self.all_names = _string_list(node.value)
+            else:
+                self.visit(target)
+
+    def visit_AugAssign(self, node):
+        self.visit(node.value)
+        if isinstance(node.target, ast.Name):
+            self.use(node.target.id, node.target)
+            self.bind(node.target.id, node.target)
+            if node.target.id == '__all__' and self.scope is self.module:
+                self.all_names = (self.all_names or ()) + (_string_list(node.value) or ())
+        else:
+            self.visit(node.target)
+
+    def visit_AnnAssign(self, node):
+        self.annotation(node.annotation)
+        if node.value is not None:
+            self.visit(node.value)
+        if isinstance(node.target, ast.Name):
+            if node.value is not None:
+                self.bind(node.target.id, node.target, 'assign')
+        else:
+            self.visit(node.target)
+
+    def visit_NamedExpr(self, node):
+        self.visit(node.value)
+        scope = self.scope
+        while scope.kind == 'comprehension':
+            scope = scope.parent
+        self.bind(node.target.id, node.target, 'assign', scope)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            name = alias.asname or alias.name.split('.')[0]
+            self.bind(name, alias if hasattr(alias, 'lineno') else node, 'import')
+
+    def visit_ImportFrom(self, node):
+        if node.module == '__future__':
+            return
+        for alias in node.names:
+            if alias.name == '*':
+                self.star_import = True
+                continue
+            self.bind(alias.asname or alias.name, alias if hasattr(alias, 'lineno') else node, 'import')
+
+    def visit_Global(self, node):
+        self.scope.globals.update(node.names)
+
+    def visit_Nonlocal(self, node):
+        self.scope.nonlocals.update(node.names)
+
+    def _arguments(self, args):
+        for arg in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+            if arg is not None:
+                self.bind(arg.arg, arg)
+
+    def _function(self, node, body, defaults=True):
+        args = node.args
+        if defaults:
+            for default in args.defaults + [d for d in args.kw_defaults if d is not None]:
+                self.visit(default)
+        self.push('function')
+        self._arguments(args)
+        if isinstance(body, list):
+            for statement in body:
+                self.visit(statement)
+        else:
+            self.visit(body)
+        self.pop()
+
+    def visit_FunctionDef(self, node):
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        for arg in node.args.posonlyargs + node.args.args + node.args.kwonlyargs + [node.args.vararg, node.args.kwarg]:
+            if arg is not None:
+                self.annotation(arg.annotation)
+        self.annotation(node.returns)
+        if self.lines is not None and self.scope.kind == 'class' and self.scope.parent is self.module:
+            self._method(node)
+        else:
+            self._function(node, node.body)
+        self.bind(node.name, node)
+
+    def _method(self, node):
+        """Body of a method, from the cache when its text is unchanged"""
+        args = node.args
+        for default in args.defaults + [d for d in args.kw_defaults if d is not None]:
+            self.visit(default)
+        first = node.lineno
+        key = ('method', '\n'.join(self.lines[first - 1:node.end_lineno]))
+        result = _cache.get(key)
+        if result is None:
+            # Methods skip the class scope, so the body sees what a function
+            # at module level would
+            collector = _Collector(first - 1)
+            collector._function(node, node.body, defaults=False)
+            uses = collector.resolve()
+            problems = _compile_problems([node], first - 1) + _scope_problems(collector.scopes)
+            result = _remember(key, _MethodResult(uses, tuple(problems)))
+        shift = first - 1 - self.offset
+        for name, (line, col, end_line, end_col) in result.uses.items():
+            self.method_uses.append((name, (line + shift, col, end_line + shift, end_col)))
+        self.method_problems.extend(
+            d._replace(line=d.line + shift, end_line=d.end_line + shift) for d in result.diagnostics)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        self._function(node, node.body)
+
+    def visit_ClassDef(self, node):
+        for expression in node.decorator_list + node.bases + [k.value for k in node.keywords]:
+            self.visit(expression)
+        self.push('class')
+        for statement in node.body:
+            self.visit(statement)
+        self.pop()
+        self.bind(node.name, node)
+
+    def _comprehension(self, node, *results):
+        generators = node.generators
+        self.visit(generators[0].iter)
+        self.push('comprehension')
+        for number, generator in enumerate(generators):
+            if number:
+                self.visit(generator.iter)
+            self.visit(generator.target)
+            for condition in generator.ifs:
+                self.visit(condition)
+        for result in results:
+            self.visit(result)
+        self.pop()
+
+    def visit_ListComp(self, node):
+        self._comprehension(node, node.elt)
+
+    visit_SetComp = visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node):
+        self._comprehension(node, node.key, node.value)
+
+    def visit_ExceptHandler(self, node):
+        if node.type is not None:
+            self.visit(node.type)
+        if node.name:
+            self.bind(node.name, node, 'assign')
+        for statement in node.body:
+            self.visit(statement)
+
+    def visit_MatchAs(self, node):
+        if node.pattern is not None:
+            self.visit(node.pattern)
+        if node.name:
+            self.bind(node.name, node)
+
+    def visit_MatchStar(self, node):
+        if node.name:
+            self.bind(node.name, node)
+
+    def visit_MatchMapping(self, node):
+        self.generic_visit(node)
+        if node.rest:
+            self.bind(node.rest, node)
+
+    def resolve(self):
+        """Mark used bindings; returns name -> first position of uses left for the module"""
+        module_uses = {}
+        for scope in self.scopes:
+            for name, position in scope.uses:
+                if not _lookup(scope, name):
+                    module_uses.setdefault(name, position)
+        for name, position in self.method_uses:
+            module_uses.setdefault(name, position)
+        return module_uses
+
+
+def _lookup(scope, name):
+    """Mark the binding a use refers to; False if it belongs to the module"""
+    current = scope
+    while current is not None:
+        if current.kind == 'class' and current is not scope:
+            current = current.parent
+            continue
+        if name in current.globals or current.kind == 'module':
+            return False
+        if name not in current.nonlocals and name in current.bindings:
+            current.bindings[name].used = True
+            return True
+        current = current.parent
+    return False
+
+
+def _string_list(node):
+    """The strings of a list or tuple literal, None for anything else"""
+    if isinstance(node, (ast.List, ast.Tuple)):
+        names = tuple(element.value for element in node.elts
+                      if isinstance(element, ast.Constant) and isinstance(element.value, str))
+        if len(names) == len(node.elts):
+            return names
+    return None
+
+
+def _warning(position, message):
+    line, col, end_line, end_col = position
+    return Diagnostic(line, col, end_line, end_col, 'warning', message)
+
+
+def summarize(diagnostics, first=1, last=None):
+    """One "- line N: message" line per problem between lines first and last,
+    numbered from first"""
+    return '\n'.join(f"- line {d.line - first + 1}: {d.message}" for d in diagnostics
+                     if first <= d.line and (last is None or d.line <= last))
+
+
+def _compile_problems(nodes, offset):
+    """Errors and warnings compile() finds beyond the parser, lines relative"""
+    problems = []
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        try:
+            compile(ast.Module(body=nodes, type_ignores=[]), '<buffer>', 'exec')
+        except SyntaxError as e:
+            line = (e.lineno or offset + 1) - offset
+            col = max(0, (e.offset or 1) - 1)
+            problems.append(Diagnostic(line, col, line, col + 1, 'error', e.msg))
+        except (ValueError, TypeError):
+            pass
+    for warning in caught:
+        if issubclass(warning.category, SyntaxWarning) and warning.lineno:
+            line = warning.lineno - offset
+            problems.append(Diagnostic(line, 0, line, 0, 'warning', str(warning.message)))
+    return problems
+
+
+def _scope_problems(scopes):
+    """Unused imports and locals of the function scopes"""
+    problems = []
+    for scope in scopes:
+        if scope.kind != 'function':
+            continue
+        for name, binding in scope.bindings.items():
+            if binding.used:
+                continue
+            if binding.kind == 'import':
+                problems.append(_warning(binding.position, f"'{name}' imported but unused"))
+            elif binding.kind == 'assign' and not scope.uses_locals and not name.startswith('_'):
+                problems.append(_warning(binding.position, f"local variable '{name}' is assigned to but never used"))
+    return problems
+
+
+def _without_method_bodies(nodes):
+    """Top-level classes with each method body cut down to pass, for compiling what is left"""
+    stripped = []
+    for node in nodes:
+        if isinstance(node, ast.ClassDef):
+            node = copy.copy(node)
+            body = []
+            for statement in node.body:
+                if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    statement = copy.copy(statement)
+                    statement.body = [ast.copy_location(ast.Pass(), statement.body[0])]
+                body.append(statement)
+            node.body = body
+        stripped.append(node)
+    return stripped
+
+
+def _remember(key, result):
+    _cache[key] = result
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result
+
+
+def analyze_block(nodes, offset, lines=None):
+    """Check the statements of one block, positions relative to line offset + 1
+
+    Given the source lines, the methods of classes are checked (and cached)
+    one by one.
+    """
+    collector = _Collector(offset, lines)
+    for node in nodes:
+        collector.visit(node)
+    uses = collector.resolve()
+    compiled = nodes if lines is None else _without_method_bodies(nodes)
+    problems = _compile_problems(compiled, offset) + collector.method_problems
+    problems += _scope_problems(collector.scopes)
+    defines = {name: (binding.position, binding.kind) for name, binding in collector.module.bindings.items()}
+    return _BlockResult(defines, uses, tuple(problems), collector.star_import, collector.all_names)
+
+
+def _first_line(node):
+    """Line a statement starts on, counting its decorators"""
+    return min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', ())])
+
+
+def split_blocks(module):
+    """Group top-level statements into (first, last, nodes), statements sharing a line stay together"""
+    blocks = []
+    for node in module.body:
+        first = _first_line(node)
+        if blocks and first <= blocks[-1][1]:
+            previous = blocks[-1]
+            blocks[-1] = (previous[0], max(previous[1], node.end_lineno), previous[2] + [node])
+        else:
+            blocks.append((first, node.end_lineno, [node]))
+    return blocks
+
+
+def _enclosing_block(lines, line):
+    """Lines of the top-level statement around line, found by indentation when the parse fails"""
+    def top_level(number):
+        text = lines[number - 1]
+        return text[:1] not in ('', ' ', '\t', '#', ')', ']', '}')
+
+    first = min(max(1, line), len(lines))
+    while first > 1 and not top_level(first):
+        first -= 1
+    last = first
+    while last < len(lines) and not top_level(last + 1):
+        last += 1
+    return first, max(last, min(line, len(lines)))
+
+
+def _char_column(line_text, byte_col):
+    """ast columns count UTF-8 bytes, Text columns count characters"""
+    if line_text.isascii():
+        return byte_col
+    return len(line_text.encode('utf-8')[:byte_col].decode('utf-8', errors='ignore'))
+
+
+_cache = OrderedDict()
+
+
+def analyze(source):
+    """Diagnostics for a whole buffer"""
+    lines = source.split('\n')
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        try:
+            module = ast.parse(source, '<buffer>')
+        except SyntaxError as e:
+            line = min(max(1, e.lineno or 1), len(lines))
+            col = max(0, (e.offset or 1) - 1)
+            end_col = (e.end_offset or 0) - 1 if e.end_lineno == e.lineno else -1
+            diagnostic = Diagnostic(line, col, line, max(end_col, col + 1), 'error', f"{type(e).__name__}: {e.msg}")
+            return Analysis([diagnostic], [_enclosing_block(lines, line)], 0)
+        except (ValueError, MemoryError, RecursionError) as e:
+            return Analysis([Diagnostic(1, 0, 1, 0, 'error', str(e))], [], 0)
+    diagnostics = [Diagnostic(w.lineno, 0, w.lineno, 0, 'warning', str(w.message))
+                   for w in caught if w.lineno and issubclass(w.category, (SyntaxWarning, DeprecationWarning))]
+
+    results = []
+    reused = 0
+    blocks = split_blocks(module)
+    for first, last, nodes in blocks:
+        key = '\n'.join(lines[first - 1:last])
+        result = _cache.get(key)
+        if result is None:
+            result = _remember(key, analyze_block(nodes, first - 1, lines))
+        else:
+            _cache.move_to_end(key)
+            reused += 1
+        results.append((first - 1, result))
+
+    # Module-wide pass: names bound and used across statements
+    defined = set()
+    used = set()
+    exported = set()
+    star_import = False
+    for offset, result in results:
+        defined.update(result.defines)
+        used.update(result.uses)
+        exported.update(result.all_names or ())
+        star_import = star_import or result.star_import
+
+    def shift(diagnostic, offset):
+        return diagnostic._replace(line=diagnostic.line + offset, end_line=diagnostic.end_line + offset)
+
+    for offset, result in results:
+        diagnostics.extend(shift(d, offset) for d in result.diagnostics)
+        for name, (position, kind) in result.defines.items():
+            if kind == 'import' and name not in used and name not in exported:
+                diagnostics.append(shift(_warning(position, f"'{name}' imported but unused"), offset))
+        if star_import:
+            continue
+        for name, position in result.uses.items():
+            if name not in defined and name not in IMPLICIT_NAMES:
+                line, col, end_line, end_col = position
+                diagnostics.append(shift(Diagnostic(line, col, end_line, end_col, 'error',
+                                                    f"undefined name '{name}'"), offset))
+
+    converted = []
+    for d in diagnostics:
+        if not 1 <= d.line <= len(lines):
+            continue
+        end_line = min(max(d.end_line, d.line), len(lines))
+        converted.append(d._replace(col=_char_column(lines[d.line - 1], d.col), end_line=end_line,
+                                    end_col=_char_column(lines[end_line - 1], d.end_col)))
+    converted.sort()
+    spans = []
+    for first, last, nodes in blocks:
+        spans.append((first, last))
+        for node in nodes:
+            if isinstance(node, ast.ClassDef):
+                spans.extend((_first_line(method), method.end_lineno) for method in node.body
+                             if isinstance(method, (ast.FunctionDef, ast.AsyncFunctionDef)))
+    return Analysis(converted, spans, reused)
+
+
+class DiagnosticsWorker:
+    """Runs analyze() in one long-lived worker process, newest snapshot first
+
+    While a snapshot is being analyzed, only the latest one submitted waits;
+    older ones are dropped since nobody would look at their results. If the
+    process cannot be started, analysis falls back to a thread.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._waiting = None
+        self._closed = False
+
+    def submit(self, source, on_done):
+        """Analyze source; on_done(analysis or None) is called on a worker thread"""
+        with self._lock:
+            if self._closed:
+                return
+            if self._running:
+                self._waiting = (source, on_done)
+                return
+            self._running = True
+        self._start(source, on_done)
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn rather than fork, the parent runs Tk and other threads
+            context = multiprocessing.get_context('spawn')
+            self._executor = ProcessPoolExecutor(1, mp_context=context)
+        return self._executor
+
+    def _start(self, source, on_done):
+        try:
+            future = self._pool().submit(analyze, source)
+        except (OSError, BrokenProcessPool):
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix='diagnostics')
+            future = self._executor.submit(analyze, source)
+        except RuntimeError:
+            # Shut down meanwhile
+            return
+        future.add_done_callback(lambda future: self._finished(future, source, on_done))
+
+    def _finished(self, future, source, on_done):
+        try:
+            analysis = future.result()
+        except BrokenProcessPool:
+            # The worker died or never started: carry on in a thread
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix='diagnostics')
+            with self._lock:
+                if self._waiting is None:
+                    self._waiting = (source, on_done)
+        except Exception:
+            on_done(None)
+        else:
+            on_done(analysis)
+        with self._lock:
+            waiting, self._waiting = self._waiting, None
+            if waiting is None or self._closed:
+                self._running = False
+                return
+        self._start(*waiting)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            self._waiting = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
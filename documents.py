@@ -0,0 +1,137 @@
+"""Open documents and the Text widgets that show them
+
+Only a few recently used documents own a Text widget (with its undo stack and
+highlighting state). The others are kept as plain text plus cursor and scroll
+position, and get a widget again when they are activated, so memory use does
+not grow with the number of open tabs. Releasing a widget loses its undo
+history, so documents with edits to undo keep theirs up to a larger cap.
+"""
+import os
+import uuid
+from typing import NamedTuple
+
+
+class DocumentEditor(NamedTuple):
+    """Widget side of a materialized document"""
+    text: object
+    watcher: object
+    highlighter: object
+    words: object
+
+
+class Document:
+    """One open file, or an untitled buffer"""
+
+    def __init__(self, path=None, text=''):
+        self.path = path
+        # Content while there is no widget, the widget holds it otherwise
+        self.text = text
+        self.editor = None
+        self.tab = None
+        self.cursor = '1.0'
+        self.yview = 0.0
+        self.edit_revision = 0
+        self.saved_revision = 0
+        self.journal_revision = 0
+        # edit_revision when the widget's undo stack was last emptied
+        self.undo_revision = 0
+        # Tells the journal entries of untitled documents apart
+        self.journal_key = uuid.uuid4().hex[:12]
+        # Bumped by every save, so only the latest one's completion counts
+        self.save_serial = 0
+        self.shown_dirty = False
+        # Set while something streams into the widget, keeps it materialized
+        self.busy = False
+        # Last local check (diagnostics.Analysis) and the revision it was for
+        self.analysis = None
+        self.analysis_revision = -1
+        # Ask AI conversation about this document (chat.ChatSession), loaded on first use
+        self.chat = None
+
+    @property
+    def name(self):
+        """File name for tabs and the window title"""
+        return os.path.basename(self.path) if self.path else "Untitled"
+
+    def is_dirty(self):
+        """True if the buffer changed since it was last opened or saved"""
+        return self.edit_revision != self.saved_revision
+
+    def has_undo(self):
+        """True if releasing the widget would lose edits that could be undone"""
+        return self.editor is not None and self.edit_revision != self.undo_revision
+
+    def content(self):
+        """Current text, whether or not the document has a widget"""
+        if self.editor is not None:
+            return self.editor.text.get('1.0', 'end-1c')
+        return self.text
+
+
+class DocumentManager:
+    """Ordered open documents, keeping at most max_widgets materialized
+
+    Documents with undo history are only released past max_undo_widgets.
+    """
+
+    def __init__(self, materialize, release, max_widgets=4, max_undo_widgets=16):
+        self.materialize = materialize
+        self.release = release
+        self.max_widgets = max_widgets
+        self.max_undo_widgets = max_undo_widgets
+        self.documents = []
+        self.active = None
+        self._recent = []
+
+    def add(self, document):
+        """Track a new document, without activating it"""
+        self.documents.append(document)
+        return document
+
+    def find(self, path):
+        """Open document for path, or None"""
+        if not path:
+            return None
+        path = os.path.abspath(path)
+        for document in self.documents:
+            if document.path and os.path.abspath(document.path) == path:
+                return document
+        return None
+
+    def activate(self, document):
+        """Make document the active one, giving it a widget if needed"""
+        if document.editor is None:
+            self.materialize(document)
+        if document in self._recent:
+            self._recent.remove(document)
+        self._recent.append(document)
+        self.active = document
+
+        # Hand the least recently used widgets back, those with undo history last
+        for candidate in list(self._recent):
+            if len(self._recent) <= self.max_widgets:
+                break
+            if candidate is not document and not candidate.busy and not candidate.has_undo():
+                self._release(candidate)
+        for candidate in list(self._recent):
+            if len(self._recent) <= self.max_undo_widgets:
+                break
+            if candidate is not document and not candidate.busy:
+                self._release(candidate)
+
+    def remove(self, document):
+        """Forget a document, returning the one to show in its place"""
+        index = self.documents.index(document)
+        if document.editor is not None:
+            self._release(document)
+        self.documents.remove(document)
+        if self.active is document:
+            self.active = None
+        if not self.documents:
+            return None
+        return self.documents[min(index, len(self.documents) - 1)]
+
+    def _release(self, document):
+        """Turn a document back into plain text"""
+        self.release(document)
+        self._recent.remove(document)
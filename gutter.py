@@ -0,0 +1,68 @@
+"""Line number gutter that only draws the lines currently on screen"""
+import tkinter as tk
+import tkinter.font as tkfont
+
+# Colors of the problem markers by severity
+MARKER_COLORS = {'error': '#f14c4c', 'warning': '#cca700'}
+
+
+class LineNumberGutter(tk.Canvas):
+    """Canvas showing line numbers next to a Text widget"""
+
+    def __init__(self, master, text, font=('Consolas', 10), fg='#858585', **kwargs):
+        kwargs.setdefault('highlightthickness', 0)
+        kwargs.setdefault('borderwidth', 0)
+        super().__init__(master, **kwargs)
+        self.text = text
+        self.font = font
+        self.fg = fg
+        self.line_count = 0
+        # line -> severity of the problems found on it
+        self.markers = {}
+        self._digits = 0
+        self.bind('<Configure>', lambda e: self.redraw())
+
+    def attach(self, text):
+        """Follow another Text widget, e.g. after switching tabs"""
+        self.text = text
+        self.line_count = 0
+        self.markers = {}
+        self.sync()
+
+    def set_markers(self, markers):
+        """Show a dot next to the lines in markers (line -> 'error' or 'warning')"""
+        self.markers = markers
+        self.redraw()
+
+    def sync(self):
+        """Redraw if the number of lines changed since the last call"""
+        count = int(self.text.index('end-1c').split('.')[0])
+        if count == self.line_count:
+            return
+        self.line_count = count
+        digits = max(3, len(str(count)))
+        if digits != self._digits:
+            self._digits = digits
+            self.config(width=tkfont.Font(font=self.font).measure('9' * (digits + 1)))
+        self.redraw()
+
+    def redraw(self):
+        """Draw the numbers of the visible lines, e.g. after scrolling"""
+        self.delete('all')
+        x = int(self['width']) - 4
+        index = self.text.index('@0,0')
+        while True:
+            info = self.text.dlineinfo(index)
+            if info is None:
+                break
+            line = index.split('.')[0]
+            self.create_text(x, info[1], anchor=tk.NE, text=line, fill=self.fg, font=self.font)
+            severity = self.markers.get(int(line))
+            if severity is not None:
+                middle = info[1] + info[3] // 2
+                color = MARKER_COLORS[severity]
+                self.create_oval(2, middle - 3, 8, middle + 3, fill=color, outline=color)
+            following = self.text.index(f'{line}.0+1line')
+            if following.split('.')[0] == line:
+                break
+            index = following
@@ -0,0 +1,248 @@
+"""Incremental syntax highlighting for the code editor
+
+Every line keeps the lexer state it starts in (inside a triple-quoted string,
+inside a backslash-continued string, or normal code). An edit only throws away
+the states and spans of the lines it touched; re-lexing then walks forward from
+the edit until the computed state matches what was stored before, so a typical
+keystroke costs one line. Tags are only painted around the visible part of the
+widget, which keeps the cost of a repaint independent of the file size.
+"""
+import re
+from functools import lru_cache
+
+# Lexer state at the start of a line: normal code, or the delimiter of the
+# string that is still open from a previous line
+NORMAL = ''
+
+_STRING_END = {
+    '"""': re.compile(r'(?:[^\\]|\\.)*?"""'),
+    "'''": re.compile(r"(?:[^\\]|\\.)*?'''"),
+    '"': re.compile(r'(?:[^"\\]|\\.)*"'),
+    "'": re.compile(r"(?:[^'\\]|\\.)*'"),
+}
+
+
+def _close_string(line, pos, quote):
+    """Find the end of a string opened with quote, returning (end, state)"""
+    match = _STRING_END[quote].match(line, pos)
+    if match:
+        return match.end(), NORMAL
+    if len(quote) == 3:
+        return len(line), quote
+    # Single quoted strings only carry over with a trailing backslash
+    trailing = len(line) - len(line.rstrip('\\'))
+    return len(line), quote if trailing % 2 else NORMAL
+
+
+class PythonTokenizer:
+    """Classify a line of Python in one scan of a single combined pattern
+
+    Comments and strings are matched before keywords, so nothing inside them
+    is ever tagged twice.
+    """
+
+    def __init__(self, keywords):
+        words = '|'.join(re.escape(word) for word in sorted(keywords, key=len, reverse=True))
+        self.pattern = re.compile(rf'''
+            (?P<comment>\#.*)
+          | (?P<string>[rRbBuUfF]{{0,2}}(?P<quote>"""|\'\'\'|"|'))
+          | (?P<number>\b(?:0[xXoObB][0-9a-fA-F_]+|\d[\d_]*\.?[\d_]*(?:[eE][+-]?\d+)?[jJ]?))
+          | (?P<keyword>\b(?:{words})\b)
+          | (?P<name>[^\W\d]\w*)
+        ''', re.VERBOSE)
+
+    def tokenize_line(self, line, state=NORMAL):
+        """Split one line into (tag, start, end) spans, returning (spans, end_state)"""
+        spans = []
+        pos = 0
+        if state:
+            pos, state = _close_string(line, 0, state)
+            spans.append(('string', 0, pos))
+            if state:
+                return spans, state
+
+        search = self.pattern.search
+        after_def = False
+        while True:
+            match = search(line, pos)
+            if not match:
+                break
+            kind = match.lastgroup
+            start, pos = match.span()
+            if kind == 'name':
+                # Plain names are only interesting right after def/class
+                if after_def:
+                    spans.append(('function', start, pos))
+                    after_def = False
+                continue
+            if kind == 'keyword':
+                spans.append(('keyword', start, pos))
+                after_def = match.group() in ('def', 'class')
+                continue
+            after_def = False
+            if kind == 'string':
+                pos, state = _close_string(line, pos, match.group('quote'))
+                spans.append(('string', start, pos))
+                if state:
+                    break
+            elif kind == 'comment':
+                spans.append(('comment', start, pos))
+                break
+            else:
+                spans.append(('number', start, pos))
+        return spans, state
+
+    def names_line(self, line, state=NORMAL):
+        """Names and keywords in the code of one line, returning (names, end_state)
+
+        Whatever is inside strings and comments is left out.
+        """
+        names = []
+        pos = 0
+        if state:
+            pos, state = _close_string(line, 0, state)
+            if state:
+                return (), state
+
+        search = self.pattern.search
+        while True:
+            match = search(line, pos)
+            if not match:
+                break
+            kind = match.lastgroup
+            pos = match.end()
+            if kind == 'name' or kind == 'keyword':
+                names.append(match.group())
+            elif kind == 'string':
+                pos, state = _close_string(line, pos, match.group('quote'))
+                if state:
+                    break
+            elif kind == 'comment':
+                break
+        return tuple(names), state
+
+    def tokenize(self, text):
+        """Yield (line, spans) for every line of text, line being 1-based"""
+        state = NORMAL
+        for line, content in enumerate(text.split('\n'), 1):
+            spans, state = self.tokenize_line(content, state)
+            yield line, spans
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(keywords):
+    """Shared tokenizer for a tuple of keywords, compiled on first use"""
+    return PythonTokenizer(keywords)
+
+
+class IncrementalHighlighter:
+    """Keep per-line lexer state for a Text widget and paint the viewport"""
+
+    # Lines painted above and below the visible area
+    MARGIN = 50
+
+    def __init__(self, text, colors, keywords):
+        self.text = text
+        self.colors = colors
+        self.tokenizer = get_tokenizer(tuple(keywords))
+        for tag, color in colors.items():
+            text.tag_configure(tag, foreground=color)
+        self.reset()
+
+    def line_count(self):
+        """Number of lines in the widget"""
+        return int(self.text.index('end-1c').split('.')[0])
+
+    def reset(self):
+        """Forget all lexer state, e.g. after the buffer was replaced"""
+        count = self.line_count()
+        self._states = [NORMAL] * count
+        self._spans = [None] * count
+        # Lines before _clean have correct spans and the start state of line
+        # _clean is correct. States in [_clean, _known) were correct before the
+        # last edits and are used to stop re-lexing once the output converges
+        # again, but only past _dirty_end, the end of the edited lines.
+        self._clean = 0
+        self._known = 0
+        self._dirty_end = 0
+
+    def on_edit(self, first, removed, added):
+        """Splice the line caches after an edit reported by TextWatcher"""
+        stop = first + removed + 1
+        if stop > len(self._states):
+            self.reset()
+            return
+        delta = added - removed
+        if self._dirty_end <= self._clean:
+            # Everything edited earlier has been re-lexed already
+            self._dirty_end = 0
+
+        self._states[first + 1:stop] = [NORMAL] * added
+        self._spans[first:stop] = [None] * (added + 1)
+
+        self._clean = min(self._clean, first)
+        if self._known >= stop:
+            self._known += delta
+        elif self._known > first:
+            self._known = first + 1
+        if self._dirty_end >= stop:
+            self._dirty_end += delta
+        self._dirty_end = max(self._dirty_end, first + added + 1)
+
+    def _ensure(self, upto):
+        """Make sure spans are up to date for every line before upto"""
+        states, spans = self._states, self._spans
+        tokenize_line = self.tokenizer.tokenize_line
+        while self._clean < upto:
+            first = self._clean
+            lines = self.text.get(f'{first + 1}.0', f'{upto}.end').split('\n')
+            index = first
+            converged = False
+            for line in lines:
+                line_spans, state = tokenize_line(line, states[index])
+                spans[index] = line_spans
+                index += 1
+                if index == len(states):
+                    break
+                if self._dirty_end <= index < self._known and states[index] == state:
+                    converged = True
+                    break
+                states[index] = state
+            if converged:
+                self._clean = self._known
+            else:
+                self._clean = index
+                if index < self._known:
+                    # The old state chain resumes after this line
+                    self._dirty_end = max(self._dirty_end, index + 1)
+                self._known = max(self._known, index)
+
+    def visible_range(self):
+        """(first, last) 0-based lines currently shown, last exclusive"""
+        first = int(self.text.index('@0,0').split('.')[0]) - 1
+        bottom = self.text.index(f'@0,{self.text.winfo_height()}')
+        return first, int(bottom.split('.')[0])
+
+    def paint(self):
+        """Re-lex what is stale and tag the viewport plus a margin"""
+        count = self.line_count()
+        if count != len(self._states):
+            # An edit slipped past the watcher, start over
+            self.reset()
+
+        first, last = self.visible_range()
+        start = max(0, first - self.MARGIN)
+        stop = min(count, last + self.MARGIN)
+        self._ensure(stop)
+
+        # One tag_remove and one tag_add per tag instead of a Tcl call per span
+        ranges = {tag: [] for tag in self.colors}
+        for index in range(start, stop):
+            line = index + 1
+            for tag, begin, end in self._spans[index]:
+                ranges[tag].append(f'{line}.{begin}')
+                ranges[tag].append(f'{line}.{end}')
+        for tag, indices in ranges.items():
+            self.text.tag_remove(tag, f'{start + 1}.0', f'{stop}.end')
+            if indices:
+                self.text.tag_add(tag, *indices)
@@ -0,0 +1,118 @@
+"""Bounded pool for AI requests with dedupe, cancellation and timeouts"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """Raised inside a job that was cancelled or ran past its timeout"""
+
+
+class AIJob:
+    """One queued or running AI request"""
+
+    def __init__(self, label, key, func, timeout):
+        self.label = label
+        self.key = key
+        self.func = func
+        self.timeout = timeout
+        self.created = time.monotonic()
+        self.started = None
+        self.future = None
+        self._cancelled = threading.Event()
+
+    @property
+    def running(self):
+        """True once a worker has picked the job up"""
+        return self.started is not None
+
+    def elapsed(self):
+        """Seconds spent running, or waiting in the queue if not started yet"""
+        return time.monotonic() - (self.started or self.created)
+
+    def remaining(self):
+        """Seconds left before the timeout, None without a timeout"""
+        if self.timeout is None:
+            return None
+        return max(0.0, self.timeout - self.elapsed()) if self.running else self.timeout
+
+    def cancel(self):
+        """Ask the job to stop at its next check()"""
+        self._cancelled.set()
+
+    def check(self):
+        """Raise JobCancelled if the job should stop, call this between chunks"""
+        if self._cancelled.is_set():
+            raise JobCancelled("Request cancelled")
+        if self.timeout is not None and self.running and self.elapsed() > self.timeout:
+            raise JobCancelled(f"Request timed out after {self.timeout:.0f} s")
+
+
+class AIJobManager:
+    """Run AI jobs on a fixed number of worker threads"""
+
+    def __init__(self, max_workers=2, timeout=60, on_change=None):
+        self.timeout = timeout
+        self.on_change = on_change
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai-job')
+        self._lock = threading.Lock()
+        self._jobs = []
+
+    def submit(self, label, key, func):
+        """Queue func(job), returns None if an identical request is in flight"""
+        with self._lock:
+            if any(job.key == key for job in self._jobs):
+                return None
+            job = AIJob(label, key, func, self.timeout)
+            self._jobs.append(job)
+            job.future = self._executor.submit(self._run, job)
+        self._changed()
+        return job
+
+    def jobs(self):
+        """Snapshot of queued and running jobs, oldest first"""
+        with self._lock:
+            return list(self._jobs)
+
+    def cancel(self, job=None):
+        """Cancel job, or the oldest running job if none is given"""
+        if job is None:
+            running = [job for job in self.jobs() if job.running]
+            if not running:
+                return False
+            job = running[0]
+        job.cancel()
+        if job.future.cancel():
+            # Never started, drop it straight away
+            self._finish(job)
+        return True
+
+    def shutdown(self):
+        """Cancel everything and stop accepting work"""
+        for job in self.jobs():
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job):
+        """Worker side of a job"""
+        job.started = time.monotonic()
+        self._changed()
+        try:
+            job.check()
+            job.func(job)
+        except JobCancelled:
+            pass
+        finally:
+            self._finish(job)
+
+    def _finish(self, job):
+        """Forget a job that ended or was cancelled before it started"""
+        with self._lock:
+            if job in self._jobs:
+                self._jobs.remove(job)
+        self._changed()
+
+    def _changed(self):
+        """Tell the UI the job list changed, called from any thread"""
+        if self.on_change:
+            self.on_change()
@@ -0,0 +1,77 @@
+"""Background, chunked reading of large files"""
+import os
+import queue
+import threading
+
+# Files at least this big are loaded in chunks instead of in one go
+LARGE_FILE_BYTES = 1024 * 1024
+
+
+class FileLoader:
+    """Read a text file in chunks on a worker thread
+
+    The main loop polls for chunks, so it can insert them a few at a time and
+    stay responsive. The queue between the two is bounded, which keeps the
+    reader from running far ahead of the widget.
+    """
+
+    def __init__(self, path, chunk_size=64 * 1024):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.size = max(1, os.path.getsize(path))
+        self.chars_read = 0
+        self.error = None
+        self.finished = False
+        self._chunks = queue.Queue(maxsize=8)
+        self._cancelled = threading.Event()
+
+    @property
+    def progress(self):
+        """Fraction of the file read so far (characters over bytes, so approximate)"""
+        return min(1.0, self.chars_read / self.size)
+
+    def start(self):
+        """Start reading on a daemon thread"""
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def cancel(self):
+        """Stop reading, chunks already queued are dropped by the caller"""
+        self._cancelled.set()
+
+    def _read(self):
+        """Worker thread: read chunks until EOF, an error or cancellation"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                while not self._cancelled.is_set():
+                    chunk = file.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    self._put(chunk)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(None)
+
+    def _put(self, item):
+        """Block while the queue is full, giving up once cancelled"""
+        while not self._cancelled.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def poll(self, max_chunks=4):
+        """Chunks read since the last call, without blocking"""
+        chunks = []
+        while len(chunks) < max_chunks and not self.finished:
+            try:
+                chunk = self._chunks.get_nowait()
+            except queue.Empty:
+                break
+            if chunk is None:
+                self.finished = True
+            else:
+                self.chars_read += len(chunk)
+                chunks.append(chunk)
+        return chunks
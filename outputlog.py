@@ -0,0 +1,194 @@
+"""AI output pane: bounded scrollback over an on-disk transcript
+
+Everything written to the pane is appended to a plain UTF-8 transcript file.
+The Text widget only holds the tail of it: text is rendered a chunk per main
+loop tick, old lines are trimmed in bulk once the pane passes its line cap,
+and earlier parts of the transcript can be paged back in from disk.
+"""
+import glob
+import os
+import time
+from collections import deque
+
+from response_cache import default_cache_dir
+
+
+class TranscriptStore:
+    """Append-only transcript file, read back by byte offset"""
+
+    def __init__(self, path=None, keep=20):
+        if path is None:
+            directory = os.path.join(default_cache_dir(), 'transcripts')
+            os.makedirs(directory, exist_ok=True)
+            self._prune(directory, keep - 1)
+            path = os.path.join(directory, time.strftime('transcript-%Y%m%d-%H%M%S.log'))
+        self.path = path
+        self._file = open(path, 'ab')
+        self.size = self._file.tell()
+
+    @staticmethod
+    def _prune(directory, keep):
+        """Delete all but the newest keep transcripts"""
+        old = sorted(glob.glob(os.path.join(directory, 'transcript-*.log')))
+        for path in old[:max(0, len(old) - keep)]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def append(self, text):
+        data = text.encode('utf-8')
+        self._file.write(data)
+        self.size += len(data)
+
+    def read_before(self, offset, max_bytes):
+        """(start, text) of whole lines ending at offset, at most max_bytes long"""
+        self._file.flush()
+        start = max(0, offset - max_bytes)
+        with open(self.path, 'rb') as file:
+            file.seek(start)
+            data = file.read(offset - start)
+        if start > 0:
+            # Begin at a line (and so a character) boundary
+            newline = data.find(b'\n')
+            if newline != -1:
+                start += newline + 1
+                data = data[newline + 1:]
+        return start, data.decode('utf-8', errors='replace')
+
+    def close(self):
+        self._file.close()
+
+
+class OutputLog:
+    """Feeds a read-only Text widget from a transcript, a chunk per tick
+
+    The widget holds transcript[shown_start:shown_end] and never more than
+    max_lines: past that, lines are trimmed from the end away from the
+    reader. While following the output that is the top; after paging back,
+    or while new output arrives with the view scrolled up, it is the bottom.
+    New output then stays on disk until the view is scrolled back to the
+    end, when the tail of the transcript is loaded again.
+    """
+
+    def __init__(self, text, store, max_lines=5000, trim_lines=1000, chunk_chars=4096, page_bytes=64 * 1024):
+        self.text = text
+        self.store = store
+        self.max_lines = max_lines
+        self.trim_lines = trim_lines
+        self.chunk_chars = chunk_chars
+        self.page_bytes = page_bytes
+        # Transcript offsets of the first character in the widget and just past the last
+        self.shown_start = store.size
+        self.shown_end = store.size
+        # True once the widget no longer reaches the end of the transcript
+        self.detached = False
+        self._pending = deque()
+        self._scheduled = False
+        if hasattr(text, 'vbar'):
+            text.configure(yscrollcommand=self._scrolled)
+
+    def _scrolled(self, first, last):
+        self.text.vbar.set(first, last)
+        if self.detached and float(last) >= 0.999:
+            self.text.after_idle(self.show_latest)
+
+    def append(self, text):
+        """Queue text for the pane, it is on disk right away"""
+        if not text:
+            return
+        self.store.append(text)
+        if self.detached:
+            return
+        self._pending.append(text)
+        if not self._scheduled:
+            self._scheduled = True
+            self.text.after_idle(self._render)
+
+    def _render(self):
+        """Insert up to chunk_chars of pending text, then yield to the main loop"""
+        self._scheduled = False
+        parts = []
+        size = 0
+        while self._pending and size < self.chunk_chars:
+            part = self._pending.popleft()
+            if size + len(part) > self.chunk_chars:
+                cut = self.chunk_chars - size
+                self._pending.appendleft(part[cut:])
+                part = part[:cut]
+            parts.append(part)
+            size += len(part)
+        if not parts:
+            return
+
+        # Only follow the output if the user has not scrolled up to read
+        following = self.text.yview()[1] >= 0.999
+        chunk = ''.join(parts)
+        self.text.config(state='normal')
+        self.text.insert('end', chunk)
+        self.shown_end += len(chunk.encode('utf-8'))
+        self._trim(from_top=following)
+        self.text.config(state='disabled')
+        if following:
+            self.text.see('end')
+
+        if self._pending:
+            self._scheduled = True
+            self.text.after(1, self._render)
+
+    def _trim(self, from_top):
+        """Drop lines in one go once the pane is over its cap; call with the widget writable"""
+        lines = int(self.text.index('end-1c').split('.')[0])
+        if lines <= self.max_lines:
+            return
+        count = lines - self.max_lines + self.trim_lines
+        if from_top:
+            cut = f'{count + 1}.0'
+            removed = self.text.get('1.0', cut)
+            self.text.delete('1.0', cut)
+            self.shown_start += len(removed.encode('utf-8'))
+            return
+        cut = f'{lines - count + 1}.0'
+        removed = self.text.get(cut, 'end-1c')
+        self.text.delete(cut, 'end')
+        self.shown_end -= len(removed.encode('utf-8'))
+        # What follows is on disk; show_latest() brings it back
+        self.detached = True
+        self._pending.clear()
+
+    def show_latest(self):
+        """Load the tail of the transcript again once the widget stopped short of it"""
+        if not self.detached:
+            return
+        self.detached = False
+        start, tail = self.store.read_before(self.store.size, self.page_bytes)
+        self.text.config(state='normal')
+        self.text.delete('1.0', 'end')
+        self.text.insert('end', tail)
+        self.shown_start = start
+        self.shown_end = self.store.size
+        self._trim(from_top=True)
+        self.text.config(state='disabled')
+        self.text.see('end')
+
+    def page_back(self):
+        """Load the part of the transcript just before what is shown; False at the start"""
+        if self.shown_start <= 0:
+            return False
+        start, earlier = self.store.read_before(self.shown_start, self.page_bytes)
+        self.text.config(state='normal')
+        self.text.insert('1.0', earlier)
+        self.shown_start = start
+        self._trim(from_top=False)
+        self.text.config(state='disabled')
+        self.text.see('1.0')
+        return True
+
+    def clear(self):
+        """Empty the pane; the transcript keeps everything"""
+        self._pending.clear()
+        self.text.config(state='normal')
+        self.text.delete('1.0', 'end')
+        self.text.config(state='disabled')
+        self.shown_start = self.shown_end = self.store.size
+        self.detached = False
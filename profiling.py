@@ -0,0 +1,170 @@
+"""Timing hooks, event-loop lag and on-demand cProfile captures
+
+Hot paths are wrapped with cheap perf_counter timers that keep a rolling
+window of samples per name; the performance overlay reads the percentiles
+from there. Nothing here touches Tk except LoopLagMonitor, which needs a
+widget for after().
+"""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+from collections import deque
+
+from response_cache import default_cache_dir
+
+
+class Timings:
+    """Rolling latency samples in milliseconds, safe to feed from any thread"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, milliseconds):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(milliseconds)
+
+    def wrap(self, name, func):
+        """func, timing every call under name"""
+        record = self.record
+        clock = time.perf_counter
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, (clock() - started) * 1000)
+
+        return timed
+
+    def stats(self):
+        """name -> (count, last, p50, p95, max) over the current window"""
+        with self._lock:
+            snapshot = {name: list(samples) for name, samples in self._samples.items()}
+        stats = {}
+        for name, samples in sorted(snapshot.items()):
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            p50 = ordered[(len(ordered) - 1) // 2]
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            stats[name] = (len(ordered), samples[-1], p50, p95, ordered[-1])
+        return stats
+
+    def report(self):
+        """Fixed-width table of stats() for the overlay"""
+        lines = [f"{'':<20}{'last':>8}{'p50':>8}{'p95':>8}{'max':>8}"]
+        for name, (count, last, p50, p95, worst) in self.stats().items():
+            lines.append(f"{name[:20]:<20}{last:>8.1f}{p50:>8.1f}{p95:>8.1f}{worst:>8.1f}")
+        return '\n'.join(lines)
+
+
+class LoopLagMonitor:
+    """Measure event-loop lag as the drift of a periodic after() timer"""
+
+    def __init__(self, widget, timings, interval_ms=100, name='event loop lag'):
+        self.widget = widget
+        self.timings = timings
+        self.interval_ms = interval_ms
+        self.name = name
+        self._expected = None
+
+    def start(self):
+        self._expected = time.perf_counter() + self.interval_ms / 1000
+        self.widget.after(self.interval_ms, self._tick)
+
+    def _tick(self):
+        now = time.perf_counter()
+        self.timings.record(self.name, max(0.0, (now - self._expected) * 1000))
+        self._expected = now + self.interval_ms / 1000
+        self.widget.after(self.interval_ms, self._tick)
+
+
+class InstrumentedBackend:
+    """AI backend wrapper timing every call, with time to first piece when streaming"""
+
+    def __init__(self, backend, timings):
+        self.backend = backend
+        self.timings = timings
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def generate(self, prompt, timeout=None):
+        started = time.perf_counter()
+        try:
+            return self.backend.generate(prompt, timeout=timeout)
+        finally:
+            self.timings.record('ai total', (time.perf_counter() - started) * 1000)
+
+    def stream(self, prompt, timeout=None):
+        return self._timed(self.backend.stream(prompt, timeout=timeout))
+
+    def chat_stream(self, history, message, timeout=None):
+        return self._timed(self.backend.chat_stream(history, message, timeout=timeout))
+
+    def _timed(self, pieces):
+        started = time.perf_counter()
+        first = True
+        try:
+            for text in pieces:
+                if first:
+                    first = False
+                    self.timings.record('ai first token', (time.perf_counter() - started) * 1000)
+                yield text
+        finally:
+            self.timings.record('ai total', (time.perf_counter() - started) * 1000)
+
+
+class StartupTimer:
+    """Milestones of a cold start, in milliseconds since started"""
+
+    def __init__(self, started):
+        self.started = started
+        self.marks = {}
+
+    def mark(self, name):
+        """Note when name happened, the first time only"""
+        self.marks.setdefault(name, (time.perf_counter() - self.started) * 1000)
+
+    def report(self):
+        return '\n'.join(f"{name:<20}{ms:>9.1f} ms" for name, ms in self.marks.items())
+
+
+class ProfileCapture:
+    """cProfile of the main thread, started and stopped from the UI"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(default_cache_dir(), 'profiles')
+        self._profile = None
+
+    @property
+    def active(self):
+        return self._profile is not None
+
+    def start(self):
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self):
+        """Stop profiling and write the .prof file plus a text summary, returning its path"""
+        profile, self._profile = self._profile, None
+        profile.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime('profile-%Y%m%d-%H%M%S.prof'))
+        profile.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(40)
+        with open(path[:-len('.prof')] + '.txt', 'w', encoding='utf-8') as file:
+            file.write(summary.getvalue())
+        return path
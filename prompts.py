@@ -0,0 +1,116 @@
+"""Prompt templates for the AI actions on a piece of code and for the chat"""
+from typing import NamedTuple
+
+
+class CodeAction(NamedTuple):
+    """An AI action applied to the selected code (or the whole buffer)"""
+    label: str
+    verb: str
+    gerund: str
+    template: str
+    progress: str
+    heading: str
+
+
+EXPLAIN_PROMPT = """
+Explain this Python code in detail:
+
+{code}
+
+Please provide:
+1. Overall purpose and functionality
+2. Step-by-step breakdown
+3. Key concepts used
+4. Potential improvements or issues
+"""
+
+FIX_PROMPT = """
+Analyze this Python code and fix any issues:
+
+{code}
+{problems}
+Please:
+1. Identify any syntax errors, logical errors, or potential bugs
+2. Fix the issues
+3. Improve code quality and efficiency
+4. Return the corrected code with comments explaining the fixes
+
+Original code with issues fixed:
+"""
+
+OPTIMIZE_PROMPT = """
+Optimize this Python code for better performance and readability:
+
+{code}
+
+Please provide:
+1. Optimized version of the code
+2. Explanation of optimizations made
+3. Performance improvements achieved
+4. Best practices applied
+
+Optimized code:
+"""
+
+# Filled into FIX_PROMPT's {problems} when the local checks found something
+PROBLEMS_NOTE = """
+A local check reported these problems (lines counted from the first line above):
+{summary}
+"""
+
+# Chat turns: the code goes along in full once, then as diffs of it
+CHAT_FULL_PROMPT = """
+Current code in editor:
+{code}
+{related}
+User question: {query}
+
+Please provide a helpful response considering the current code context.
+"""
+
+CHAT_DIFF_PROMPT = """
+The code in the editor changed since my last message:
+```diff
+{diff}```
+
+User question: {query}
+"""
+
+CHAT_QUESTION_PROMPT = """
+User question: {query}
+"""
+
+# Stands in for the turns folded into the summary at the start of the history
+CHAT_SUMMARY_TURN = """
+Summary of our conversation so far:
+{summary}
+"""
+
+CHAT_SUMMARY_REPLY = "Understood, I will continue from there."
+
+SUMMARIZE_CHAT_PROMPT = """
+Summarize this conversation about a piece of Python code so it can be continued without it.
+Keep the questions asked, the conclusions of the answers, and any decisions or code changes agreed on.
+Leave out code that was only quoted. Use at most {words} words.
+
+Summary of the conversation before this part:
+{summary}
+
+Conversation:
+{conversation}
+"""
+
+CODE_ACTIONS = {
+    'explain': CodeAction(
+        "Explain", "explain", "explaining", EXPLAIN_PROMPT,
+        "🤖 Analyzing code...\n", "📝 Code Explanation:\n\n"
+    ),
+    'fix': CodeAction(
+        "Fix Code", "fix", "fixing", FIX_PROMPT,
+        "🤖 Analyzing and fixing code...\n", "🔧 Code Analysis and Fixes:\n\n"
+    ),
+    'optimize': CodeAction(
+        "Optimize", "optimize", "optimizing", OPTIMIZE_PROMPT,
+        "🤖 Optimizing code...\n", "⚡ Code Optimization:\n\n"
+    ),
+}
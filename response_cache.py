@@ -0,0 +1,153 @@
+"""Content-addressed cache for AI responses
+
+Responses are keyed on (model name, prompt template, code) hashes and kept in
+two tiers: a small in-memory LRU and an SQLite file under the user's cache
+directory. Entries expire after a TTL and the file is trimmed back to a size
+limit, least recently used first.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def default_cache_dir():
+    """Per-user cache directory for the editor"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'ai-code-editor')
+
+
+def _digest(text):
+    """Hex SHA-256 of a string"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Memory + SQLite response cache, safe to use from several threads"""
+
+    def __init__(self, path=None, memory_items=128, max_bytes=50 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.path = path or os.path.join(default_cache_dir(), 'responses.sqlite3')
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+    @staticmethod
+    def key(model, template, code):
+        """Cache key for a prompt template applied to code on a model"""
+        return _digest('\0'.join((model or '', _digest(template), _digest(code))))
+
+    def _connect(self):
+        """Open the database on first use, None if the disk tier is unavailable"""
+        if self._db is None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                db = sqlite3.connect(self.path, check_same_thread=False)
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, text TEXT, size INTEGER, stored_at REAL, accessed REAL)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+                db.commit()
+                self._db = db
+            except (OSError, sqlite3.Error):
+                # Fall back to memory only
+                self._db = False
+        return self._db or None
+
+    def get(self, key):
+        """Cached text for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._memory.pop(key, None)
+
+            db = self._connect()
+            row = None
+            if db:
+                try:
+                    row = db.execute(
+                        "SELECT text, stored_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row and now - row[1] > self.ttl:
+                        db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        row = None
+                    elif row:
+                        db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    db.commit()
+                except sqlite3.Error:
+                    row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, row[1], row[0])
+            return row[0]
+
+    def put(self, key, text):
+        """Store text under key in both tiers
+
+        Empty answers, such as a response the model blocked, are not kept:
+        they would be served back as hits until they expire.
+        """
+        if not text.strip():
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, text)
+            db = self._connect()
+            if not db:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, text, len(text.encode('utf-8')), now, now)
+                )
+                self._trim(db)
+                db.commit()
+            except sqlite3.Error:
+                pass
+
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._memory.clear()
+            db = self._connect()
+            if not db:
+                return
+            try:
+                db.execute("DELETE FROM responses")
+                db.commit()
+            except sqlite3.Error:
+                pass
+
+    def _remember(self, key, stored_at, text):
+        """Put an entry in the memory tier, evicting the least recently used"""
+        self._memory[key] = (stored_at, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _trim(self, db):
+        """Evict least recently used rows until the file fits max_bytes"""
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+        evict = []
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            evict.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        db.executemany("DELETE FROM responses WHERE key = ?", evict)
@@ -0,0 +1,124 @@
+"""Crash-safe saving on a background thread, plus the autosave journal"""
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from response_cache import default_cache_dir
+
+
+def atomic_write(path, text, encoding='utf-8'):
+    """Write text to path so that readers see either the old or the new file
+
+    The data goes to a temp file in the same directory, is fsynced, and then
+    renamed over the target.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, 'w', encoding=encoding) as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # Make the rename itself durable where the platform allows it
+    if hasattr(os, 'O_DIRECTORY'):
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+
+class SaveWorker:
+    """Run writes one at a time on a background thread"""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='save')
+
+    def save(self, path, text, on_done):
+        """Write text to path, then call on_done(error, seconds) on the worker thread"""
+        def write():
+            started = time.perf_counter()
+            try:
+                atomic_write(path, text)
+            except Exception as e:
+                on_done(e, time.perf_counter() - started)
+            else:
+                on_done(None, time.perf_counter() - started)
+        return self._executor.submit(write)
+
+    def submit(self, func, *args):
+        """Run func(*args) on the save thread, after any pending writes"""
+        return self._executor.submit(func, *args)
+
+    def shutdown(self):
+        """Wait for pending writes"""
+        self._executor.shutdown(wait=True)
+
+
+class RecoveryJournal:
+    """Snapshots of unsaved buffers, used to recover after a crash"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(default_cache_dir(), 'recovery')
+
+    def _entry_path(self, file_path, key=None):
+        """Journal file for a document: by path, or by key for untitled buffers"""
+        if file_path:
+            name = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+        else:
+            name = f'untitled-{key}' if key else 'untitled'
+        return os.path.join(self.directory, f'{name}.json')
+
+    def write(self, file_path, text, key=None):
+        """Record the current text of a document"""
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {'path': file_path, 'key': key, 'saved_at': time.time(), 'text': text}
+        atomic_write(self._entry_path(file_path, key), json.dumps(entry))
+
+    def discard(self, file_path, key=None):
+        """Forget the snapshot of a document, e.g. after it was saved"""
+        try:
+            os.unlink(self._entry_path(file_path, key))
+        except OSError:
+            pass
+
+    def entries(self):
+        """All readable snapshots, newest first"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as file:
+                    entries.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return sorted(entries, key=lambda entry: entry.get('saved_at', 0), reverse=True)
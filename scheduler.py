@@ -0,0 +1,81 @@
+"""Debounced update jobs for the editor's change handlers
+
+Edits bump a revision counter; every registered job is then run at most once
+per burst, on its own budget, and only if the revision moved since it last ran.
+"""
+import time
+
+# One frame at 60Hz
+FRAME_MS = 16
+
+
+class _Job:
+    """Callback plus its timer state"""
+
+    def __init__(self, callback, delay, max_wait):
+        self.callback = callback
+        self.delay = delay
+        self.max_wait = max_wait
+        self.after_id = None
+        self.first_pending = None
+        self.revision = -1
+        self.paused = False
+
+
+class ChangeScheduler:
+    """Coalesce bursts of edits into one call per job"""
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.revision = 0
+        self._jobs = {}
+
+    def add_job(self, name, callback, delay=FRAME_MS, max_wait=None):
+        """Run callback delay ms after the last edit of a burst
+
+        max_wait caps how long a steady stream of edits can push the job back;
+        it defaults to delay, which turns the job into a plain throttle.
+        """
+        self._jobs[name] = _Job(callback, delay, delay if max_wait is None else max_wait)
+
+    def notify(self):
+        """Record an edit and (re)arm every job"""
+        self.revision += 1
+        now = time.monotonic()
+        for job in self._jobs.values():
+            if job.first_pending is None:
+                job.first_pending = now
+            waited = (now - job.first_pending) * 1000
+            delay = max(0, min(job.delay, job.max_wait - waited))
+            if job.after_id is not None:
+                if job.delay == job.max_wait:
+                    # Throttled job, the armed timer already covers this edit
+                    continue
+                self.widget.after_cancel(job.after_id)
+            job.after_id = self.widget.after(int(delay), self._run, job)
+
+    def pause(self, name):
+        """Hold a job back, e.g. while a file is being loaded"""
+        self._jobs[name].paused = True
+
+    def resume(self, name):
+        """Let a paused job run again, catching up on edits made meanwhile"""
+        self._jobs[name].paused = False
+        self.flush(name)
+
+    def _run(self, job):
+        """Timer callback, skips the job if nothing changed since it last ran"""
+        job.after_id = None
+        job.first_pending = None
+        if job.paused or job.revision == self.revision:
+            return
+        job.revision = self.revision
+        job.callback()
+
+    def flush(self, name=None):
+        """Run pending jobs now instead of waiting for their timers"""
+        jobs = [self._jobs[name]] if name else list(self._jobs.values())
+        for job in jobs:
+            if job.after_id is not None:
+                self.widget.after_cancel(job.after_id)
+            self._run(job)
@@ -0,0 +1,314 @@
+"""Find and replace over a buffer snapshot, and search across a project
+
+Matching runs on plain strings away from the UI thread. The editor only gets
+match positions back and tags the ones on screen, so large buffers with many
+hits stay cheap to scroll. Project searches walk the tree (honouring
+.gitignore files) and scan files in batches on a process pool, handing each
+batch's hits back as soon as it is done.
+"""
+import multiprocessing
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# Stop a project search after this many hits
+MAX_PROJECT_HITS = 5000
+
+# Files bigger than this are skipped by project searches
+MAX_SEARCH_BYTES = 4 * 1024 * 1024
+
+# Files per task handed to a search worker
+BATCH_SIZE = 32
+
+
+def compile_pattern(query, regex=False, case=False):
+    """Pattern for a find query; raises re.error for a bad regex"""
+    flags = re.MULTILINE | (0 if case else re.IGNORECASE)
+    return re.compile(query if regex else re.escape(query), flags)
+
+
+def _line_starts(text):
+    """Offsets at which each line of text begins"""
+    return [0] + [match.end() for match in re.finditer('\n', text)]
+
+
+def _position(starts, offset):
+    """(line, col) of a character offset, line 1-based like Tk"""
+    line = bisect_right(starts, offset)
+    return line, offset - starts[line - 1]
+
+
+class BufferMatches:
+    """Positions of every match in one snapshot of a buffer"""
+
+    def __init__(self, text, pattern, revision=None):
+        self.pattern = pattern
+        self.revision = revision
+        starts = _line_starts(text)
+        self.starts = []
+        self.ends = []
+        for match in pattern.finditer(text):
+            if match.start() == match.end():
+                # Empty matches (e.g. a bare ^) cannot be shown or stepped through
+                continue
+            self.starts.append(_position(starts, match.start()))
+            self.ends.append(_position(starts, match.end()))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def span(self, i):
+        """Tk indices (start, end) of match i"""
+        (line, col), (end_line, end_col) = self.starts[i], self.ends[i]
+        return f'{line}.{col}', f'{end_line}.{end_col}'
+
+    def between(self, first, last):
+        """Spans of the matches starting on lines first..last (1-based)"""
+        lo = bisect_left(self.starts, (first, 0))
+        hi = bisect_left(self.starts, (last + 1, 0))
+        return [self.span(i) for i in range(lo, hi)]
+
+    def after(self, line, col):
+        """Index of the first match at or after (line, col), wrapping around"""
+        if not self.starts:
+            return None
+        return bisect_left(self.starts, (line, col)) % len(self.starts)
+
+    def before(self, line, col):
+        """Index of the last match before (line, col), wrapping around"""
+        if not self.starts:
+            return None
+        return (bisect_left(self.starts, (line, col)) - 1) % len(self.starts)
+
+
+def plan_replace_all(text, pattern, replacement, regex=False):
+    """Work out a replace-all as one edit
+
+    Returns (start, end, new_text, count): the Tk indices of the region from
+    the first line with a match to the end of the last one, and what that
+    region becomes. count is 0 when nothing matched.
+    """
+    if not regex:
+        # Literal replacement text, no group references or escapes
+        literal = replacement
+        replacement = lambda match: literal
+    new_text, count = pattern.subn(replacement, text)
+    if not count:
+        return None, None, text, 0
+    first = last = None
+    for match in pattern.finditer(text):
+        if first is None:
+            first = match.start()
+        last = match.end()
+    starts = _line_starts(text)
+    first = starts[_position(starts, first)[0] - 1]
+    newline = text.find('\n', last)
+    last = len(text) if newline == -1 else newline
+    tail = len(text) - last
+    region = new_text[first:len(new_text) - tail]
+    start, end = _position(starts, first), _position(starts, last)
+    return f'{start[0]}.{start[1]}', f'{end[0]}.{end[1]}', region, count
+
+
+def _glob_regex(pattern):
+    """Regex for a .gitignore glob, where * and ? stop at slashes"""
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('/**', i) and i + 3 == len(pattern):
+            out.append('/.*')
+            i += 3
+            continue
+        char = pattern[i]
+        if char == '*':
+            out.append('.*' if pattern.startswith('**', i) else '[^/]*')
+            i += 2 if pattern.startswith('**', i) else 1
+            continue
+        if char == '?':
+            out.append('[^/]')
+        elif char == '[' and pattern.find(']', i + 1) != -1:
+            close = pattern.find(']', i + 1)
+            body = pattern[i + 1:close]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            out.append(f'[{body}]')
+            i = close
+        elif char == '\\' and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(char))
+        i += 1
+    return ''.join(out)
+
+
+class GitIgnore:
+    """The .gitignore rules of a tree: globs, !negation, dir/ and /anchored"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        # directory -> [(regex, negate, dir_only)]
+        self._rules = {}
+
+    def _load(self, directory):
+        """Rules from directory/.gitignore, cached"""
+        rules = self._rules.get(directory)
+        if rules is not None:
+            return rules
+        rules = []
+        try:
+            with open(os.path.join(directory, '.gitignore'), 'r', encoding='utf-8', errors='replace') as file:
+                lines = file.read().splitlines()
+        except OSError:
+            lines = []
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            anchored = '/' in line
+            glob = _glob_regex(line.lstrip('/'))
+            regex = re.compile(('^' if anchored else '^(?:.*/)?') + glob + '$')
+            rules.append((regex, negate, dir_only))
+        self._rules[directory] = rules
+        return rules
+
+    def ignored(self, path, is_dir=False):
+        """True if path is ignored by the .gitignore files above it"""
+        path = os.path.abspath(path)
+        directory = os.path.dirname(path)
+        # Every .gitignore from the root down to path's directory; deeper ones win
+        chain = []
+        while True:
+            chain.append(directory)
+            if directory == self.root or len(directory) <= len(self.root):
+                break
+            directory = os.path.dirname(directory)
+        ignored = False
+        for directory in reversed(chain):
+            relative = os.path.relpath(path, directory).replace(os.sep, '/')
+            for regex, negate, dir_only in self._load(directory):
+                if dir_only and not is_dir:
+                    continue
+                if regex.match(relative):
+                    ignored = not negate
+        return ignored
+
+
+def iter_search_files(root):
+    """Files under root that are not ignored, pruning ignored directories"""
+    ignore = GitIgnore(root)
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d != '.git'
+                         and not ignore.ignored(os.path.join(directory, d), is_dir=True))
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            if not ignore.ignored(path):
+                yield path
+
+
+def search_files(paths, pattern, limit):
+    """Hits (path, line, col, line_text) in paths, at most limit of them
+
+    Runs in worker processes. Binary and oversized files are skipped.
+    """
+    hits = []
+    for path in paths:
+        try:
+            if os.path.getsize(path) > MAX_SEARCH_BYTES:
+                continue
+            with open(path, 'rb') as file:
+                raw = file.read()
+        except OSError:
+            continue
+        if b'\0' in raw[:8192]:
+            continue
+        text = raw.decode('utf-8', errors='replace')
+        starts = None
+        for match in pattern.finditer(text):
+            if match.start() == match.end():
+                continue
+            if starts is None:
+                starts = _line_starts(text)
+            line, col = _position(starts, match.start())
+            end = text.find('\n', match.start())
+            line_text = text[starts[line - 1]:len(text) if end == -1 else end]
+            hits.append((path, line, col, line_text.strip()[:200]))
+            if len(hits) >= limit:
+                return hits
+    return hits
+
+
+class ProjectSearch:
+    """Search every file under root on a worker pool, streaming back hits
+
+    on_hits(hits) is called from a background thread for each finished batch,
+    on_done(count, files, seconds, error) once at the end.
+    """
+
+    def __init__(self, root, pattern, on_hits, on_done, workers=None, limit=MAX_PROJECT_HITS):
+        self.root = root
+        self.pattern = pattern
+        self.on_hits = on_hits
+        self.on_done = on_done
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.limit = limit
+        self._cancelled = threading.Event()
+
+    def start(self):
+        """Search on a daemon thread"""
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def cancel(self):
+        """Stop after the batches already running"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _run(self):
+        started = time.monotonic()
+        count = 0
+        error = None
+        files = list(iter_search_files(self.root))
+        batches = [files[i:i + BATCH_SIZE] for i in range(0, len(files), BATCH_SIZE)]
+        try:
+            if len(batches) > 1:
+                # spawn rather than fork, the parent runs Tk and other threads
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+                    futures = [pool.submit(search_files, batch, self.pattern, self.limit)
+                               for batch in batches]
+                    for future in as_completed(futures):
+                        count = self._deliver(future.result(), count)
+                        if self.cancelled or count >= self.limit:
+                            for pending in futures:
+                                pending.cancel()
+                            break
+            elif batches:
+                count = self._deliver(search_files(batches[0], self.pattern, self.limit), count)
+        except (OSError, BrokenProcessPool) as e:
+            error = e
+        self.on_done(count, len(files), time.monotonic() - started, error)
+
+    def _deliver(self, hits, count):
+        """Hand a batch to on_hits, trimmed to the overall limit"""
+        hits = hits[:self.limit - count]
+        if hits and not self.cancelled:
+            self.on_hits(hits)
+        return count + len(hits)
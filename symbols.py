@@ -0,0 +1,361 @@
+"""Project-wide symbol index
+
+Every Python file under a root directory is parsed with ast into its
+definitions, imports and referenced names. Results are kept in an SQLite file
+under the cache directory, keyed on path with the file's mtime, size and
+content hash, so a refresh only re-parses files that actually changed. Larger
+batches of changed files are parsed on a process pool.
+"""
+import ast
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
+
+from response_cache import default_cache_dir
+
+# Directories that never hold project sources
+SKIP_DIRS = {'.git', '.hg', '.svn', '__pycache__', '.venv', 'venv', 'env', 'node_modules',
+             '.tox', '.nox', '.mypy_cache', '.pytest_cache', 'build', 'dist', 'site-packages'}
+
+# Fewer changed files than this are parsed in-process, a pool is not worth starting
+POOL_THRESHOLD = 8
+
+
+class Location(NamedTuple):
+    """A definition somewhere in the project, lines are 1-based and inclusive"""
+    path: str
+    line: int
+    end: int
+    kind: str
+    name: str
+    qualname: str
+
+
+def iter_python_files(root):
+    """Paths of the .py files below root, skipping caches, VCS and virtualenvs"""
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith('.'))
+        for name in sorted(files):
+            if name.endswith('.py'):
+                yield os.path.join(directory, name)
+
+
+def index_source(source):
+    """Definitions, imports and references of one module as plain data"""
+    definitions = []
+    imports = []
+    references = {}
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError) as e:
+        return {'definitions': definitions, 'imports': imports, 'references': references,
+                'error': str(e)}
+
+    def visit(node, scope):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                kind = 'class' if isinstance(child, ast.ClassDef) else 'function'
+                start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                qualname = '.'.join(scope + [child.name])
+                definitions.append([child.name, kind, start, child.end_lineno, qualname])
+                visit(child, scope + [child.name])
+                continue
+            if isinstance(child, (ast.Import, ast.ImportFrom)):
+                module = getattr(child, 'module', None) or ''
+                for alias in child.names:
+                    if isinstance(child, ast.ImportFrom):
+                        name = alias.asname or alias.name
+                        target = f"{'.' * child.level}{module}.{alias.name}"
+                    else:
+                        name = alias.asname or alias.name.split('.')[0]
+                        target = alias.name
+                    imports.append([name, target, child.lineno])
+            elif isinstance(child, (ast.Assign, ast.AnnAssign)) and len(scope) <= 1:
+                # Module and class level variables, locals are not worth indexing
+                targets = child.targets if isinstance(child, ast.Assign) else [child.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        qualname = '.'.join(scope + [target.id])
+                        definitions.append([target.id, 'variable', child.lineno, child.end_lineno, qualname])
+            elif isinstance(child, ast.Name) and isinstance(child.ctx, ast.Load):
+                references.setdefault(child.id, []).append(child.lineno)
+            elif isinstance(child, ast.Attribute):
+                references.setdefault(child.attr, []).append(child.lineno)
+            visit(child, scope)
+
+    visit(tree, [])
+    return {'definitions': definitions, 'imports': imports, 'references': references}
+
+
+def index_file(path, known_digest=None):
+    """Hash and index one file, returning (digest, data)
+
+    data is None when the content hash matches known_digest, i.e. only the
+    mtime moved. Runs in worker processes, so it only deals in plain data.
+    """
+    try:
+        with open(path, 'rb') as file:
+            raw = file.read()
+    except OSError as e:
+        return None, {'definitions': [], 'imports': [], 'references': {}, 'error': str(e)}
+    digest = hashlib.sha1(raw).hexdigest()
+    if digest == known_digest:
+        return digest, None
+    return digest, index_source(raw.decode('utf-8', errors='replace'))
+
+
+class ProjectIndex:
+    """Symbols of every Python file under root, safe to query from any thread"""
+
+    def __init__(self, root, path=None, workers=None):
+        self.root = os.path.abspath(root)
+        if path is None:
+            key = hashlib.sha1(self.root.encode('utf-8')).hexdigest()
+            path = os.path.join(default_cache_dir(), 'index', f'{key}.sqlite3')
+        self.path = path
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        # path -> (mtime, size, digest, data)
+        self._files = {}
+        self._by_name = None
+        self._sorted_names = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._db = None
+        self._loaded = False
+
+    def _connect(self):
+        """Open the database on first use, None if it is unavailable"""
+        if self._db is None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                db = sqlite3.connect(self.path, check_same_thread=False)
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS files ("
+                    "path TEXT PRIMARY KEY, mtime REAL, size INTEGER, digest TEXT, data TEXT)"
+                )
+                db.commit()
+                self._db = db
+            except (OSError, sqlite3.Error):
+                # Index in memory only
+                self._db = False
+        return self._db or None
+
+    def _load(self):
+        """Read the stored index, once"""
+        if self._loaded:
+            return
+        self._loaded = True
+        db = self._connect()
+        if not db:
+            return
+        try:
+            rows = db.execute("SELECT path, mtime, size, digest, data FROM files").fetchall()
+        except sqlite3.Error:
+            return
+        with self._lock:
+            for path, mtime, size, digest, data in rows:
+                self._files[path] = (mtime, size, digest, json.loads(data))
+
+    def refresh(self):
+        """Bring the index up to date with the files on disk
+
+        Blocking, meant for a background thread. Returns the number of files
+        that were (re)indexed or dropped.
+        """
+        with self._refresh_lock:
+            self._load()
+            seen = set()
+            stale = []
+            for path in iter_python_files(self.root):
+                seen.add(path)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                known = self._files.get(path)
+                if known is None or known[0] != st.st_mtime or known[1] != st.st_size:
+                    stale.append((path, st.st_mtime, st.st_size, known[2] if known else None))
+            removed = [path for path in self._files if path not in seen]
+
+            paths = [entry[0] for entry in stale]
+            digests = [entry[3] for entry in stale]
+            results = None
+            if len(stale) >= POOL_THRESHOLD:
+                # spawn rather than fork, the parent runs Tk and other threads
+                context = multiprocessing.get_context('spawn')
+                try:
+                    with ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+                        results = list(pool.map(index_file, paths, digests, chunksize=16))
+                except (OSError, BrokenProcessPool):
+                    results = None
+            if results is None:
+                results = list(map(index_file, paths, digests))
+
+            rows = []
+            with self._lock:
+                for (path, mtime, size, old_digest), (digest, data) in zip(stale, results):
+                    if data is None:
+                        data = self._files[path][3]
+                    self._files[path] = (mtime, size, digest, data)
+                    rows.append((path, mtime, size, digest, json.dumps(data)))
+                for path in removed:
+                    del self._files[path]
+            self._store(rows, removed)
+            if stale or removed or self._by_name is None:
+                self._rebuild_names()
+            return len(stale) + len(removed)
+
+    def refresh_async(self, on_done=None):
+        """Refresh on a daemon thread, then call on_done(changed, seconds)"""
+        if self._refresh_lock.locked():
+            return False
+
+        def run():
+            started = time.monotonic()
+            changed = self.refresh()
+            if on_done:
+                on_done(changed, time.monotonic() - started)
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    def _store(self, rows, removed):
+        """Write changed entries through to the database"""
+        db = self._connect()
+        if not db or not (rows or removed):
+            return
+        try:
+            db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows)
+            db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+            db.commit()
+        except sqlite3.Error:
+            pass
+
+    def _rebuild_names(self):
+        """Build the name maps on the refreshing thread, then swap them in
+
+        Queries, completion included, run on the Tk thread and only ever
+        look names up; the lock is held just for the snapshot and the swap.
+        """
+        with self._lock:
+            files = list(self._files.items())
+        by_name = {}
+        for path, (mtime, size, digest, data) in files:
+            for name, kind, line, end, qualname in data['definitions']:
+                by_name.setdefault(name, []).append(Location(path, line, end, kind, name, qualname))
+        sorted_names = sorted((name.lower(), name) for name in by_name)
+        with self._lock:
+            self._by_name = by_name
+            self._sorted_names = sorted_names
+
+    def _names(self):
+        """name -> [Location] as of the last refresh; call with the lock held"""
+        return self._by_name or {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._files)
+
+    def definitions(self, name):
+        """Every definition of name, top-level ones first"""
+        with self._lock:
+            found = list(self._names().get(name, ()))
+        return sorted(found, key=lambda loc: (loc.qualname.count('.'), loc.path, loc.line))
+
+    def references(self, name):
+        """(path, line) of every use of name"""
+        with self._lock:
+            files = list(self._files.items())
+        found = []
+        for path, (mtime, size, digest, data) in files:
+            for line in data['references'].get(name, ()):
+                found.append((path, line))
+        return sorted(found)
+
+    def search(self, query, limit=50):
+        """Definitions whose name starts with query, then those containing it"""
+        query = query.lower()
+        with self._lock:
+            by_name = self._names()
+            names = self._sorted_names or []
+            start = bisect_left(names, (query, ''))
+            prefixed = []
+            for lowered, name in names[start:]:
+                if not lowered.startswith(query) or len(prefixed) >= limit:
+                    break
+                prefixed.append(name)
+            contained = []
+            if len(prefixed) < limit and query:
+                for lowered, name in names:
+                    if query in lowered and not lowered.startswith(query):
+                        contained.append(name)
+                        if len(prefixed) + len(contained) >= limit:
+                            break
+            found = []
+            for name in prefixed + contained:
+                found.extend(by_name[name])
+        return found[:limit]
+
+    def names_starting(self, prefix, limit=50):
+        """Names of definitions that start with prefix, for completion"""
+        lowered = prefix.lower()
+        found = []
+        with self._lock:
+            names = self._sorted_names or []
+            for position in range(bisect_left(names, (lowered, '')), len(names)):
+                key, name = names[position]
+                if not key.startswith(lowered) or len(found) >= limit:
+                    break
+                if name.startswith(prefix):
+                    found.append(name)
+        return found
+
+    def module_name(self, path):
+        """Dotted module name of a file under root"""
+        relative = os.path.relpath(path, self.root)[:-len('.py')]
+        parts = relative.split(os.sep)
+        if parts[-1] == '__init__':
+            parts.pop()
+        return '.'.join(parts)
+
+    def resolve(self, name, source='', exclude=None):
+        """Best single definition of name as used in source, or None
+
+        Definitions in exclude (normally the file being edited) are skipped.
+        When several remain, top-level ones win, then those in a module that
+        source mentions, e.g. in an import.
+        """
+        candidates = [loc for loc in self.definitions(name)
+                      if exclude is None or os.path.abspath(loc.path) != os.path.abspath(exclude)]
+        if len(candidates) > 1:
+            top = [loc for loc in candidates if '.' not in loc.qualname]
+            candidates = top or candidates
+        if len(candidates) > 1 and source:
+            mentioned = [loc for loc in candidates
+                         if re.search(rf'\b{re.escape(self.module_name(loc.path))}\b', source)]
+            candidates = mentioned or candidates
+        return candidates[0] if candidates else None
+
+    def snippet(self, location):
+        """Source of a definition, read from disk"""
+        try:
+            with open(location.path, 'r', encoding='utf-8', errors='replace') as file:
+                lines = file.read().split('\n')
+        except OSError:
+            return ''
+        return '\n'.join(lines[location.line - 1:location.end])
+
+    def close(self):
+        """Close the database"""
+        if self._db:
+            self._db.close()
+        self._db = None
@@ -0,0 +1,79 @@
+"""Edit notifications for Tk Text widgets
+
+Tk has no event that says *which* lines an edit touched, so the widget's Tcl
+command is wrapped (the same trick IDLE's WidgetRedirector uses) and every
+insert/delete/replace is reported as ``(first, removed, added)``: the 0-based
+line where the edit starts, how many line breaks it removed and how many it
+added. Undo/redo are replayed by Tk through the widget command as well, so
+they are reported like ordinary edits.
+"""
+
+
+class TextWatcher:
+    """Report line-level edits made to a Text widget"""
+
+    def __init__(self, text):
+        self.text = text
+        self.listeners = []
+        self._widget = str(text)
+        self._orig = self._widget + '_orig'
+        self._pending = None
+
+        before = text.register(self._before_edit)
+        after = text.register(self._after_edit)
+        text.tk.call('rename', self._widget, self._orig)
+        text.tk.call('proc', self._widget, 'args', f"""
+            if {{[lindex $args 0] in {{insert delete replace}}}} {{
+                {before} {{*}}$args
+                set result [uplevel 1 [list {{{self._orig}}} {{*}}$args]]
+                {after}
+                return $result
+            }}
+            uplevel 1 [list {{{self._orig}}} {{*}}$args]
+        """)
+
+    def close(self):
+        """Put the original widget command back, call before destroying the widget"""
+        self.text.tk.call('rename', self._widget, '')
+        self.text.tk.call('rename', self._orig, self._widget)
+
+    def add_listener(self, callback):
+        """Call callback(first, removed, added) after every edit"""
+        self.listeners.append(callback)
+
+    def _line(self, index):
+        """Line number (1-based) of index, clamped to the last real line"""
+        line = int(str(self.text.tk.call(self._orig, 'index', index)).split('.')[0])
+        last = int(str(self.text.tk.call(self._orig, 'index', 'end-1c')).split('.')[0])
+        return min(line, last)
+
+    def _before_edit(self, operation, *args):
+        """Work out which lines the edit will touch while the old text is still there"""
+        if operation == 'insert':
+            first = self._line(args[0])
+            removed = 0
+            added = sum(chars.count('\n') for chars in args[1::2])
+        elif operation == 'delete':
+            first = self._line(args[0])
+            if len(args) > 2:
+                # Several ranges at once, report them as one span
+                last = max(self._line(index) for index in args[1:])
+            elif len(args) == 2:
+                last = self._line(args[1])
+            else:
+                last = self._line(f'{args[0]}+1c')
+            removed = max(0, last - first)
+            added = 0
+        else:
+            first = self._line(args[0])
+            removed = max(0, self._line(args[1]) - first)
+            added = sum(chars.count('\n') for chars in args[2::2])
+        self._pending = (first - 1, removed, added)
+
+    def _after_edit(self):
+        """Notify listeners once the edit has been applied"""
+        edit, self._pending = self._pending, None
+        if edit is None:
+            return
+        for callback in self.listeners:
+            callback(*edit)
@@ -0,0 +1,70 @@
+"""Hand UI work from worker threads to the Tk main loop
+
+Tk widgets may only be touched from the thread running mainloop(). Workers
+post callables to a queue instead; a pump scheduled with after() drains it on
+the main thread, within a time budget per tick so a flood of output never
+starves input handling. Consecutive text appends for the same target are
+merged into a single call.
+"""
+import queue
+import time
+from collections import deque
+
+_CALL = 0
+_TEXT = 1
+
+
+class UIDispatcher:
+    """Queue of UI mutations drained by a root.after() pump"""
+
+    def __init__(self, root, interval_ms=16, budget_ms=8):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.budget = budget_ms / 1000
+        self._queue = queue.SimpleQueue()
+        self._backlog = deque()
+        self._after_id = None
+
+    def start(self):
+        """Begin pumping the queue"""
+        if self._after_id is None:
+            self._after_id = self.root.after(self.interval_ms, self._pump)
+
+    def stop(self):
+        """Stop pumping, anything still queued stays there"""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def post(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on the main thread, safe to call from any thread"""
+        self._queue.put((_CALL, func, args, kwargs))
+
+    def post_text(self, write, text):
+        """Call write(text) on the main thread, merged with adjacent appends to write"""
+        if text:
+            self._queue.put((_TEXT, write, text, None))
+
+    def _pump(self):
+        """Drain as much of the queue as the budget allows, then reschedule"""
+        backlog = self._backlog
+        while True:
+            try:
+                backlog.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        deadline = time.perf_counter() + self.budget
+        while backlog and time.perf_counter() < deadline:
+            kind, func, args, kwargs = backlog.popleft()
+            if kind == _TEXT:
+                parts = [args]
+                while backlog and backlog[0][0] == _TEXT and backlog[0][1] == func:
+                    parts.append(backlog.popleft()[2])
+                args, kwargs = (''.join(parts),), {}
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self.root.report_callback_exception(type(e), e, e.__traceback__)
+
+        self._after_id = self.root.after(0 if backlog else self.interval_ms, self._pump)